@@ -0,0 +1,183 @@
+import hashlib
+import tarfile
+import zipfile
+from collections import Counter
+from math import log2
+from os.path import getsize, join
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer
+
+from firmware.offload import create_executor, deferred_from_future
+
+CHUNK_SIZE = 1048576
+
+# (offset, signature, type) of the formats found in firmware downloads, checked in order
+MAGIC_SIGNATURES = (
+    (0, b'PK\x03\x04', 'zip'),
+    (0, b'\x1f\x8b', 'gzip'),
+    (0, b'BZh', 'bzip2'),
+    (0, b'\xfd7zXZ\x00', 'xz'),
+    (0, b'7z\xbc\xaf\x27\x1c', '7z'),
+    (257, b'ustar', 'tar'),
+    (0, b'\x27\x05\x19\x56', 'uimage'),
+    (0, b'HDR0', 'trx'),
+    (0, b'hsqs', 'squashfs'),
+    (0, b'sqsh', 'squashfs'),
+    (0, b'\x7fELF', 'elf'),
+    (0, b'%PDF', 'pdf'),
+    (0, b'\x5d\x00\x00', 'lzma'),
+)
+ARCHIVE_TYPES = ('zip', 'gzip', 'bzip2', 'xz', 'tar')
+
+
+def magic_type(head):
+    for offset, signature, file_type in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return file_type
+    return 'data'
+
+
+def shannon_entropy(histogram):
+    # bits per byte, 8.0 for compressed or encrypted data
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    return 0.0 - sum(count / total * log2(count / total) for count in histogram.values())
+
+
+def archive_members(path, file_type, max_members):
+    # the zip central directory or the tar headers read in stream mode, nothing is extracted
+    members, count = list(), 0
+    try:
+        if file_type == 'zip':
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    count += 1
+                    if count <= max_members:
+                        members.append(dict(name=info.filename, size=info.file_size))
+        else:
+            with tarfile.open(path, mode='r|*') as archive:
+                for info in archive:
+                    count += 1
+                    if count <= max_members:
+                        members.append(dict(name=info.name, size=info.size))
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError):
+        # compressed files that are no archives (e.g. a gzipped kernel) or truncated archives
+        return None, count
+    return members, count
+
+
+def analyze_file(path, digests=('sha256', 'sha1', 'md5'), entropy_sample=16777216, max_members=1000):
+    # one sequential pass over the file for the digests and the entropy. Entropy is estimated from at most
+    # entropy_sample bytes spread evenly over the file, without digests to compute only these chunks are read
+    size = getsize(path)
+    stride = max(1, -(-size // entropy_sample))
+    hashes = {algorithm: hashlib.new(algorithm) for algorithm in digests}
+    histogram = Counter()
+    with open(path, 'rb') as firmware:
+        head = firmware.read(512)
+        firmware.seek(0)
+        if hashes:
+            for index, chunk in enumerate(iter(lambda: firmware.read(CHUNK_SIZE), b'')):
+                for digest in hashes.values():
+                    digest.update(chunk)
+                if index % stride == 0:
+                    histogram.update(chunk)
+        else:
+            for offset in range(0, size, stride * CHUNK_SIZE):
+                firmware.seek(offset)
+                histogram.update(firmware.read(CHUNK_SIZE))
+
+    result = dict(size=size, magic=magic_type(head), entropy=round(shannon_entropy(histogram), 4))
+    result.update((algorithm, digest.hexdigest()) for algorithm, digest in hashes.items())
+    if result['magic'] in ARCHIVE_TYPES:
+        result['members'], result['member_count'] = archive_members(path, result['magic'], max_members)
+    return result
+
+
+class FirmwareAnalysisPipeline(object):
+    # runs after the files pipeline and attaches magic type, entropy, digests and archive members of every downloaded
+    # file to the item as file_analysis. The files are read in a pool of ANALYSIS_WORKERS processes right after the
+    # download, while they are still in the page cache. Files with the same content are analyzed once
+
+    def __init__(self, store, workers=2, entropy_sample=16777216, max_members=1000, stats=None):
+        self.store = store
+        self.workers = workers
+        self.entropy_sample = entropy_sample
+        self.max_members = max_members
+        self.stats = stats
+        self.executor = None
+        self.analyzed = dict()
+        self.pending = dict()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        store = crawler.settings.get('FILES_STORE') or ''
+        if store.startswith('file://'):
+            store = store[len('file://'):]
+        # the files are read where the files pipeline stored them, which has to be the local file system
+        if not crawler.settings.getbool('ANALYSIS_ENABLED') or not store or '://' in store:
+            raise NotConfigured
+        return cls(
+            store,
+            workers=crawler.settings.getint('ANALYSIS_WORKERS', 2),
+            entropy_sample=crawler.settings.getint('ANALYSIS_ENTROPY_SAMPLE', 16777216),
+            max_members=crawler.settings.getint('ANALYSIS_MAX_MEMBERS', 1000),
+            stats=crawler.stats
+        )
+
+    def open_spider(self, spider):
+        self.executor = create_executor(self.workers)
+
+    def close_spider(self, spider):
+        self.executor.shutdown(wait=True)
+
+    def process_item(self, item, spider):
+        # every files pipeline of the project runs on every item, the first one downloads a file and the later ones
+        # report it up to date, so both are analyzed. Both carry the sha256 of the stored file as checksum
+        files = [result for result in ItemAdapter(item).get('files') or []
+                 if result.get('status') in ('downloaded', 'uptodate') and result.get('checksum')]
+        if not files:
+            return item
+        return defer.gatherResults([self.analyze(result, spider) for result in files]).addCallback(self.attach, item)
+
+    def analyze(self, result, spider):
+        checksum = result['checksum']
+        waiting = defer.Deferred()
+        if checksum in self.analyzed:
+            waiting.callback(self.analyzed[checksum])
+        elif checksum in self.pending:
+            self.pending[checksum].append(waiting)
+        else:
+            self.pending[checksum] = [waiting]
+            # digests of streamed downloads are known already, the others are computed in the same pass as the entropy
+            digests = tuple(algorithm for algorithm in ('sha1', 'md5') if algorithm not in result)
+            future = self.executor.submit(analyze_file, join(self.store, *result['path'].split('/')), digests, self.entropy_sample, self.max_members)
+            deferred_from_future(future).addCallbacks(self.analyzed_file, self.failed_file, callbackArgs=[result, spider], errbackArgs=[spider]).addCallback(self.finish, checksum)
+        return waiting.addCallback(lambda analysis: dict(analysis, path=result['path'], url=result['url']))
+
+    def analyzed_file(self, analysis, result, spider):
+        analysis.setdefault('sha256', result['checksum'])
+        analysis.update((algorithm, result[algorithm]) for algorithm in ('sha1', 'md5') if algorithm in result)
+        if self.stats is not None:
+            self.stats.inc_value('analysis/file_count', spider=spider)
+            self.stats.inc_value('analysis/bytes', analysis['size'], spider=spider)
+        return analysis
+
+    def failed_file(self, failure, spider):
+        # a file that can not be analyzed does not cost the item
+        if self.stats is not None:
+            self.stats.inc_value('analysis/error_count', spider=spider)
+        return dict(error=failure.getErrorMessage())
+
+    def finish(self, analysis, checksum):
+        self.analyzed[checksum] = analysis
+        for waiting in self.pending.pop(checksum):
+            waiting.callback(analysis)
+
+    @staticmethod
+    def attach(analyses, item):
+        ItemAdapter(item)['file_analysis'] = analyses
+        return item
@@ -0,0 +1,108 @@
+# Offline benchmark of the spider parse hot paths, e.g.
+#   python -m firmware.benchmarks --scale 2000 --json current.json --compare baseline.json
+import json
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from time import perf_counter
+
+from firmware.benchmarks.fixtures import GENERATORS, load_fixture
+from firmware.spiders.avm import AvmSpider
+from firmware.spiders.avm_gpl import AVMGPL
+from firmware.spiders.dlink_gpl import DLinkGPL
+from firmware.spiders.linksys import LinksysSpider
+from firmware.spiders.linksys_gpl import LinksysGPL
+from firmware.spiders.netgear_gpl import NetgearGPL
+from firmware.spiders.tplink import TPLink
+from firmware.spiders.tplink_gpl import TPLinkGPL
+
+
+def unfiltered(spider):
+    # whitelists would drop most of the synthetic devices
+    spider.whitelist_enabled = False
+    return spider
+
+
+CASES = {
+    'avm.parse_firmware': lambda response: AvmSpider().parse_firmware(response=response, device_name='fritzbox-7590'),
+    'avm_gpl.parse': lambda response: AVMGPL().parse(response),
+    'linksys.parse_versions': lambda response: LinksysSpider().parse_versions(response=response, device_name='EA6300'),
+    'dlink_gpl.parse': lambda response: unfiltered(DLinkGPL()).parse(response),
+    'tplink_gpl.parse': lambda response: unfiltered(TPLinkGPL()).parse(response),
+    'netgear_gpl.parse': lambda response: unfiltered(NetgearGPL()).parse(response),
+    'linksys_gpl.parse': lambda response: unfiltered(LinksysGPL()).parse(response),
+    'tplink.parse': lambda response: TPLink().parse(response),
+}
+
+
+def run_case(case, response, repeat):
+    outputs = 0
+    started = perf_counter()
+    for _ in range(repeat):
+        outputs += sum(1 for _ in CASES[case](response))
+    elapsed = perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = list(CASES[case](response))
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename') if stat.size_diff > 0)
+
+    return {
+        'outputs_per_page': len(results),
+        'outputs_per_second': outputs / elapsed if elapsed else float('inf'),
+        'seconds_per_page': elapsed / repeat,
+        'allocated_kib': allocated / 1024,
+        'peak_kib': peak / 1024,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = list()
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        if result['outputs_per_second'] < baseline[case]['outputs_per_second'] * (1 - tolerance):
+            regressions.append('{}: {:.0f} outputs/s, baseline {:.0f}'.format(case, result['outputs_per_second'], baseline[case]['outputs_per_second']))
+        if result['peak_kib'] > baseline[case]['peak_kib'] * (1 + tolerance):
+            regressions.append('{}: {:.0f} KiB peak, baseline {:.0f}'.format(case, result['peak_kib'], baseline[case]['peak_kib']))
+    return regressions
+
+
+def main(arguments):
+    parser = ArgumentParser(description='Benchmark spider callbacks on recorded or generated fixture pages')
+    parser.add_argument('cases', nargs='*', default=sorted(GENERATORS), help='cases to run, default: all')
+    parser.add_argument('--scale', type=int, default=1000, help='number of entries on generated pages')
+    parser.add_argument('--repeat', type=int, default=5, help='parse passes per case')
+    parser.add_argument('--fixtures', help='directory with recorded <case>.html pages')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression against the baseline')
+    options = parser.parse_args(arguments)
+
+    results = dict()
+    print('{:<24} {:>10} {:>14} {:>12} {:>14} {:>10}'.format('case', 'outputs', 'outputs/s', 'ms/page', 'alloc KiB', 'peak KiB'))
+    for case in options.cases:
+        response = load_fixture(case, options.scale, options.fixtures)
+        result = results[case] = run_case(case, response, options.repeat)
+        print('{:<24} {:>10} {:>14.0f} {:>12.2f} {:>14.0f} {:>10.0f}'.format(
+            case, result['outputs_per_page'], result['outputs_per_second'], result['seconds_per_page'] * 1000, result['allocated_kib'], result['peak_kib']
+        ))
+
+    if options.json:
+        with open(options.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if options.compare:
+        with open(options.compare) as file:
+            regressions = find_regressions(results, json.load(file), options.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
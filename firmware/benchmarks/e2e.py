@@ -0,0 +1,197 @@
+# End-to-end throughput of full crawls against the local stand-in vendor sites, e.g.
+#   python -m firmware.benchmarks.e2e avm dlink --scale 50 --blob-size 64M --latency 0.05
+import json
+import sys
+from argparse import ArgumentParser
+from os.path import exists
+from tempfile import TemporaryDirectory
+
+from scrapy.crawler import CrawlerRunner
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.python import to_bytes
+from twisted.internet import defer, reactor
+
+from firmware.benchmarks.mock_server import build_dlink_tree, listen_ftp, listen_http
+from firmware.handlers import StreamingAgent, StreamingHTTPDownloadHandler
+from firmware.spiders.avm import AvmSpider
+from firmware.spiders.avm_gpl import AVMGPL
+from firmware.spiders.dlink import DLinkSpider
+from firmware.spiders.linksys_gpl import LinksysGPL
+from firmware.spiders.netgear_gpl import NetgearGPL
+from firmware.spiders.tplink_gpl import TPLinkGPL
+from firmware.storage import BlobStore
+
+SPIDERS = {
+    'avm': AvmSpider,
+    'avm_gpl': AVMGPL,
+    'netgear_gpl': NetgearGPL,
+    'tplink_gpl': TPLinkGPL,
+    'linksys_gpl': LinksysGPL,
+    'dlink': DLinkSpider,
+}
+
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class LocalMirrorMiddleware:
+    # sends every http(s) request to the local server as proxy, the vendor host names stay in the urls. Requests are
+    # not replaced, the files pipeline waits for the streamed file in the meta of its own request
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.get('LOCAL_MIRROR_PROXY'):
+            raise NotConfigured
+        return cls(crawler.settings.get('LOCAL_MIRROR_PROXY'))
+
+    def process_request(self, request, spider):
+        if urlparse_cached(request).scheme in ('http', 'https'):
+            request.meta['proxy'] = self.proxy
+        return None
+
+
+class LocalMirrorAgent(StreamingAgent):
+    # the stand-in speaks plain http only, https urls are sent to it like http urls instead of through a CONNECT tunnel
+
+    def _get_agent(self, request, timeout):
+        proxy = request.meta.get('proxy')
+        if not proxy or urlparse_cached(request).scheme != 'https':
+            return super()._get_agent(request, timeout)
+        from twisted.internet import reactor
+        return self._ProxyAgent(
+            reactor=reactor,
+            proxyURI=to_bytes(proxy, encoding='ascii'),
+            connectTimeout=timeout,
+            bindAddress=request.meta.get('bindaddress') or self._bindAddress,
+            pool=self._pool,
+        )
+
+
+class LocalMirrorDownloadHandler(StreamingHTTPDownloadHandler):
+    agent_class = LocalMirrorAgent
+
+
+def parse_size(size):
+    if size[-1].upper() in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1].upper()])
+    return int(size)
+
+
+def crawl_settings(files_store, proxy):
+    settings = Settings()
+    settings.setmodule('firmware.settings', priority='project')
+    settings.update({
+        'FILES_STORE': files_store,
+        'ROBOTSTXT_OBEY': False,
+        'LOG_LEVEL': 'WARNING',
+        'LOCAL_MIRROR_PROXY': proxy,
+        'DOWNLOAD_HANDLERS': dict(
+            settings.getdict('DOWNLOAD_HANDLERS'),
+            http='firmware.benchmarks.e2e.LocalMirrorDownloadHandler',
+            https='firmware.benchmarks.e2e.LocalMirrorDownloadHandler',
+        ),
+        'DOWNLOADER_MIDDLEWARES': {
+            'firmware.middlewares.FirmwareDownloaderMiddleware': None,
+            'firmware.benchmarks.e2e.LocalMirrorMiddleware': 100,
+            'firmware.throttle.AdaptiveThrottleMiddleware': 500,
+            'firmware.budget.DownloadBudgetMiddleware': 900,
+        },
+        # one pipeline, the vendor subclasses would download every file once per pipeline
+        'ITEM_PIPELINES': {'firmware.dedup.DuplicatesPipeline': 0, 'firmware.pipelines.FirmwarePipeline': 1},
+        'DOWNLOAD_MAXSIZE': 0,
+        'DOWNLOAD_WARNSIZE': 0,
+    })
+    return settings
+
+
+def stored_files(files_store):
+    # every file the pipeline stored has a line in the manifest of the blob store
+    manifest = BlobStore(files_store).manifest_path
+    if not exists(manifest):
+        return 0
+    with open(manifest) as lines:
+        return sum(1 for _ in lines)
+
+
+def summarize(stats, files_store):
+    elapsed = (stats['finish_time'] - stats['start_time']).total_seconds()
+    items = stats.get('item_scraped_count', 0)
+    # streamed firmware files leave an empty response body, their bytes are counted by the pipeline
+    downloaded = stats.get('downloader/response_bytes', 0) + stats.get('file_bytes/streamed', 0)
+    return {
+        'items': items,
+        'files': stats.get('file_count', 0),
+        'stored_files': stored_files(files_store),
+        'bytes': downloaded,
+        'seconds': elapsed,
+        'items_per_second': items / elapsed if elapsed else 0.0,
+        'bytes_per_second': downloaded / elapsed if elapsed else 0.0,
+        'finish_reason': stats.get('finish_reason'),
+    }
+
+
+@defer.inlineCallbacks
+def run(arguments, results, directory):
+    blob_size = parse_size(arguments.blob_size)
+    http = listen_http(arguments.http_port, arguments.scale, blob_size, arguments.latency)
+    build_dlink_tree(directory + '/ftp', arguments.scale, blob_size)
+    ftp = listen_ftp(arguments.ftp_port, directory + '/ftp')
+    try:
+        for name in arguments.spiders:
+            files_store = directory + '/files/' + name
+            runner = CrawlerRunner(crawl_settings(files_store, 'http://127.0.0.1:{}'.format(http.getHost().port)))
+            crawler = runner.create_crawler(SPIDERS[name])
+            kwargs = {'whitelist_enabled': False}
+            if name == 'dlink':
+                kwargs.update(start_urls=['ftp://127.0.0.1:{}/'.format(ftp.getHost().port)], allowed_domains=['127.0.0.1'])
+            yield runner.crawl(crawler, **kwargs)
+            results[name] = summarize(crawler.stats.get_stats(), files_store)
+    finally:
+        yield http.stopListening()
+        yield ftp.stopListening()
+        reactor.stop()
+
+
+def main(arguments):
+    parser = ArgumentParser(description='Measure end-to-end crawl throughput against synthetic vendor sites')
+    parser.add_argument('spiders', nargs='*', help='any of {}, defaults to all'.format(', '.join(sorted(SPIDERS))))
+    parser.add_argument('--scale', type=int, default=20, help='devices per synthetic listing')
+    parser.add_argument('--blob-size', default='1M', help='size of every fake firmware file, e.g. 512K, 64M or 4G')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before the server answers an http request')
+    parser.add_argument('--http-port', type=int, default=0)
+    parser.add_argument('--ftp-port', type=int, default=0)
+    parser.add_argument('--json', help='write the results to this file')
+    arguments = parser.parse_args(arguments)
+    arguments.spiders = arguments.spiders or sorted(SPIDERS)
+    if not set(arguments.spiders) <= set(SPIDERS):
+        parser.error('unknown spiders: {}'.format(', '.join(set(arguments.spiders) - set(SPIDERS))))
+
+    results = dict()
+    with TemporaryDirectory() as directory:
+        reactor.callWhenRunning(run, arguments, results, directory)
+        reactor.run()
+
+    print('{:<14}{:>8}{:>12}{:>12}{:>14}'.format('spider', 'items', 'seconds', 'items/s', 'MiB/s'))
+    for name, result in results.items():
+        print('{:<14}{:>8}{:>12.2f}{:>12.1f}{:>14.2f}'.format(
+            name, result['items'], result['seconds'], result['items_per_second'], result['bytes_per_second'] / UNITS['M']
+        ))
+
+    if arguments.json:
+        with open(arguments.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    # a crawl that stored no firmware measured nothing but the index pages
+    empty = sorted(name for name in arguments.spiders if not results.get(name, {}).get('stored_files'))
+    if empty:
+        print('no files stored by {}'.format(', '.join(empty)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
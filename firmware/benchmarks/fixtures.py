@@ -0,0 +1,111 @@
+# Synthetic vendor pages shaped like the markup the spiders' XPATH expressions expect. A recorded page named
+# <case name>.html in the fixture directory takes precedence over the generated one.
+from os.path import isfile, join
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+
+def html_response(url, body):
+    return HtmlResponse(url=url, body=body.encode('utf-8'), encoding='utf-8', request=Request(url))
+
+
+def apache_index(title, rows):
+    lines = ['<a href="../">../</a>']
+    for href, date, size in rows:
+        lines.append('<a href="{0}">{0}</a>{1}{2} 12:13 {3:>12}'.format(href, ' ' * 30, date, size))
+    return '<html><head><title>Index of {}</title></head><body><h1>Index of {}</h1><hr><pre>{}\n</pre><hr></body></html>'.format(title, title, '\n'.join(lines))
+
+
+def avm_firmware_listing(scale):
+    rows = list()
+    for index in range(scale):
+        rows.append(('FRITZ.Box_7590.{}.07.{:02d}.image'.format(index, index % 100), '12-Aug-2019', 22241280 + index))
+        rows.append(('info_{}.txt'.format(index), '13-Sep-2017', 47418))
+    return apache_index('/fritzbox/fritzbox-7590/deutschland/fritz.os/', rows)
+
+
+def avm_gpl_listing(scale):
+    rows = list()
+    for index in range(scale):
+        rows.append(('fritzbox-{}/'.format(index), '01-Jan-2019', '-'))
+        rows.append(('FRITZBox_{}-07.{:02d}.tar.gz'.format(index, index % 100), '12-Aug-2019', 1073741824 + index))
+    return apache_index('/fritzbox/', rows)
+
+
+def linksys_versions(scale):
+    blocks = list()
+    for index in range(scale):
+        blocks.append(
+            '<h3>Firmware</h3>Ver.1.{0}.23 (build 20394)<br>Datum der letzten Version: 08/23/2019<br>'
+            '<a href="http://downloads.linksys.com/downloads/firmware/FW_EA6300_1.{0}.23.20394_prod.img">Herunterladen</a>'.format(index)
+        )
+    return '<html><body><div id="support-article-downloads"><div class="article-accordian-content collapse-me">{}</div></div></body></html>'.format('\n'.join(blocks))
+
+
+def dlink_gpl_list(scale):
+    rows = ''.join(
+        '<tr><td class="pord_3"><a title="DIR-{0}" href="#">DIR-{0}</a></td></tr>'.format(index) for index in range(scale)
+    )
+    return (
+        '<html><body><table>{}</table><table><tr><td><input name="sel_PageNo" value="1"/>(1 / 20)</td></tr></table></body></html>'
+    ).format(rows)
+
+
+def tplink_gpl_list(scale):
+    boxes = list()
+    for index in range(scale):
+        if index % 2:
+            anchor = '<a class="ga-click" href="https://static.tp-link.com/gpl/Archer_C{0}_GPL.tar.gz">Archer C{0}</a>'
+        else:
+            anchor = '<a class="ga-click" href="?model=Archer%20AX{0}">Archer AX{0}</a>'
+        boxes.append('<div class="item-box"><ul><li>{}</li></ul></div>'.format(anchor.format(index)))
+    return '<html><body><div data-class="wi-fi-routers">{}</div></body></html>'.format(''.join(boxes))
+
+
+def netgear_gpl_list(scale):
+    paragraphs = ''.join(
+        '<p><strong>R{0}</strong><br><a href="https://www.downloads.netgear.com/files/GPL/R{0}_V1.0.{1}_src.tar.zip">R{0} V1.0.{1}</a>'
+        '<br><a href="https://www.downloads.netgear.com/files/GPL/R{0}_V1.1.{1}_src.tar.zip">R{0} V1.1.{1}</a></p>'.format(index, index % 10)
+        for index in range(scale)
+    )
+    return '<html><body><div>{}</div></body></html>'.format(paragraphs)
+
+
+def linksys_gpl_list(scale):
+    rows = ''.join(
+        '<tr><td>EA{0}</td><td>1.0.{0}</td><td><a href="https://downloads.linksys.com/downloads/gpl/EA{0}_GPL.tgz">GPL</a></td></tr>'
+        '<tr><td>1.1.{0}</td><td><a href="https://downloads.linksys.com/downloads/gpl/EA{0}_1.1_GPL.tgz">GPL</a></td></tr>'.format(index)
+        for index in range(scale)
+    )
+    return '<html><body><table><thead><tr><td>Model</td><td>Version</td><td>Link</td></tr>{}</thead></table></body></html>'.format(rows)
+
+
+def tplink_products(scale):
+    products = ''.join(
+        '<a class="tp-product-link" href="/de/home-networking/wifi-router/archer-c{}/">Archer</a>'.format(index) for index in range(scale)
+    )
+    pages = ''.join(
+        '<li class="tp-product-pagination-item"><a class="tp-product-pagination-btn" href="?page={}">{}</a></li>'.format(page, page) for page in range(2, 12)
+    )
+    return '<html><body>{}<ul>{}</ul></body></html>'.format(products, pages)
+
+
+GENERATORS = {
+    'avm.parse_firmware': ('http://download.avm.de/fritzbox/fritzbox-7590/deutschland/fritz.os/', avm_firmware_listing),
+    'avm_gpl.parse': ('https://osp.avm.de/fritzbox/', avm_gpl_listing),
+    'linksys.parse_versions': ('https://www.linksys.com/us/support-article?articleNum=1234', linksys_versions),
+    'dlink_gpl.parse': ('https://tsd.dlink.com.tw/dlist?SourceType=download&OS=GPL', dlink_gpl_list),
+    'tplink_gpl.parse': ('https://www.tp-link.com/de/support/gpl-code/', tplink_gpl_list),
+    'netgear_gpl.parse': ('https://www.downloads.netgear.com/files/GDC/2649_GPLv1.html', netgear_gpl_list),
+    'linksys_gpl.parse': ('https://www.linksys.com/de/support-article?articleNum=114663', linksys_gpl_list),
+    'tplink.parse': ('https://www.tp-link.com/de/home-networking/wifi-router/', tplink_products),
+}
+
+
+def load_fixture(case, scale, fixture_directory=None):
+    url, generator = GENERATORS[case]
+    if fixture_directory is not None and isfile(join(fixture_directory, '{}.html'.format(case))):
+        with open(join(fixture_directory, '{}.html'.format(case)), encoding='utf-8') as fixture:
+            return html_response(url, fixture.read())
+    return html_response(url, generator(scale))
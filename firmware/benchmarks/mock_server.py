@@ -0,0 +1,150 @@
+# Local stand-in for the vendor sites. HTTP requests arrive proxy style (absolute URL in the request line), so the
+# spiders keep their vendor host names; the D-Link tree is served by an anonymous FTP server from a directory of
+# sparse files.
+import os
+from os.path import join
+from urllib.parse import parse_qs, urlparse
+
+from twisted.cred.checkers import AllowAnonymousAccess
+from twisted.cred.portal import Portal
+from twisted.internet import interfaces, reactor
+from twisted.internet.task import deferLater
+from twisted.protocols.ftp import FTPFactory, FTPRealm
+from twisted.web import resource, server
+from zope.interface import implementer
+
+from firmware.benchmarks.fixtures import (
+    apache_index, avm_gpl_listing, linksys_gpl_list, netgear_gpl_list, tplink_gpl_list
+)
+
+BLOB_SUFFIXES = ('.image', '.tar.gz', '.tgz', '.zip', '.bin', '.img')
+
+CHUNK_SIZE = 64 * 1024
+
+
+@implementer(interfaces.IPullProducer)
+class BlobProducer:
+    # streams size bytes of filler data without holding them in memory
+
+    def __init__(self, request, size):
+        self.request = request
+        self.remaining = size
+        self.chunk = b'\0' * CHUNK_SIZE
+
+    def resumeProducing(self):
+        if self.remaining <= 0:
+            self.request.unregisterProducer()
+            self.request.finish()
+            return
+        chunk = self.chunk[:min(CHUNK_SIZE, self.remaining)]
+        self.remaining -= len(chunk)
+        self.request.write(chunk)
+
+    def stopProducing(self):
+        self.remaining = 0
+
+
+class VendorSite(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, scale, blob_size, latency):
+        super().__init__()
+        self.scale = scale
+        self.blob_size = blob_size
+        self.latency = latency
+        self.routes = {
+            'download.avm.de': self.avm,
+            'osp.avm.de': self.avm_gpl,
+            'www.downloads.netgear.com': self.netgear_gpl,
+            'www.tp-link.com': self.tplink_gpl,
+            'www.linksys.com': self.linksys_gpl,
+        }
+
+    def render(self, request):
+        url = urlparse(request.uri.decode('utf-8'))
+        host = url.hostname or request.getHeader('host').split(':')[0]
+        if self.latency:
+            deferLater(reactor, self.latency, self.respond, request, host, url)
+        else:
+            self.respond(request, host, url)
+        return server.NOT_DONE_YET
+
+    def respond(self, request, host, url):
+        if url.path.endswith(BLOB_SUFFIXES):
+            request.setHeader(b'content-type', b'application/octet-stream')
+            request.setHeader(b'content-length', str(self.blob_size).encode())
+            request.registerProducer(BlobProducer(request, self.blob_size), False)
+            return
+
+        page = self.routes[host](url) if host in self.routes else None
+        if page is None:
+            request.setResponseCode(404)
+            page = '<html><body>Not Found</body></html>'
+        request.setHeader(b'content-type', b'text/html; charset=utf-8')
+        request.write(page.encode('utf-8'))
+        request.finish()
+
+    def avm(self, url):
+        # /<family>/ -> /<family>/<product>/ -> deutschland/ -> fritz.os/ -> images
+        segments = [segment for segment in url.path.split('/') if segment]
+        if len(segments) == 1:
+            rows = [('{}-{}/'.format(segments[0], index), '12-Aug-2019', '-') for index in range(self.scale)]
+            return apache_index(url.path, [('beta/', '01-Jan-2019', '-')] + rows)
+        if len(segments) == 2:
+            return apache_index(url.path, [('deutschland/', '12-Aug-2019', '-')])
+        if len(segments) == 3:
+            return apache_index(url.path, [('fritz.os/', '12-Aug-2019', '-'), ('recover/', '13-Sep-2017', '-')])
+        if len(segments) == 4 and segments[3] == 'fritz.os':
+            return apache_index(url.path, [
+                ('FRITZ.Box_{}-07.{:02d}.image'.format(segments[1].split('-')[-1], index), '12-Aug-2019', self.blob_size) for index in range(2)
+            ] + [('info_de.txt', '13-Sep-2017', 47418)])
+        return None
+
+    def avm_gpl(self, url):
+        segments = [segment for segment in url.path.split('/') if segment]
+        if len(segments) == 1:
+            return avm_gpl_listing(self.scale)
+        if len(segments) == 2:
+            return apache_index(url.path, [('{}-07.{:02d}.tar.gz'.format(segments[1], index), '12-Aug-2019', self.blob_size) for index in range(2)])
+        return None
+
+    def netgear_gpl(self, url):
+        return netgear_gpl_list(self.scale)
+
+    def tplink_gpl(self, url):
+        if url.path.startswith('/phppage/gpl-res-list.html'):
+            model = parse_qs(url.query).get('model', ['Archer'])[0]
+            rows = ''.join(
+                '<tr><td class="model">{0}</td><td><div>V{1}</div></td>'
+                '<td><a class="bold ga-click" href="https://static.tp-link.com/gpl/{2}_V{1}_GPL.tar.gz">Download</a></td></tr>'.format(model, version, model.replace(' ', '_'))
+                for version in range(1, 3)
+            )
+            return '<html><body><table>{}</table></body></html>'.format(rows)
+        return tplink_gpl_list(self.scale)
+
+    def linksys_gpl(self, url):
+        return linksys_gpl_list(self.scale)
+
+
+def build_dlink_tree(root, scale, blob_size):
+    # <category>/<device>/driver_software/<firmware>.zip, firmware files are sparse so multi-GB sizes cost no disk
+    for index in range(scale):
+        device = 'dir-{}'.format(index)
+        directory = join(root, 'dir', device, 'driver_software')
+        os.makedirs(directory, exist_ok=True)
+        os.makedirs(join(root, 'dir', device, 'archive'), exist_ok=True)
+        with open(join(directory, '{}_fw_reva_1-0{}_eu_multi_20190517.zip'.format(device, index % 10)), 'wb') as firmware:
+            firmware.truncate(blob_size)
+    os.makedirs(join(root, 'tmp'), exist_ok=True)
+
+
+def listen_http(port, scale, blob_size, latency):
+    return reactor.listenTCP(port, server.Site(VendorSite(scale, blob_size, latency)), interface='127.0.0.1')
+
+
+def listen_ftp(port, root):
+    portal = Portal(FTPRealm(anonymousRoot=root), [AllowAnonymousAccess()])
+    factory = FTPFactory(portal)
+    factory.allowAnonymous = True
+    factory.userAnonymous = 'anonymous'
+    return reactor.listenTCP(port, factory, interface='127.0.0.1')
@@ -0,0 +1,146 @@
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.defer import Deferred
+
+from firmware.metrics import record_timing
+
+
+class DownloadBudget(object):
+    # bytes of file downloads in flight. Waiting downloads are admitted smallest first. Files of at least
+    # large_file_size bytes take a separate lane with its own concurrency, so big archives trickle in without holding up
+    # the small files. A lane without downloads in flight always admits its next download, files larger than the whole
+    # budget are fetched one at a time instead of never
+
+    def __init__(self, max_bytes, large_file_size, large_file_concurrency=1):
+        self.max_bytes = max_bytes
+        self.large_file_size = large_file_size
+        self.large_file_concurrency = large_file_concurrency
+        self.in_flight = 0
+        self.active = {False: 0, True: 0}
+        self.waiting = {False: list(), True: list()}
+        self.order = count()
+
+    def is_large(self, size):
+        return size >= self.large_file_size
+
+    def acquire(self, size):
+        admitted = Deferred()
+        heappush(self.waiting[self.is_large(size)], (size, next(self.order), admitted))
+        self.admit()
+        return admitted
+
+    def release(self, size):
+        self.in_flight -= size
+        self.active[self.is_large(size)] -= 1
+        self.admit()
+
+    def fits(self, size, large):
+        if large and self.active[True] >= self.large_file_concurrency:
+            return False
+        return not self.active[large] or self.in_flight + size <= self.max_bytes
+
+    def admit(self):
+        for large in (False, True):
+            queue = self.waiting[large]
+            while queue and self.fits(queue[0][0], large):
+                size, _, admitted = heappop(queue)
+                self.in_flight += size
+                self.active[large] += 1
+                admitted.callback(size)
+
+    def __len__(self):
+        return len(self.waiting[False]) + len(self.waiting[True])
+
+
+class DownloadBudgetMiddleware(object):
+    # holds back file downloads, requests with meta download_size, until the budget admits them. Unknown sizes are
+    # looked up with a HEAD request if DOWNLOAD_BUDGET_PROBE is set, otherwise DOWNLOAD_BUDGET_UNKNOWN_SIZE is assumed
+
+    def __init__(self, budget, unknown_size, probe=False, crawler=None):
+        self.budget = budget
+        self.unknown_size = unknown_size
+        self.probe = probe
+        self.crawler = crawler
+        self.stats = crawler.stats if crawler is not None else None
+        self.admitted = dict()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        max_bytes = crawler.settings.getint('DOWNLOAD_BUDGET_BYTES')
+        if max_bytes <= 0:
+            raise NotConfigured
+        budget = DownloadBudget(
+            max_bytes,
+            large_file_size=crawler.settings.getint('DOWNLOAD_LARGE_FILE_SIZE', 134217728),
+            large_file_concurrency=crawler.settings.getint('DOWNLOAD_LARGE_FILE_CONCURRENCY', 1)
+        )
+        middleware = cls(
+            budget,
+            unknown_size=crawler.settings.getint('DOWNLOAD_BUDGET_UNKNOWN_SIZE', 33554432),
+            probe=crawler.settings.getbool('DOWNLOAD_BUDGET_PROBE'),
+            crawler=crawler
+        )
+        crawler.signals.connect(middleware.request_left_downloader, signal=signals.request_left_downloader)
+        return middleware
+
+    def process_request(self, request, spider):
+        if 'download_size' not in request.meta or request in self.admitted:
+            return None
+        size = request.meta['download_size']
+        if size is None and self.probe and urlparse_cached(request).scheme in ('http', 'https'):
+            return self.probe_size(request, spider).addCallback(self.acquire, request, spider)
+        return self.acquire(size, request, spider)
+
+    def probe_size(self, request, spider):
+        meta = {key: value for key, value in request.meta.items() if key not in ('download_size', 'download_stream')}
+        probe = request.replace(method='HEAD', meta=meta)
+        self.inc_stats('download_budget/probe_count', spider)
+        return self.crawler.engine.download(probe, spider).addCallbacks(self.content_length, lambda _: None)
+
+    @staticmethod
+    def content_length(response):
+        length = response.headers.get('Content-Length')
+        return int(length) if response.status == 200 and length is not None and length.isdigit() else None
+
+    def acquire(self, size, request, spider):
+        if size is None:
+            size = self.unknown_size
+        request.meta['download_size'] = size
+        waiting_since = monotonic()
+        admitted = self.budget.acquire(size)
+        if admitted.called:
+            self.admitted[request] = size
+            return None
+        self.inc_stats('download_budget/queued_count', spider)
+        return admitted.addCallback(self.admit, request, spider, waiting_since)
+
+    def admit(self, size, request, spider, waiting_since):
+        self.admitted[request] = size
+        if self.stats is not None:
+            record_timing(self.stats, 'download_budget/wait_time', monotonic() - waiting_since, spider=spider)
+        return None
+
+    def release(self, request):
+        size = self.admitted.pop(request, None)
+        if size is not None:
+            self.budget.release(size)
+
+    def request_left_downloader(self, request, spider):
+        self.release(request)
+
+    def process_response(self, request, response, spider):
+        # responses which never reached the downloader, e.g. from a cache, release their share here
+        self.release(request)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self.release(request)
+
+    def inc_stats(self, key, spider):
+        if self.stats is not None:
+            self.stats.inc_value(key, spider=spider)
@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Dict, Iterable, Union
+
+CACHE_SIZE = 4096
+
+
+class PrefixClassifier:
+    # maps a device name to the class of its longest matching prefix in a single walk over the name, so the result
+    # does not depend on the order of the table (e.g. Linksys 'EZX' before 'E'). With boundary set, a prefix only
+    # matches up to one of the boundary characters or the end of the name, e.g. 'dir' matches 'dir-615' but not
+    # 'dirx-1'. The classes of the last cache_size names are memoized
+
+    def __init__(self, prefixes: Dict[str, str], default: Union[str, None] = None, boundary: Iterable[str] = (),
+                 lower: bool = False, cache_size: int = CACHE_SIZE):
+        self.transitions = [dict()]
+        self.classes = [None]
+        self.default = default
+        self.boundary = frozenset(boundary)
+        self.lower = lower
+        for prefix, device_class in prefixes.items():
+            self.add(prefix.lower() if lower else prefix, device_class)
+        self.classify = lru_cache(maxsize=cache_size)(self.lookup)
+
+    def add(self, prefix: str, device_class: str):
+        state = 0
+        for character in prefix:
+            if character not in self.transitions[state]:
+                self.transitions.append(dict())
+                self.classes.append(None)
+                self.transitions[state][character] = len(self.transitions) - 1
+            state = self.transitions[state][character]
+        self.classes[state] = device_class
+
+    def lookup(self, name: str) -> Union[str, None]:
+        if self.lower:
+            name = name.lower()
+        state, device_class = 0, self.default
+        for position, character in enumerate(name):
+            state = self.transitions[state].get(character)
+            if state is None:
+                break
+            if self.classes[state] is not None and self.at_boundary(name, position + 1):
+                device_class = self.classes[state]
+        return device_class
+
+    def at_boundary(self, name: str, end: int) -> bool:
+        return not self.boundary or end == len(name) or name[end] in self.boundary
+
+    def __call__(self, name: str) -> Union[str, None]:
+        return self.classify(name)
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from os.path import join
+
+# date of a directory in the index of its parent (meta listing_date), e.g. 12-08-2019
+LISTING_DATE_FORMAT = '%d-%m-%Y'
+
+
+class CrawlState:
+    # page fingerprints and emitted items of one spider; changes only become visible to later runs after commit()
+
+    def __init__(self, directory, spider_name):
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(join(directory, '{}.sqlite'.format(spider_name)))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'request TEXT PRIMARY KEY, fingerprint TEXT, listing_date TEXT, leaf INTEGER, fetched TEXT)'
+        )
+        self.connection.execute('CREATE TABLE IF NOT EXISTS items (fingerprint TEXT PRIMARY KEY)')
+        self.connection.commit()
+        self.pending_pages = dict()
+        self.pending_items = set()
+
+    def page_unchanged(self, request, fingerprint, listing_date=None, leaf=False):
+        row = self.connection.execute('SELECT fingerprint FROM pages WHERE request = ?', (request,)).fetchone()
+        self.pending_pages[request] = (fingerprint, listing_date, int(leaf), date.today().isoformat())
+        return row is not None and row[0] == fingerprint
+
+    def listing_unchanged(self, request, listing_date):
+        # a listing of files only can not have changed while the date of its directory in the parent index stayed the
+        # same. The dates have no time and the server clock may differ, so listings that were fetched on the day of
+        # their date or the day after are fetched again
+        row = self.connection.execute('SELECT listing_date, leaf, fetched FROM pages WHERE request = ?', (request,)).fetchone()
+        if row is None or not row[1] or row[0] != listing_date:
+            return False
+        try:
+            changed = datetime.strptime(listing_date, LISTING_DATE_FORMAT).date()
+        except ValueError:
+            return False
+        return changed + timedelta(days=1) < date.fromisoformat(row[2])
+
+    def item_seen(self, fingerprint):
+        if fingerprint in self.pending_items:
+            return True
+        if self.connection.execute('SELECT 1 FROM items WHERE fingerprint = ?', (fingerprint,)).fetchone() is not None:
+            return True
+        self.pending_items.add(fingerprint)
+        return False
+
+    def commit(self):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+            ((request,) + page for request, page in self.pending_pages.items())
+        )
+        self.connection.executemany('INSERT OR IGNORE INTO items VALUES (?)', ((item,) for item in self.pending_items))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
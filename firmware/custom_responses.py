@@ -0,0 +1,33 @@
+from collections import namedtuple
+from datetime import datetime
+from json import dumps, loads
+
+from scrapy.http import TextResponse
+
+FTPListingEntry = namedtuple('FTPListingEntry', ['name', 'size', 'type', 'mtime'])
+
+
+class FTPListResponse(TextResponse):
+    # carries the parsed directory listing, the JSON body only mirrors it for exporters and caches
+
+    def __init__(self, *args, entries=None, **kwargs):
+        if entries is not None:
+            kwargs['body'] = dumps([[entry.name, entry.size, entry.type, entry.mtime.isoformat() if entry.mtime else None] for entry in entries])
+            kwargs.setdefault('encoding', 'utf-8')
+        super().__init__(*args, **kwargs)
+        self._entries = entries
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = [
+                FTPListingEntry(name, size, entry_type, datetime.fromisoformat(mtime) if mtime else None)
+                for name, size, entry_type, mtime in loads(self.text)
+            ]
+        return self._entries
+
+    def replace(self, *args, **kwargs):
+        kwargs.setdefault('cls', self.__class__)
+        if 'body' not in kwargs:
+            kwargs.setdefault('entries', self._entries)
+        return super().replace(*args, **kwargs)
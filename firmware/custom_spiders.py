@@ -1,8 +1,11 @@
 from abc import ABCMeta
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator
 
 from scrapy import Spider
 
 from firmware.custom_requests import FTPFileRequest, FTPListRequest
+from firmware.filters import DeviceFilter
 
 
 class FTPSpider(Spider, metaclass=ABCMeta):
@@ -10,3 +13,28 @@ class FTPSpider(Spider, metaclass=ABCMeta):
     def start_requests(self):
         for url in self.start_urls:
             yield FTPListRequest(url) if url.endswith('/') else FTPFileRequest(url)
+
+
+class FilteredSpider(Spider, metaclass=ABCMeta):
+    whitelist_enabled = False
+
+    whitelist = list()
+
+    blacklist = list()
+
+    @property
+    def device_filter(self) -> DeviceFilter:
+        # built on first use, after the spider arguments are set
+        if getattr(self, '_device_filter', None) is None:
+            self._device_filter = DeviceFilter.from_spider(self)
+        return self._device_filter
+
+    def firmware_filter(self, extractor: Iterable[Any], device: Callable[[Any], Any] = itemgetter(0)) -> Iterator[Any]:
+        yield from filter_devices(extractor, self.device_filter, device)
+
+
+def filter_devices(extractor: Iterable[Any], device_filter: DeviceFilter, device: Callable[[Any], Any] = itemgetter(0)) -> Iterator[Any]:
+    # the filter of a spider applied outside of it, e.g. in an offload worker
+    for entry in extractor:
+        if device_filter(device(entry)):
+            yield entry
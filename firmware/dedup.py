@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from hashlib import sha1
+from os.path import dirname
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+
+FINGERPRINT_FIELDS = ('vendor', 'device_name', 'firmware_version', 'file_urls')
+
+
+def first_value(value):
+    if isinstance(value, (list, tuple)):
+        return first_value(value[0]) if value else None
+    return value
+
+
+def item_fingerprint(item):
+    # canonical (vendor, device_name, firmware_version, file_url) key of items and meta data dictionaries
+    adapter = ItemAdapter(item)
+    canonical = '\x1f'.join(str(first_value(adapter.get(field))) for field in FINGERPRINT_FIELDS)
+    return sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class SeenSet:
+    # fingerprints of emitted items with O(1) lookups. With a path, the fingerprints of earlier runs are loaded from and
+    # new ones are written to an on-disk set, so items are skipped across runs as well
+
+    def __init__(self, path=None):
+        self.seen = set()
+        self.pending = list()
+        self.connection = None
+        if path is not None:
+            if dirname(path):
+                os.makedirs(dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS seen (fingerprint TEXT PRIMARY KEY)')
+            self.seen.update(row[0] for row in self.connection.execute('SELECT fingerprint FROM seen'))
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.seen
+
+    def __len__(self):
+        return len(self.seen)
+
+    def add(self, fingerprint):
+        # returns False for fingerprints that were already seen
+        if fingerprint in self.seen:
+            return False
+        self.seen.add(fingerprint)
+        if self.connection is not None:
+            self.pending.append((fingerprint,))
+        return True
+
+    def flush(self):
+        if self.connection is not None and self.pending:
+            self.connection.executemany('INSERT OR IGNORE INTO seen VALUES (?)', self.pending)
+            self.connection.commit()
+            self.pending = list()
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+
+
+class DuplicatesPipeline:
+    # drops items that were already emitted in this run, or with DEDUP_PERSIST in any earlier run of the spider
+
+    def __init__(self, state_directory=None, stats=None):
+        self.state_directory = state_directory
+        self.stats = stats
+        self.seen = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        state_directory = crawler.settings.get('CRAWL_STATE_DIR', 'crawl_state') if crawler.settings.getbool('DEDUP_PERSIST') else None
+        return cls(state_directory, crawler.stats)
+
+    def open_spider(self, spider):
+        path = os.path.join(self.state_directory, '{}.seen.sqlite'.format(spider.name)) if self.state_directory else None
+        self.seen = SeenSet(path)
+
+    def close_spider(self, spider):
+        self.seen.close()
+
+    def process_item(self, item, spider):
+        if not self.seen.add(item_fingerprint(item)):
+            if self.stats is not None:
+                self.stats.inc_value('dedup/duplicate_item_count', spider=spider)
+            raise DropItem('Duplicate item: {}'.format(first_value(ItemAdapter(item).get('file_urls'))))
+        return item
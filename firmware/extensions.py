@@ -0,0 +1,163 @@
+import json
+import os
+import re
+from datetime import datetime
+from os.path import dirname
+from time import monotonic
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.web import resource, server
+
+from firmware.metrics import record_timing
+
+BUCKET_RE = re.compile(r'^(.+)/le_(.+)$')
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4')
+        return self.metrics.prometheus().encode('utf-8')
+
+
+class CrawlMetrics(object):
+    # exports the crawl stats with pages, items and bytes per second and the depth of the request queues every
+    # METRICS_INTERVAL seconds to the JSON file METRICS_FILE and/or serves them in the Prometheus text format on
+    # METRICS_PORT. Timings recorded with record_timing become histograms
+
+    def __init__(self, crawler, interval, path=None, port=None):
+        if path is None and port is None:
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = interval
+        self.path = path
+        self.port = port
+        self.listening = None
+        self.task = None
+        self.spider = None
+        self.last_sample = None
+        self.rates = dict()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            interval=crawler.settings.getfloat('METRICS_INTERVAL', 10.0),
+            path=crawler.settings.get('METRICS_FILE'),
+            port=crawler.settings.getint('METRICS_PORT') or None
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.last_sample = (monotonic(), self.totals())
+        if self.port is not None:
+            from twisted.internet import reactor
+            self.listening = reactor.listenTCP(self.port, server.Site(MetricsResource(self)))
+        self.task = task.LoopingCall(self.sample)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.sample()
+        if self.listening is not None:
+            return self.listening.stopListening()
+
+    def response_received(self, response, request, spider):
+        if 'download_latency' in request.meta:
+            record_timing(self.stats, 'download/latency', request.meta['download_latency'], spider=spider)
+        if 'ftp_list_time' in request.meta:
+            record_timing(self.stats, 'ftp/list_time', request.meta['ftp_list_time'], spider=spider)
+
+    def totals(self):
+        return {
+            'pages': self.stats.get_value('response_received_count', 0),
+            'items': self.stats.get_value('item_scraped_count', 0),
+            # streamed firmware files leave an empty response body, their bytes are counted by the pipeline
+            'bytes': self.stats.get_value('downloader/response_bytes', 0) + self.stats.get_value('file_bytes/streamed', 0),
+        }
+
+    def sample(self):
+        now, totals = monotonic(), self.totals()
+        last_time, last_totals = self.last_sample
+        elapsed = now - last_time
+        self.rates = {'{}_per_second'.format(key): (value - last_totals[key]) / elapsed if elapsed > 0 else 0.0 for key, value in totals.items()}
+        self.last_sample = (now, totals)
+        if self.path is not None:
+            self.write_json()
+
+    def queue_depth(self):
+        engine = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return dict(scheduled=0, downloading=0, scraping=0)
+        return dict(
+            scheduled=len(engine.slot.scheduler),
+            downloading=len(engine.downloader.active),
+            scraping=len(engine.scraper.slot.active) if engine.scraper.slot is not None else 0,
+        )
+
+    def snapshot(self):
+        return {
+            'spider': self.spider.name if self.spider is not None else None,
+            'time': datetime.utcnow().isoformat(),
+            'rates': self.rates,
+            'queue': self.queue_depth(),
+            'stats': {key: value for key, value in self.stats.get_stats().items() if isinstance(value, (int, float))},
+        }
+
+    def write_json(self):
+        path = self.path % {'name': self.spider.name} if self.spider is not None else self.path
+        if dirname(path):
+            os.makedirs(dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as metrics_file:
+            json.dump(self.snapshot(), metrics_file, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        stats, spider = snapshot['stats'], snapshot['spider']
+        histograms = {match.group(1) for match in map(BUCKET_RE.match, stats) if match is not None}
+        lines = list()
+        for key, value in sorted(stats.items()):
+            name, _, suffix = key.rpartition('/')
+            if name in histograms and (suffix in ('count', 'sum') or suffix.startswith('le_')):
+                continue
+            lines.append('firmware_{}{{spider="{}"}} {}'.format(metric_name(key), spider, value))
+        for name in sorted(histograms):
+            lines.extend(self.histogram(name, stats, spider))
+        for group in ('rates', 'queue'):
+            for key, value in sorted(snapshot[group].items()):
+                lines.append('firmware_{}_{}{{spider="{}"}} {}'.format(group, key, spider, value))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def histogram(name, stats, spider):
+        # record_timing keeps one counter per bucket, Prometheus buckets are cumulative
+        buckets = {match.group(2): value for match, value in ((BUCKET_RE.match(key), value) for key, value in stats.items()) if match is not None and match.group(1) == name}
+        metric = 'firmware_{}'.format(metric_name(name))
+        lines = ['# TYPE {} histogram'.format(metric)]
+        cumulative = 0
+        for bound in sorted((bound for bound in buckets if bound != 'inf'), key=float) + ['inf']:
+            cumulative += buckets.get(bound, 0)
+            lines.append('{}_bucket{{spider="{}",le="{}"}} {}'.format(metric, spider, '+Inf' if bound == 'inf' else bound, cumulative))
+        lines.append('{}_sum{{spider="{}"}} {}'.format(metric, spider, stats.get(name + '/sum', 0)))
+        lines.append('{}_count{{spider="{}"}} {}'.format(metric, spider, stats.get(name + '/count', 0)))
+        return lines
+
+
+def metric_name(key):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', key)
@@ -0,0 +1,62 @@
+import re
+from collections import namedtuple
+from html import unescape
+from typing import Any, Generator, List, Union
+
+from lxml import etree
+from parsel import Selector
+from scrapy.http import Response
+
+# one row of an Apache style directory index, date is e.g. 12-Aug-2019 and size None for directories
+IndexEntry = namedtuple('IndexEntry', ['href', 'date', 'size', 'is_dir'])
+
+INDEX_ENTRY_RE = re.compile(r'<a\s+href="([^"]*)"[^>]*>.*?</a>(?:\s*(\d{1,2}-[A-Za-z]{3}-\d{4})\s+\d{1,2}:\d{2}(?::\d{2})?\s+(\S+))?', re.IGNORECASE | re.DOTALL)
+
+
+class XPathSet(dict):
+    # XPATH dictionary of a spider, the expressions are compiled once with the class instead of on every response.
+    # Lookups by key still return the expression string.
+
+    def __init__(self, expressions: dict):
+        super().__init__(expressions)
+        self.compiled = {key: etree.XPath(expression, smart_strings=False) for key, expression in expressions.items()}
+
+    def __call__(self, node: Union[Response, Selector, etree._Element], key: str) -> List[Any]:
+        # raw lxml results: elements for node sets, plain strings for text and attribute nodes
+        return self.compiled[key](root(node))
+
+    def extract(self, node: Union[Response, Selector, etree._Element], key: str) -> List[str]:
+        return [serialize(result) for result in self(node, key)]
+
+    def first(self, node: Union[Response, Selector, etree._Element], key: str, default: Any = None) -> Any:
+        results = self(node, key)
+        return serialize(results[0]) if results else default
+
+
+def root(node: Union[Response, Selector, etree._Element]) -> etree._Element:
+    if isinstance(node, etree._Element):
+        return node
+    return getattr(node, 'selector', node).root
+
+
+def serialize(result: Any) -> str:
+    if isinstance(result, etree._Element):
+        return etree.tostring(result, method='html', encoding='unicode', with_tail=False)
+    return str(result)
+
+
+def text_content(element: etree._Element) -> str:
+    # all descendant text of element, like ''.join(selector.xpath('.//text()').extract())
+    return ''.join(element.itertext())
+
+
+def parse_index(response: Response) -> Generator[IndexEntry, None, None]:
+    # a single regular expression pass over the <pre> block of the listing, links and their date and size stay
+    # together even if a row has no date (e.g. ../). href is relative to the listing
+    text = response.text
+    start = max(text.find('<pre'), 0)
+    end = text.find('</pre>', start)
+    for match in INDEX_ENTRY_RE.finditer(text, start, end if end >= 0 else len(text)):
+        href, date, size = match.groups()
+        href = unescape(href)
+        yield IndexEntry(href, date, int(size) if size is not None and size.isdigit() else None, href.endswith('/'))
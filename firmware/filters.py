@@ -0,0 +1,95 @@
+from collections import deque
+from typing import Iterable, List, Union
+
+
+class AhoCorasick:
+    # automaton over all patterns, a single scan of the text finds whether any of them occurs in it
+
+    def __init__(self, patterns: Iterable[str]):
+        self.transitions = [dict()]
+        self.fallback = [0]
+        self.accepting = [False]
+        for pattern in patterns:
+            self.add(pattern)
+        self.link()
+
+    def add(self, pattern: str):
+        state = 0
+        for character in pattern:
+            if character not in self.transitions[state]:
+                self.transitions.append(dict())
+                self.fallback.append(0)
+                self.accepting.append(False)
+                self.transitions[state][character] = len(self.transitions) - 1
+            state = self.transitions[state][character]
+        self.accepting[state] = True
+
+    def link(self):
+        # breadth first, the fallback of a state is the longest proper suffix of its path that is also a trie path
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, child in self.transitions[state].items():
+                fallback = self.fallback[state]
+                while fallback and character not in self.transitions[fallback]:
+                    fallback = self.fallback[fallback]
+                self.fallback[child] = self.transitions[fallback].get(character, 0)
+                self.accepting[child] = self.accepting[child] or self.accepting[self.fallback[child]]
+                queue.append(child)
+
+    def search(self, text: str) -> bool:
+        if self.accepting[0]:
+            return True
+        state = 0
+        for character in text:
+            while state and character not in self.transitions[state]:
+                state = self.fallback[state]
+            state = self.transitions[state].get(character, 0)
+            if self.accepting[state]:
+                return True
+        return False
+
+
+class DeviceFilter:
+    # a device passes if it contains none of the denied models and, when an allow list is set, any of the allowed ones
+
+    def __init__(self, allow: Union[Iterable[str], None] = None, deny: Union[Iterable[str], None] = None):
+        self.allow = AhoCorasick(allow) if allow is not None else None
+        self.deny = AhoCorasick(deny) if deny else None
+
+    def __call__(self, device: Union[str, List[str]]) -> bool:
+        if not isinstance(device, str):
+            device = '\n'.join(device)
+        if self.deny is not None and self.deny.search(device):
+            return False
+        return self.allow is None or self.allow.search(device)
+
+    @classmethod
+    def from_spider(cls, spider) -> 'DeviceFilter':
+        # spider arguments: -a whitelist=COVR-1100,DIR-867 or -a whitelist_file=models.txt, blacklist likewise. They replace
+        # the whitelist class attribute, which only applies with whitelist_enabled
+        whitelist, whitelist_file = getattr(spider, 'whitelist', None), getattr(spider, 'whitelist_file', None)
+        if isinstance(whitelist, str) or whitelist_file:
+            allow = read_models(whitelist if isinstance(whitelist, str) else None, whitelist_file)
+        elif is_enabled(getattr(spider, 'whitelist_enabled', False)):
+            allow = read_models(whitelist)
+        else:
+            allow = None
+        deny = read_models(getattr(spider, 'blacklist', None), getattr(spider, 'blacklist_file', None))
+        return cls(allow=allow, deny=deny)
+
+
+def read_models(models: Union[str, Iterable[str], None], path: Union[str, None] = None) -> List[str]:
+    if isinstance(models, str):
+        models = models.split(',')
+    models = list(models or [])
+    if path:
+        with open(path, encoding='utf-8') as model_file:
+            models.extend(line for line in model_file if not line.startswith('#'))
+    return [model.strip() for model in models if model.strip()]
+
+
+def is_enabled(value: Union[str, bool]) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
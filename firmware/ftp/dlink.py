@@ -1,140 +1,328 @@
 import json
+import logging
 import re
+import sqlite3
+import threading
+from argparse import ArgumentParser
+from collections import Counter
 from datetime import datetime
-from ftplib import FTP, error_perm
-
-from os import mkdir, chdir, stat
+from ftplib import FTP, error_perm, error_temp
+from functools import partial
+from os import chdir, mkdir, stat
 from os.path import isdir as is_directory
 from os.path import isfile as is_file
+from queue import Queue
+
+from firmware.classifiers import PrefixClassifier
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    # persistent queue of listing and download tasks, pending tasks survive an interrupted run. Tasks that failed for
+    # good are kept apart from the pending ones and tried again by the next complete mirror
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            'path TEXT PRIMARY KEY, kind TEXT, depth INTEGER, device TEXT, details TEXT, done INTEGER DEFAULT 0, '
+            'failed INTEGER DEFAULT 0)'
+        )
+        self.connection.commit()
+
+    def add(self, path, kind, depth, device=None, details=None):
+        with self.lock:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO tasks (path, kind, depth, device, details) VALUES (?, ?, ?, ?, ?)',
+                (path, kind, depth, device, json.dumps(details))
+            )
+            self.connection.commit()
+            return cursor.rowcount == 1
+
+    def done(self, path):
+        with self.lock:
+            self.connection.execute('UPDATE tasks SET done = 1 WHERE path = ?', (path,))
+            self.connection.commit()
+
+    def fail(self, path):
+        with self.lock:
+            self.connection.execute('UPDATE tasks SET failed = 1 WHERE path = ?', (path,))
+            self.connection.commit()
+
+    def pending(self):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT path, kind, depth, device, details FROM tasks WHERE done = 0 AND failed = 0'
+            ).fetchall()
+        return [(path, kind, depth, device, json.loads(details)) for path, kind, depth, device, details in rows]
+
+    def start(self, root):
+        # resumes the pending tasks of an interrupted run, after a complete run the mirror starts over from root.
+        # Returns whether the run is resumed
+        with self.lock:
+            resumed = self.connection.execute(
+                'SELECT 1 FROM tasks WHERE done = 0 AND failed = 0 LIMIT 1'
+            ).fetchone() is not None
+            if not resumed:
+                self.connection.execute('DELETE FROM tasks')
+                self.connection.commit()
+        self.add(root, 'list', FTPClass.CATEGORY - 1)
+        return resumed
+
+    def close(self):
+        self.connection.close()
+
+
+class JsonLinesSink:
+    # every record is written and flushed right away, so the output can be tailed while the crawl runs. A new mirror
+    # replaces the file, a resumed one appends to it. A record of a download that was interrupted before its task was
+    # marked done is written again by the next run
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.path = path
+        self.file = None
+
+    def start(self, resumed):
+        self.file = open(self.path, mode='a' if resumed else 'w')
+
+    def write(self, record, committed=None):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+        if committed is not None:
+            committed()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class SQLiteSink:
+    # records are committed in batches of batch_size, committed is called for every record of a batch once it is
+    # stored. Records are unique by file url, so a download that is repeated after a crash replaces its record
+
+    def __init__(self, path, batch_size=100):
+        self.lock = threading.Lock()
+        self.batch_size = batch_size
+        self.batch = list()
+        self.callbacks = list()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS firmware ('
+            'file_urls TEXT PRIMARY KEY, device_name TEXT, vendor TEXT, firmware_version TEXT, device_class TEXT, release_date REAL)'
+        )
+        self.connection.commit()
+
+    def start(self, resumed):
+        # records are replaced by file url, a new mirror updates the table of the last one
+        pass
+
+    def write(self, record, committed=None):
+        with self.lock:
+            self.batch.append(record)
+            if committed is not None:
+                self.callbacks.append(committed)
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO firmware VALUES '
+            '(:file_urls, :device_name, :vendor, :firmware_version, :device_class, :release_date)',
+            self.batch
+        )
+        self.connection.commit()
+        for committed in self.callbacks:
+            committed()
+        self.batch = list()
+        self.callbacks = list()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+        self.connection.close()
 
 
 class FTPClass:
-    def __init__(self, address):
-        self.ftp_client = FTP(address, encoding='latin1')
-        self.already_seen = ['fw', 'sw', 'rev', 'drv', 'code']
-        self.json_file = list()
-        self.files_skipped = {
-            '@archive', 'anleitungen', 'D-Link_Assist_Anleitung.pdf', 'Hinweise Datenblaetter.txt',
-            'Images_High_Resolution', 'Images_Low_Resolution', 'index_info.txt', 'Legal - Information',
-            'Product_Images',
-            'Product_Information_Material', 'self - service', 'software', 'Supportsystem_Anleitung_Mass_RMA.pdf',
-            'Terms_and_Conditions', 'tmp', 'Warranty_Documents',
-            # deprecated systems
-            'ant24', 'ant70', 'dcf', 'de', 'dfw', 'dhd', 'dif', 'dm', 'dph', 'dvc', 'dvg', 'dvg', 'dta', 'dsn', 'dsm',
-            'dns', 'dvs', 'dfl', 'dbt', 'dev', 'dcm', 'dgl', 'dhs', 'di', 'dws', 'dfe', 'du'
-        }
-        self.device_classes_dict = {
-            'dba': 'Access Point', 'dap': 'Access Point',
-            'dis': 'Converter', 'dmc': 'Converter',
-            'dge': 'PCIe-Networkcard', 'dwa': 'PCIe-Networkcard', 'dxe': 'PCIe-Networkcard',
-            'dps': 'Redundant Power Supply',
-            'dsr': 'Router (Business)',
-            'dwr': 'Router (mobile)', 'dwm': 'Router (mobile)',
-            'dsl': 'Router (Modem)',
-            'covr': 'Router (Home)', 'dir': 'Router (Home)', 'dva': 'Router (Home)', 'go': 'Router (Home)',
-            'dsp': 'Smart Plug',
-            'dcs': 'Smart Wi-Fi Camera', 'dsh': 'Smart Wi-Fi Camera',
-            'des': 'Switch', 'dgs': 'Switch', 'dkvm': 'Switch', 'dqs': 'Switch', 'dxs': 'Switch',
-            'dem': 'Transceiver',
-            'dub': 'USB Extensions',
-            'dnr': 'Video Recorder',
-            'dwc': 'Wireless Controller',
-            'dwl': 'other'
-        }
-        # for dwl: ap = Access Point, e = enterprise, s = small to medium business, g = SuperG?!, m = MIMO,
-        # p = power over ethernet, plus = 802.11b+, ag = 802.11a and 802.11g, else PCIe, Adapter many more
-        # go-plk = powerline connection, go-dsl = modem-router
+    files_skipped = {
+        '@archive', 'anleitungen', 'D-Link_Assist_Anleitung.pdf', 'Hinweise Datenblaetter.txt',
+        'Images_High_Resolution', 'Images_Low_Resolution', 'index_info.txt', 'Legal - Information',
+        'Product_Images',
+        'Product_Information_Material', 'self - service', 'software', 'Supportsystem_Anleitung_Mass_RMA.pdf',
+        'Terms_and_Conditions', 'tmp', 'Warranty_Documents',
+        # deprecated systems
+        'ant24', 'ant70', 'dcf', 'de', 'dfw', 'dhd', 'dif', 'dm', 'dph', 'dvc', 'dvg', 'dvg', 'dta', 'dsn', 'dsm',
+        'dns', 'dvs', 'dfl', 'dbt', 'dev', 'dcm', 'dgl', 'dhs', 'di', 'dws', 'dfe', 'du'
+    }
+    device_classes_dict = {
+        'dba': 'Access Point', 'dap': 'Access Point',
+        'dis': 'Converter', 'dmc': 'Converter',
+        'dge': 'PCIe-Networkcard', 'dwa': 'PCIe-Networkcard', 'dxe': 'PCIe-Networkcard',
+        'dps': 'Redundant Power Supply',
+        'dsr': 'Router (Business)',
+        'dwr': 'Router (mobile)', 'dwm': 'Router (mobile)',
+        'dsl': 'Router (Modem)',
+        'covr': 'Router (Home)', 'dir': 'Router (Home)', 'dva': 'Router (Home)', 'go': 'Router (Home)',
+        'dsp': 'Smart Plug',
+        'dcs': 'Smart Wi-Fi Camera', 'dsh': 'Smart Wi-Fi Camera',
+        'des': 'Switch', 'dgs': 'Switch', 'dkvm': 'Switch', 'dqs': 'Switch', 'dxs': 'Switch',
+        'dem': 'Transceiver',
+        'dub': 'USB Extensions',
+        'dnr': 'Video Recorder',
+        'dwc': 'Wireless Controller',
+        'dwl': 'other'
+    }
+    # the initials before the first '-' of the device name, e.g. dir-615
+    device_classifier = PrefixClassifier(device_classes_dict, boundary='-')
+    # for dwl: ap = Access Point, e = enterprise, s = small to medium business, g = SuperG?!, m = MIMO,
+    # p = power over ethernet, plus = 802.11b+, ag = 802.11a and 802.11g, else PCIe, Adapter many more
+    # go-plk = powerline connection, go-dsl = modem-router
+
+    # depth of the directories below the root: category (e.g. dir) / device (e.g. dir-615) / driver_software / files
+    CATEGORY, DEVICE, DRIVER_SOFTWARE, FILES = range(4)
+
+    MAX_RETRIES = 3
+
+    def __init__(self, address, sink, workers=4, queue_path='dlink_queue.sqlite'):
+        self.address = address
+        self.workers = workers
+        self.work_queue = WorkQueue(queue_path)
+        self.tasks = Queue()
+        self.connections = threading.local()
+        self.open_connections = list()
+        self.output_lock = threading.Lock()
+        self.sink = sink
+        self.attempts = Counter()
+        self.stopped = threading.Event()
 
     def main(self):
-        print(self.ftp_client.login())
+        self.sink.start(self.work_queue.start('/'))
+        for task in self.work_queue.pending():
+            self.tasks.put(task)
+
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
         try:
-            for (directory_name, _) in self.start_iteration():
-                if directory_name in self.files_skipped:
-                    continue
-                try:
-                    self.ftp_client.cwd(directory_name)
-                    self.get_subpage()
-                    self.ftp_client.cwd('/')
-                except error_perm as error:
-                    self.logging(error)
-                    continue
+            self.tasks.join()
         except KeyboardInterrupt:
-            print('shutting down slowly')
+            logger.info('shutting down, pending tasks are resumed on the next run')
         finally:
-            self.ftp_client.close()
-            with open('dlink.json', mode='w') as file:
-                json.dump(self.json_file, file)
-                file.close()
-
-    def get_subpage(self):
+            self.stopped.set()
+            for ftp_client in self.open_connections:
+                ftp_client.close()
+            # the sink commits its last batch and marks the tasks of its records done before the queue is closed
+            self.sink.close()
+            self.work_queue.close()
 
-        for (directory_name, _) in self.start_iteration():
+    def worker(self):
+        while not self.stopped.is_set():
+            task = self.tasks.get()
             try:
-                self.ftp_client.cwd(directory_name)
-                self.get_sub_subpage(directory_name)
-                self.ftp_client.cwd('..')
-
+                self.process(*task)
+            except (EOFError, OSError, error_temp) as error:
+                # connection is broken, reconnect on the next task and try again
+                self.log_error(error, task[0])
+                self.connections.ftp_client = None
+                self.retry(task)
             except error_perm as error:
                 # trying to access file or permission denied
-                self.logging(error)
-                continue
-
-    def get_sub_subpage(self, this_directory_name):
-        for (new_directory, _) in self.start_iteration():
-            if new_directory == 'driver_software':
-                self.ftp_client.cwd('driver_software')
-                self.download(this_directory_name)
-                self.ftp_client.cwd('..')
-
-    def download(self, device_name):
-
-        for (file_name, file_details) in self.start_iteration():
-            if not re.search('zip$', file_name) or (
-                    is_file(file_name) and stat(file_name).st_size == file_details['size']):
-                continue
-
-            if '_fw_' in file_name:
-                self.append_device_information(device_name, file_details, file_name)
-                with open('{}'.format(file_name), 'wb') as file:
-                    self.ftp_client.retrbinary('{} {}'.format('RETR', file_name), file.write)
-                    file.close()
-            if '_sw_' in file_name:  # software
-                pass
-            if '_rev' in file_name:  # revision?
-                pass
-            if '_drv_' in file_name:  # driver
-                pass
-            if 'code' in file_name:  # sourcecode
-                pass
-
-    def append_device_information(self, device_name, file_details, file_name):
-        self.json_file.append(
+                self.log_error(error, task[0])
+                self.work_queue.done(task[0])
+            except Exception as error:
+                self.log_error(error, task[0])
+                self.work_queue.fail(task[0])
+            finally:
+                self.tasks.task_done()
+
+    def retry(self, task):
+        with self.output_lock:
+            self.attempts[task[0]] += 1
+            attempts = self.attempts[task[0]]
+        if self.stopped.is_set():
+            # the task stays pending in the work queue and is picked up again by the next run
+            return
+        if attempts <= self.MAX_RETRIES:
+            self.tasks.put(task)
+        else:
+            self.work_queue.fail(task[0])
+
+    def process(self, path, kind, depth, device, details):
+        if kind == 'list':
+            self.list_directory(path, depth, device)
+            self.work_queue.done(path)
+        else:
+            # the task stays pending until the sink committed its record
+            self.download(path, device, details)
+
+    def list_directory(self, path, depth, device):
+        for (name, details) in self.start_iteration(path):
+            child_path = '{}/{}'.format(path.rstrip('/'), name)
+            child_depth = depth + 1
+            is_directory_entry = details.get('type') == 'dir'
+
+            if child_depth == self.CATEGORY and is_directory_entry and name not in self.files_skipped:
+                self.schedule(child_path, 'list', child_depth)
+            elif child_depth == self.DEVICE and is_directory_entry:
+                self.schedule(child_path, 'list', child_depth, device=name)
+            elif child_depth == self.DRIVER_SOFTWARE and name == 'driver_software':
+                self.schedule(child_path, 'list', child_depth, device=device)
+            elif child_depth == self.FILES and self.is_firmware(name):
+                self.schedule(child_path, 'download', child_depth, device=device, details=details)
+
+    def schedule(self, path, kind, depth, device=None, details=None):
+        if self.work_queue.add(path, kind, depth, device, details):
+            self.tasks.put((path, kind, depth, device, details))
+
+    @staticmethod
+    def is_firmware(file_name):
+        # software (_sw_), revisions (_rev), drivers (_drv_) and sourcecode (code) are not collected
+        return re.search('zip$', file_name) is not None and '_fw_' in file_name
+
+    def download(self, path, device_name, file_details):
+        file_name = path.split('/')[-1]
+        remote_size = int(file_details['size'])
+        local_size = stat(file_name).st_size if is_file(file_name) else 0
+
+        if local_size != remote_size:
+            # resume partial downloads of a previous run via REST
+            offset = local_size if local_size < remote_size else 0
+            with open(file_name, 'ab' if offset else 'wb') as file:
+                self.ftp_client().retrbinary('RETR {}'.format(path), file.write, rest=offset or None)
+                file.close()
+
+        self.append_device_information(device_name, file_details, file_name, path)
+
+    def append_device_information(self, device_name, file_details, file_name, path):
+        self.sink.write(
             {'device_name': device_name,
              'vendor': 'D-Link',
              'firmware_version': self.extract_firmware_version(file_name),
              'device_class': self.extract_device_class(device_name),
              'release_date': self.extract_release_date(file_details),
-             'file_urls': 'ftp://{}{}/{}'.format(self.ftp_client.host, self.ftp_client.pwd(), file_name)
-             })
+             'file_urls': 'ftp://{}{}'.format(self.address, path)
+             }, committed=partial(self.work_queue.done, path))
 
     def extract_device_class(self, device_name):
-        try:
-            device_initials = device_name.split('-')[0]
-            device_class = self.device_classes_dict[device_initials]
-            if device_initials == 'dwl' and 'ap' in device_name:
-                device_class = 'Access Point'
-
-        except Exception as error:
-            device_class = None
-            self.logging(error)
+        device_class = self.classify_device(device_name)
+        if device_class is None:
+            self.log_error('Unknown device class', device_name)
         return device_class
 
+    @staticmethod
+    def classify_device(device_name):
+        if device_name.startswith('dwl-') and 'ap' in device_name:
+            return 'Access Point'
+        return FTPClass.device_classifier(device_name)
+
     def extract_release_date(self, file_details):
         try:
             release_date = datetime.timestamp(datetime.strptime(file_details['modify'], "%Y%m%d%H%M%S"))
         except Exception as error:
             release_date = None
-            self.logging(error)
+            self.log_error(error, file_details)
         return release_date
 
     def extract_firmware_version(self, file_name):
@@ -142,19 +330,25 @@ class FTPClass:
             firmware_version = file_name.split('_')[3]
         except Exception as error:
             firmware_version = None
-            self.logging(error)
+            self.log_error(error, file_name)
         return firmware_version
 
-    def start_iteration(self):
-        site_columns = self.ftp_client.mlsd()
-        next(site_columns)
-        next(site_columns)
-        next(site_columns)
-        return site_columns
+    def ftp_client(self):
+        # every worker thread owns one control connection, so the pool is bounded by the number of workers
+        if getattr(self.connections, 'ftp_client', None) is None:
+            ftp_client = FTP(self.address, encoding='latin1')
+            ftp_client.login()
+            self.connections.ftp_client = ftp_client
+            with self.output_lock:
+                self.open_connections.append(ftp_client)
+        return self.connections.ftp_client
 
-    def logging(self, error):
-        with open('0_logfile.txt', 'a') as logfile:
-            logfile.write('Errormessage: {} \n Directory: {}\n'.format(error, self.ftp_client.pwd()))
+    def start_iteration(self, path):
+        return [(name, details) for (name, details) in self.ftp_client().mlsd(path) if details.get('type') not in ('cdir', 'pdir')]
+
+    @staticmethod
+    def log_error(error, location):
+        logger.warning('Errormessage: %s Directory: %s', error, location)
 
 
 if __name__ == '__main__':
@@ -165,5 +359,14 @@ if __name__ == '__main__':
         mkdir(DOWNLOADS)
         chdir(DOWNLOADS)
 
-    THIS = FTPClass('ftp.dlink.de')
+    PARSER = ArgumentParser(description='Mirror the firmware of ftp.dlink.de')
+    PARSER.add_argument('--workers', type=int, default=4, help='number of parallel FTP connections')
+    PARSER.add_argument('--sqlite', action='store_true', help='store records in dlink.sqlite instead of dlink.jsonl')
+    ARGUMENTS = PARSER.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s',
+                        handlers=[logging.FileHandler('0_logfile.txt'), logging.StreamHandler()])
+
+    SINK = SQLiteSink('dlink.sqlite') if ARGUMENTS.sqlite else JsonLinesSink('dlink.jsonl')
+    THIS = FTPClass('ftp.dlink.de', sink=SINK, workers=ARGUMENTS.workers)
     THIS.main()
@@ -1,39 +1,306 @@
-from json import dumps
+import hashlib
+import os
+from collections import deque
+from datetime import datetime
+from tempfile import mkstemp
+from time import monotonic
+from urllib.parse import unquote
 
-from scrapy.core.downloader.handlers.ftp import FTPDownloadHandler
-from scrapy.http import TextResponse
-from twisted.protocols.ftp import FTPFileListProtocol
+from scrapy.core.downloader.handlers.ftp import FTPDownloadHandler, ReceivedDataProtocol
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler, ScrapyAgent
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.python import to_bytes
+from twisted.internet import defer
+from twisted.internet.protocol import ClientCreator, Protocol
+from twisted.protocols.ftp import CommandFailed, FTPClient, FTPFileListProtocol
 
 from firmware.custom_requests import FTPListRequest
+from firmware.custom_responses import FTPListingEntry, FTPListResponse
 
 # Thanks to https://gearheart.io/articles/crawling-ftp-server-with-scrapy/
 
 
+class StreamedFile:
+    # response body written to a temporary file in directory as it arrives and hashed on the way, so a download never
+    # holds more than one chunk in memory. Requests with meta download_stream=<directory> are streamed, the handlers
+    # leave an empty body and put path, size and digests into meta download_stream_file
+
+    ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        descriptor, self.path = mkstemp(dir=directory, suffix='.partial')
+        self.file = os.fdopen(descriptor, 'wb')
+        self.size = 0
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in self.ALGORITHMS}
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        for digest in self.hashes.values():
+            digest.update(data)
+
+    def close(self):
+        self.file.close()
+        return dict(path=self.path, size=self.size, **{algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()})
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    # the part of the BytesIO interface that scrapy's HTTP response reader uses for its body buffer
+
+    def getvalue(self):
+        return b''
+
+    def truncate(self, size=None):
+        self.discard()
+
+
+def discard_superseded_stream(request):
+    # a retried request is a copy of the one downloaded before and still carries the file of the discarded response
+    superseded = request.meta.pop('download_stream_file', None)
+    if superseded is not None and os.path.exists(superseded['path']):
+        os.unlink(superseded['path'])
+
+
+class StreamingAgent(ScrapyAgent):
+
+    def _cb_bodyready(self, txresponse, request):
+        if not request.meta.get('download_stream'):
+            return super()._cb_bodyready(txresponse, request)
+
+        streamed = list()
+        deliver_body = txresponse.deliverBody
+
+        def stream_body(reader):
+            streamed.append(StreamedFile(request.meta['download_stream']))
+            reader._bodybuf = streamed[0]
+            deliver_body(reader)
+
+        def body_done(result):
+            if streamed and not streamed[0].file.closed:
+                request.meta['download_stream_file'] = streamed[0].close()
+            return result
+
+        def body_failed(failure):
+            if streamed:
+                streamed[0].discard()
+            return failure
+
+        txresponse.deliverBody = stream_body
+        return defer.maybeDeferred(super()._cb_bodyready, txresponse, request).addCallbacks(body_done, body_failed)
+
+
+class StreamingHTTPDownloadHandler(HTTP11DownloadHandler):
+    agent_class = StreamingAgent
+
+    def download_request(self, request, spider):
+        discard_superseded_stream(request)
+        agent = self.agent_class(
+            contextFactory=self._contextFactory,
+            pool=self._pool,
+            maxsize=getattr(spider, 'download_maxsize', self._default_maxsize),
+            warnsize=getattr(spider, 'download_warnsize', self._default_warnsize),
+            fail_on_dataloss=self._fail_on_dataloss,
+            crawler=self._crawler,
+        )
+        return agent.download_request(request)
+
+
+class StreamingDataProtocol(Protocol):
+
+    def __init__(self, directory):
+        self.body = StreamedFile(directory)
+        self.filename = None
+        self.size = 0
+
+    def dataReceived(self, data):
+        self.body.write(data)
+        self.size += len(data)
+
+    def close(self):
+        return self.body.close()
+
+
+class FTPConnectionPool:
+    # authenticated control connections to one host, reused across requests and closed after idle_timeout seconds
+
+    def __init__(self, connect, max_connections, idle_timeout, clock=None):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.connect = connect
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.idle = list()
+        self.waiting = deque()
+
+    def acquire(self):
+        while self.idle:
+            client, eviction = self.idle.pop()
+            eviction.cancel()
+            if client.transport is not None and client.transport.connected:
+                return defer.succeed(client)
+            self.connections -= 1
+
+        if self.connections < self.max_connections:
+            return self.open_connection()
+
+        # a cancelled waiter gives up its place in the line, so no released connection is handed to it
+        waiter = defer.Deferred(self.waiting.remove)
+        self.waiting.append(waiter)
+        return waiter
+
+    def open_connection(self):
+        self.connections += 1
+        return self.connect().addErrback(self.connection_failed)
+
+    def connection_failed(self, failure):
+        self.connections -= 1
+        return failure
+
+    def release(self, client, reusable=True):
+        if not reusable:
+            self.connections -= 1
+            if client.transport is not None:
+                client.transport.loseConnection()
+            if self.waiting:
+                self.open_connection().chainDeferred(self.waiting.popleft())
+            return
+
+        if self.waiting:
+            self.waiting.popleft().callback(client)
+            return
+
+        self.idle.append((client, self.clock.callLater(self.idle_timeout, self.evict, client)))
+
+    def evict(self, client):
+        self.idle = [(idle_client, eviction) for idle_client, eviction in self.idle if idle_client is not client]
+        self.connections -= 1
+        client.quit().addErrback(lambda _: None)
+
+    def close(self):
+        for client, eviction in self.idle:
+            eviction.cancel()
+            client.quit().addErrback(lambda _: None)
+        self.idle = list()
+
+
 class FTPHandler(FTPDownloadHandler):
 
+    ENTRY_TYPES = {'d': 'dir', '-': 'file', 'l': 'link'}
+
     def __init__(self, settings):
-        self.result = None
+        self.max_connections_per_host = settings.getint('FTP_MAX_CONNECTIONS_PER_HOST', 4)
+        self.idle_timeout = settings.getfloat('FTP_IDLE_TIMEOUT', 30)
+        self.pools = dict()
         super().__init__(settings)
 
+    def download_request(self, request, spider):
+        parsed_url = urlparse_cached(request)
+        user = request.meta.get('ftp_user', self.default_user)
+        password = request.meta.get('ftp_password', self.default_password)
+        passive_mode = 1 if bool(request.meta.get('ftp_passive', self.passive_mode)) else 0
+
+        pool = self.get_pool(parsed_url.hostname, parsed_url.port or 21, user, password, passive_mode)
+        return pool.acquire().addCallback(self.use_client, pool, request, unquote(parsed_url.path))
+
+    def get_pool(self, host, port, user, password, passive_mode):
+        key = (host, port, user, password, passive_mode)
+        if key not in self.pools:
+            def connect():
+                from twisted.internet import reactor
+                return ClientCreator(reactor, FTPClient, user, password, passive=passive_mode).connectTCP(host, port)
+            self.pools[key] = FTPConnectionPool(connect, self.max_connections_per_host, self.idle_timeout)
+        return self.pools[key]
+
+    def use_client(self, client, pool, request, filepath):
+        def release(result):
+            # failed commands (e.g. 550 file not found) leave the connection usable, anything else breaks it
+            pool.release(client, reusable=not isinstance(result, defer.Failure) or result.check(CommandFailed) is not None)
+            return result
+        return self.gotClient(client, request, filepath).addBoth(release)
+
     def gotClient(self, client, request, filepath):
-        # download file
+        # all state of a transfer lives in its protocol and callbacks, the handler is shared by concurrent requests
         if isinstance(request, FTPListRequest):
             # ftp listings
             proto = FTPFileListProtocol()
-            result = client.list(filepath, proto).addCallbacks(
+            return client.list(filepath, proto).addCallbacks(
                 callback=self._build_listing_response,
-                callbackArgs=[request, proto],
+                callbackArgs=[request, proto, monotonic()],
                 errback=self._failed,
                 errbackArgs=[request],
             )
-            client.quit()
-            return result
 
-        result = super().gotClient(client, request, filepath)
-        client.quit()
-        return result
+        if request.meta.get('download_stream'):
+            discard_superseded_stream(request)
+            proto = StreamingDataProtocol(request.meta['download_stream'])
+            return client.retrieveFile(filepath, proto).addCallbacks(
+                callback=self._build_streamed_response,
+                callbackArgs=[request, proto],
+                errback=self._failed_stream,
+                errbackArgs=[request, proto],
+            )
+
+        # download file
+        proto = ReceivedDataProtocol(request.meta.get('ftp_local_filename'))
+        return client.retrieveFile(filepath, proto).addCallbacks(
+            callback=self._build_file_response,
+            callbackArgs=[request, proto],
+            errback=self._failed,
+            errbackArgs=[request],
+        )
+
+    def _build_listing_response(self, _, request, protocol, started):
+        request.meta['ftp_list_time'] = monotonic() - started
+        entries = [self.parse_listing_entry(line) for line in protocol.files]
+        return FTPListResponse(url=request.url, status=200, entries=entries, request=request)
+
+    @staticmethod
+    def _build_file_response(_, request, protocol):
+        respcls = responsetypes.from_args(url=request.url)
+        protocol.close()
+        body = protocol.filename or protocol.body.read()
+        headers = {'local filename': protocol.filename or '', 'size': protocol.size}
+        return respcls(url=request.url, status=200, body=to_bytes(body), headers=headers)
+
+    @staticmethod
+    def _build_streamed_response(_, request, protocol):
+        request.meta['download_stream_file'] = protocol.close()
+        respcls = responsetypes.from_args(url=request.url)
+        return respcls(url=request.url, status=200, body=b'', headers={'size': protocol.size})
+
+    def _failed_stream(self, result, request, protocol):
+        protocol.body.discard()
+        return self._failed(result, request)
+
+    @classmethod
+    def parse_listing_entry(cls, line):
+        return FTPListingEntry(
+            name=line['filename'],
+            size=line['size'],
+            type=cls.ENTRY_TYPES.get(line['filetype'], 'other'),
+            mtime=cls.parse_listing_date(line['date'])
+        )
+
+    @staticmethod
+    def parse_listing_date(date):
+        # LIST shows the year for older files and the time of day for files of the last six months
+        try:
+            return datetime.strptime(date, '%b %d %Y')
+        except ValueError:
+            pass
+        try:
+            mtime = datetime.strptime(date, '%b %d %H:%M').replace(year=datetime.now().year)
+        except ValueError:
+            return None
+        return mtime.replace(year=mtime.year - 1) if mtime > datetime.now() else mtime
 
-    def _build_listing_response(self, result, request, protocol):
-        # encode ftp listings in TextResponse JSON structure
-        self.result = result
-        return TextResponse(url=request.url, status=200, body=dumps(protocol.files), encoding='utf-8')
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
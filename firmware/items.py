@@ -7,6 +7,8 @@ class FirmwareItem(Item):
     firmware_version = Field(default=None)
     device_class = Field(default=None)
     release_date = Field(default=None)
+    file_size = Field(default=None)
+    file_analysis = Field()
 
     files = Field()
     file_urls = Field()
@@ -0,0 +1,53 @@
+from bisect import bisect_left
+from time import perf_counter
+
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+
+TIMING_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+def record_timing(stats, key, seconds, spider=None, buckets=TIMING_BUCKETS):
+    # histogram buckets are stored as separate (non-cumulative) stats values, e.g. selenium/render_time/le_0.5
+    index = bisect_left(buckets, seconds)
+    bucket = 'inf' if index == len(buckets) else buckets[index]
+    stats.inc_value('{}/le_{}'.format(key, bucket), spider=spider)
+    stats.inc_value('{}/count'.format(key), spider=spider)
+    stats.inc_value('{}/sum'.format(key), seconds, spider=spider)
+
+
+class CallbackMetricsMiddleware(object):
+    # time spent in every spider callback and the items and requests it produced, e.g. callback/parse_firmware/time
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    def process_spider_output(self, response, result, spider):
+        key = 'callback/{}'.format(callback_name(response.request))
+        elapsed = 0.0
+        result = iter(result)
+        while True:
+            started = perf_counter()
+            try:
+                output = next(result)
+            except StopIteration:
+                break
+            finally:
+                elapsed += perf_counter() - started
+            self.stats.inc_value('{}/{}'.format(key, 'request_count' if isinstance(output, Request) else 'item_count'), spider=spider)
+            yield output
+        self.stats.inc_value('{}/response_count'.format(key), spider=spider)
+        record_timing(self.stats, '{}/time'.format(key), elapsed, spider=spider)
+
+
+def callback_name(request):
+    callback = request.callback if request is not None else None
+    if callback is None:
+        return 'parse'
+    return getattr(callback, '__name__', str(callback))
@@ -1,14 +1,25 @@
+import logging
+from hashlib import sha1
 from os.path import isfile
-from time import sleep
+from time import monotonic
 
-from scrapy import signals
-from scrapy.exceptions import IgnoreRequest
+from itemadapter import is_item
+from scrapy import Request, signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
 from scrapy.http import HtmlResponse
+from scrapy.utils.request import request_fingerprint
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.support.ui import WebDriverWait
+from twisted.internet import defer, threads
+
+from firmware.crawl_state import CrawlState
+from firmware.dedup import item_fingerprint
+from firmware.metrics import record_timing
+
+logger = logging.getLogger(__name__)
 
 
 class FirmwareSpiderMiddleware(object):
@@ -37,98 +48,243 @@ class FirmwareSpiderMiddleware(object):
         spider.logger.info('Spider opened: %s' % spider.name)
 
 
+class IncrementalCrawlMiddleware(object):
+    # drops items emitted by the last finished run. Requests are followed, a page that did not change can still lead to
+    # changed pages below it (e.g. an index whose subdirectory got new firmware). Only requests for directories whose
+    # date in the parent index (meta listing_date) covers the whole listing are pruned: listings that held files only
+    # in the last finished run and whose date did not change since. Items of unchanged pages are dropped without
+    # looking them up
+
+    def __init__(self, state_directory, stats):
+        self.state_directory = state_directory
+        self.stats = stats
+        self.state = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INCREMENTAL_CRAWL'):
+            raise NotConfigured
+        middleware = cls(crawler.settings.get('CRAWL_STATE_DIR', 'crawl_state'), crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_spider_output(self, response, result, spider):
+        outputs = list(result)
+        leaf = not any(isinstance(output, Request) for output in outputs)
+        page_unchanged = self.state.page_unchanged(
+            request_fingerprint(response.request), self.page_fingerprint(response, outputs, spider),
+            listing_date=response.meta.get('listing_date'), leaf=leaf
+        )
+        if page_unchanged:
+            self.stats.inc_value('incremental/unchanged_page_count', spider=spider)
+        for output in outputs:
+            if isinstance(output, Request) and output.meta.get('listing_date') and self.state.listing_unchanged(request_fingerprint(output), output.meta['listing_date']):
+                self.stats.inc_value('incremental/pruned_request_count', spider=spider)
+                continue
+            if is_item(output) and (page_unchanged or self.state.item_seen(item_fingerprint(output))):
+                self.stats.inc_value('incremental/unchanged_item_count', spider=spider)
+                continue
+            yield output
+
+    @staticmethod
+    def page_fingerprint(response, outputs, spider):
+        if hasattr(spider, 'page_fingerprint'):
+            return spider.page_fingerprint(response)
+        fingerprints = [request_fingerprint(o) if isinstance(o, Request) else item_fingerprint(o) for o in outputs if isinstance(o, Request) or is_item(o)]
+        return sha1('\n'.join(sorted(fingerprints)).encode('utf-8')).hexdigest()
+
+    def spider_opened(self, spider):
+        self.state = CrawlState(self.state_directory, spider.name)
+
+    def spider_closed(self, spider, reason):
+        # a partial run must not mark the pages it never got to as unchanged
+        if reason == 'finished':
+            self.state.commit()
+        self.state.close()
+
+
+class NetworkIdle(object):
+    # readiness condition which holds once no new resources were requested for quiet_period seconds
+
+    def __init__(self, quiet_period):
+        self.quiet_period = quiet_period
+        self.resource_count = None
+        self.last_change = None
+
+    def __call__(self, driver):
+        resource_count = driver.execute_script("return window.performance.getEntriesByType('resource').length;")
+        now = monotonic()
+        if resource_count != self.resource_count:
+            self.resource_count = resource_count
+            self.last_change = now
+            return False
+        return now - self.last_change >= self.quiet_period
+
+
 class FirmwareDownloaderMiddleware(object):
 
-    def __init__(self, driver_executable_path=None):
+    # browsers are started on the first selenium request, spiders without selenium requests never start one. At most
+    # pool_size renders run at a time, further requests wait on the semaphore in the reactor instead of holding a
+    # thread of the reactor pool, which also resolves DNS
+
+    def __init__(self, driver_executable_path=None, pool_size=1, timeout=15, network_idle=0.5, stats=None):
+        self.driver_executable_path = driver_executable_path
+        self.timeout = timeout
+        self.network_idle = network_idle
+        self.stats = stats
+        self.semaphore = defer.DeferredSemaphore(max(pool_size, 1))
+        self.drivers = list()
+        self.idle_drivers = list()
+
+    @staticmethod
+    def create_driver(driver_executable_path):
         options = webdriver.FirefoxOptions()
         options.headless = True
-
-        if isfile(driver_executable_path):
-            self.driver = webdriver.Firefox(options=options, executable_path=driver_executable_path)
-            self.wait = WebDriverWait(self.driver, 15)
-        else:
-            print('Selenium driver path not set correctly')
-            exit()
+        return webdriver.Firefox(options=options, executable_path=driver_executable_path)
 
     @classmethod
     def from_crawler(cls, crawler):
         driver_executable_path = crawler.settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH')
-        settings = cls(driver_executable_path=driver_executable_path)
+        settings = cls(
+            driver_executable_path=driver_executable_path,
+            pool_size=crawler.settings.getint('SELENIUM_DRIVER_POOL_SIZE', 1),
+            timeout=crawler.settings.getfloat('SELENIUM_RENDER_TIMEOUT', 15),
+            network_idle=crawler.settings.getfloat('SELENIUM_NETWORK_IDLE', 0.5),
+            stats=crawler.stats
+        )
         crawler.signals.connect(settings.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(settings.spider_closed, signal=signals.spider_closed)
 
         return settings
 
     def process_request(self, request, spider):
         if 'selenium' not in request.meta:
             return None
-        self.driver.get(request.url)
+        return self.semaphore.run(self.render_with_driver, request).addCallback(self.record_render_timing, spider)
+
+    def render_with_driver(self, request):
+        # a semaphore slot guarantees an idle driver or room for a new one
+        if self.idle_drivers:
+            acquired = defer.succeed(self.idle_drivers.pop())
+        else:
+            acquired = self.start_driver()
+        return acquired.addCallback(self.render_in_thread, request)
+
+    def start_driver(self):
+        if not isfile(self.driver_executable_path):
+            logger.error('Selenium driver path %s not set correctly', self.driver_executable_path)
+            return defer.fail(IgnoreRequest('Selenium driver not available'))
+        # starting a browser blocks for seconds, just like rendering
+        return threads.deferToThread(self.create_driver, self.driver_executable_path).addCallback(self.add_driver)
+
+    def add_driver(self, driver):
+        self.drivers.append(driver)
+        return driver
+
+    def render_in_thread(self, driver, request):
+        # rendering blocks until the page is loaded, so it is moved off the reactor thread
+        rendered = threads.deferToThread(self.render, driver, request)
+        return rendered.addBoth(self.release_driver, driver)
+
+    def release_driver(self, result, driver):
+        self.idle_drivers.append(driver)
+        return result
+
+    def render(self, driver, request):
+        started = monotonic()
+        driver.get(request.url)
+        loaded = monotonic()
+        timeout = request.meta.get('selenium_wait_timeout', self.timeout)
+        wait = WebDriverWait(driver, timeout, poll_frequency=0.1)
 
         if 'hp' in request.meta:
-            body = self.hp_processor()
+            body = self.hp_processor(driver, wait)
         else:
-            sleep(2)
-            body = str.encode(self.driver.page_source)
+            self.wait_until_ready(driver, wait, request, timeout)
+            body = str.encode(driver.page_source)
 
-        return HtmlResponse(self.driver.current_url, body=body, encoding='utf-8', request=request)
+        request.meta['selenium_wait_time'] = monotonic() - loaded
+        request.meta['selenium_render_time'] = monotonic() - started
+        return HtmlResponse(driver.current_url, body=body, encoding='utf-8', request=request)
 
-    def asus_processor(self):
+    def wait_until_ready(self, driver, wait, request, timeout):
         try:
-            self.wait.until(
-                expected_conditions.presence_of_element_located((By.LINK_TEXT, 'DOWNLOAD'))
-            )
+            wait.until(self.readiness_condition(request))
         except TimeoutException:
-            print('No DOWNLOAD Field accessible for {}\nStop processing of {}'.format(self.driver.current_url, self.driver.current_url))
-            raise IgnoreRequest
-        finally:
-            return str.encode(self.driver.page_source)
-
+            request.meta['selenium_wait_timed_out'] = True
+            logger.warning('Page %s not ready after %ss, using partial render', driver.current_url, timeout)
+
+    def readiness_condition(self, request):
+        if 'selenium_wait_css' in request.meta:
+            return expected_conditions.presence_of_element_located((By.CSS_SELECTOR, request.meta['selenium_wait_css']))
+        if 'selenium_wait_xpath' in request.meta:
+            return expected_conditions.presence_of_element_located((By.XPATH, request.meta['selenium_wait_xpath']))
+        if 'selenium_wait_js' in request.meta:
+            script = 'return Boolean({});'.format(request.meta['selenium_wait_js'])
+            return lambda driver: driver.execute_script(script)
+        return NetworkIdle(request.meta.get('selenium_wait_network_idle', self.network_idle))
+
+    def record_render_timing(self, response, spider):
+        if self.stats is None:
+            return response
+        record_timing(self.stats, 'selenium/render_time', response.meta['selenium_render_time'], spider=spider)
+        record_timing(self.stats, 'selenium/wait_time', response.meta['selenium_wait_time'], spider=spider)
+        if response.meta.get('selenium_wait_timed_out'):
+            self.stats.inc_value('selenium/wait_timeout_count', spider=spider)
+        return response
 
-    def hp_processor(self):
-        self.driver.fullscreen_window()
-        self.handle_404()
-        self.choose_country()
-        self.choose_os()
-        self.choose_version()
-        self.update_os_version()
+    def hp_processor(self, driver, wait):
+        driver.fullscreen_window()
+        self.handle_404(driver)
+        self.choose_country(wait)
+        self.choose_os(driver, wait)
+        self.choose_version(driver)
+        self.update_os_version(driver, wait)
 
-        return str.encode(self.driver.page_source)
+        return str.encode(driver.page_source)
 
-    def handle_404(self):
-        if 'Oops!' in self.driver.find_element_by_xpath('//h1').text or 'Error 404' in self.driver.page_source:
-            print(self.driver.current_url, ': 404 Page Not Found - no firmware to find here')
+    @staticmethod
+    def handle_404(driver):
+        if 'Oops!' in driver.find_element_by_xpath('//h1').text or 'Error 404' in driver.page_source:
+            logger.info('%s: 404 Page Not Found - no firmware to find here', driver.current_url)
             raise IgnoreRequest
 
-    def choose_country(self):
-        element = self.wait.until(expected_conditions.element_to_be_clickable((By.LINK_TEXT, 'Australia')))
+    @staticmethod
+    def choose_country(wait):
+        element = wait.until(expected_conditions.element_to_be_clickable((By.LINK_TEXT, 'Australia')))
         element.click()
         try:
-            self.wait.until(expected_conditions.invisibility_of_element_located(element))
+            wait.until(expected_conditions.invisibility_of_element_located(element))
         except TimeoutException:
             element.click()
             pass
 
-    def choose_os(self):
-        if self.wait.until(expected_conditions.element_to_be_clickable((By.ID, 'SelectDiffOS'))):
-            self.driver.find_element_by_id('SelectDiffOS').click()
-            self.wait.until(expected_conditions.element_to_be_clickable((By.ID, 'platform_dd_headerLink'))).click()
+    @staticmethod
+    def choose_os(driver, wait):
+        if wait.until(expected_conditions.element_to_be_clickable((By.ID, 'SelectDiffOS'))):
+            driver.find_element_by_id('SelectDiffOS').click()
+            wait.until(expected_conditions.element_to_be_clickable((By.ID, 'platform_dd_headerLink'))).click()
 
-            for element in self.driver.find_elements_by_xpath('//ul[@id="platform_dd_list"]/li'):
+            for element in driver.find_elements_by_xpath('//ul[@id="platform_dd_list"]/li'):
                 if element.text == 'OS Independent':
                     element.click()
                     break
 
-    def choose_version(self):
-        self.driver.find_element_by_id('versionnew_dd_headerValue').click()
-        for element in self.driver.find_elements_by_xpath(
+    @staticmethod
+    def choose_version(driver):
+        driver.find_element_by_id('versionnew_dd_headerValue').click()
+        for element in driver.find_elements_by_xpath(
                 '//ul[@id="versionnew_dd_list" and @class="dropdown-menu"]/li'):
             if element.text == 'OS Independent':
                 element.click()
                 break
 
-    def update_os_version(self):
-        element = self.driver.find_element_by_id('os-update')
+    @staticmethod
+    def update_os_version(driver, wait):
+        element = driver.find_element_by_id('os-update')
         element.click()
-        if self.wait.until(expected_conditions.invisibility_of_element_located(element)):
+        if wait.until(expected_conditions.invisibility_of_element_located(element)):
             pass
 
     def process_response(self, request, response, spider):
@@ -141,4 +297,5 @@ class FirmwareDownloaderMiddleware(object):
         spider.logger.info('Spider opened: %s' % spider.name)
 
     def spider_closed(self):
-        self.driver.quit()
+        for driver in self.drivers:
+            driver.quit()
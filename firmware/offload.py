@@ -0,0 +1,78 @@
+from concurrent.futures import ProcessPoolExecutor
+from inspect import isgenerator
+from multiprocessing import get_all_start_methods, get_context
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer
+
+# process pool of the running crawl, None parses inline in the calling thread
+executor = None
+
+
+def offload(function, response, *args, then=None):
+    # runs function(response, *args) in the process pool and passes its result to then in the reactor thread. Returns
+    # a Deferred for scrapy to wait on, or without a pool the result right away. function has to be importable, e.g. a
+    # static method of the spider, arguments and results have to be picklable
+    if executor is None:
+        result = materialize(function(response, *args))
+        return then(result) if then is not None else result
+    future = executor.submit(run_offloaded, function, type(response), response.url, response.body, response.encoding, args)
+    offloaded = deferred_from_future(future)
+    return offloaded.addCallback(then) if then is not None else offloaded
+
+
+def run_offloaded(function, response_class, url, body, encoding, args):
+    # the response is rebuilt in the worker from its body, lxml trees and selectors can not be pickled
+    return materialize(function(response_class(url=url, body=body, encoding=encoding), *args))
+
+
+def materialize(result):
+    return list(result) if isgenerator(result) else result
+
+
+def create_executor(workers):
+    # workers are forked from a clean server process, not from the crawler with its reactor and driver threads
+    context = get_context('forkserver') if 'forkserver' in get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def deferred_from_future(future):
+    # fires in the reactor thread once the process pool finished the task
+    from twisted.internet import reactor
+    deferred = defer.Deferred()
+
+    def done(finished):
+        if finished.exception() is not None:
+            reactor.callFromThread(deferred.errback, finished.exception())
+        else:
+            reactor.callFromThread(deferred.callback, finished.result())
+    future.add_done_callback(done)
+    return deferred
+
+
+class OffloadPool(object):
+    # provides the process pool for offloaded callbacks while a spider runs. OFFLOAD_WORKERS = 0 parses inline
+
+    def __init__(self, workers):
+        self.workers = workers
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        workers = crawler.settings.getint('OFFLOAD_WORKERS')
+        if workers <= 0:
+            raise NotConfigured
+        pool = cls(workers)
+        crawler.signals.connect(pool.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(pool.spider_closed, signal=signals.spider_closed)
+        return pool
+
+    def spider_opened(self, spider):
+        global executor
+        executor = create_executor(self.workers)
+
+    def spider_closed(self, spider):
+        global executor
+        if executor is not None:
+            executor.shutdown(wait=True)
+            executor = None
@@ -1,9 +1,185 @@
-from scrapy.pipelines.files import FilesPipeline
+import os
+import re
+from hashlib import sha256
+from io import BytesIO
+from os.path import exists, getmtime, join
+from time import monotonic
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.pipelines.files import FileException, FilesPipeline, FSFilesStore
+from scrapy.utils.python import to_unicode
+
+from firmware.handlers import discard_superseded_stream
+from firmware.metrics import record_timing
+from firmware.storage import BlobStore, FetchLedger
+
+CHUNK_SIZE = 1048576
+
+
+def sha256_file(path):
+    digest = sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FirmwareFilesStore(FSFilesStore):
+    # files found up to date report the same sha256 checksum as new downloads instead of the md5 of FSFilesStore
+
+    def stat_file(self, path, info):
+        absolute_path = self._get_filesystem_path(path)
+        try:
+            last_modified = getmtime(absolute_path)
+        except OSError:
+            return {}
+        return {'last_modified': last_modified, 'checksum': sha256_file(absolute_path)}
 
 
 class FirmwarePipeline(FilesPipeline):
-    def file_path(self, request, response=None, info=None):
-        return request.url.split('/')[-1]
+    STORE_SCHEMES = dict(FilesPipeline.STORE_SCHEMES, **{'': FirmwareFilesStore, 'file': FirmwareFilesStore})
+
+    def __init__(self, store_uri, download_func=None, settings=None):
+        super().__init__(store_uri, download_func=download_func, settings=settings)
+        self.blobs = BlobStore(self.store.basedir) if isinstance(self.store, FSFilesStore) else None
+        self.ledger = self.open_ledger(settings)
+
+    def open_ledger(self, settings):
+        ledger_path = settings.get('FILES_LEDGER') if settings is not None else None
+        if ledger_path is None and self.blobs is not None:
+            ledger_path = join(self.store.basedir, 'ledger.sqlite')
+        return FetchLedger(ledger_path) if ledger_path else None
+
+    def close_spider(self, spider):
+        if self.ledger is not None:
+            self.ledger.close()
+
+    def get_media_requests(self, item, info):
+        # with a blob store, files are streamed to a temporary file next to the blobs instead of being buffered in memory
+        meta = {'download_stream': self.blobs.partial_directory} if self.blobs is not None else {}
+        adapter = ItemAdapter(item)
+        urls = adapter.get(self.files_urls_field, [])
+        # expected sizes for the download budget, None if the listing did not tell
+        sizes = dict(zip(urls, adapter.get('file_size') or []))
+        return [Request(url, headers=self.conditional_headers(url), meta=dict(meta, download_size=sizes.get(url))) for url in urls]
+
+    def conditional_headers(self, url):
+        entry = self.ledger.get(url) if self.ledger is not None else None
+        if entry is None or (self.blobs is not None and not self.blobs.has_blob(entry['digest'])):
+            return dict()
+        return FetchLedger.conditional_headers(entry)
+
+    def media_to_download(self, request, info, *, item=None):
+        return super().media_to_download(request, info, item=item).addCallback(self.store_checksum)
+
+    def store_checksum(self, result):
+        # remote stores only know the md5 (ETag) of a stored file, it is kept apart from the sha256 checksum
+        if result is not None and not isinstance(self.store, FirmwareFilesStore):
+            result['md5'], result['checksum'] = result.get('checksum'), None
+        return result
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        streamed = self.pop_streamed_file(response, request)
+        try:
+            if response.status == 304 and self.ledger is not None and self.ledger.get(request.url) is not None:
+                return self.unchanged_file(request, info, item)
+
+            if streamed is not None and response.status == 200:
+                result = self.streamed_file_downloaded(response, streamed, request, info, item)
+            else:
+                result = super().media_downloaded(response, request, info, item=item)
+        finally:
+            # rejected or unused downloads
+            if streamed is not None and exists(streamed['path']):
+                os.unlink(streamed['path'])
+
+        if self.ledger is not None:
+            self.ledger.record(
+                url=request.url,
+                etag=self.header_value(response, 'ETag'),
+                last_modified=self.header_value(response, 'Last-Modified'),
+                size=streamed['size'] if streamed is not None else len(response.body),
+                digest=result['checksum'],
+                path=result['path']
+            )
+        return result
+
+    def media_failed(self, failure, request, info):
+        # the file of a streamed response that was dropped on its way to the pipeline
+        discard_superseded_stream(request)
+        return super().media_failed(failure, request, info)
+
+    @staticmethod
+    def pop_streamed_file(response, request):
+        # a retried download arrives with a copy of the media request, only its meta holds the file of the last attempt
+        downloaded = response.request if response.request is not None else request
+        if downloaded is not request:
+            discard_superseded_stream(request)
+        return downloaded.meta.pop('download_stream_file', None)
+
+    def streamed_file_downloaded(self, response, streamed, request, info, item):
+        expected_size = self.header_value(response, 'Content-Length')
+        if {'partial', 'dataloss'} & set(response.flags) or (expected_size is not None and int(expected_size) != streamed['size']):
+            raise FileException('size-mismatch: received {} of {} bytes'.format(streamed['size'], expected_size))
+        if not streamed['size']:
+            raise FileException('empty-content')
+
+        self.inc_stats(info.spider, 'downloaded')
+        info.spider.crawler.stats.inc_value('file_bytes/streamed', streamed['size'], spider=info.spider)
+        path = self.file_path(request, response=response, info=info, item=item)
+        started = monotonic()
+        if not self.blobs.persist_file(streamed['sha256'], streamed['path']):
+            info.spider.crawler.stats.inc_value('file_status_count/deduplicated', spider=info.spider)
+        self.blobs.link(path, streamed['sha256'], request.url)
+        record_timing(info.spider.crawler.stats, 'pipeline/write_time', monotonic() - started, spider=info.spider)
+        return {
+            'url': request.url, 'path': path, 'checksum': streamed['sha256'], 'status': 'downloaded',
+            'size': streamed['size'], 'sha1': streamed['sha1'], 'md5': streamed['md5'],
+        }
+
+    @staticmethod
+    def header_value(response, name):
+        value = response.headers.get(name)
+        return to_unicode(value) if value else None
+
+    def unchanged_file(self, request, info, item):
+        entry = self.ledger.get(request.url)
+        path = self.file_path(request, info=info, item=item)
+        if self.blobs is not None and not exists(join(self.store.basedir, *path.split('/'))):
+            self.blobs.link(path, entry['digest'], request.url)
+        self.inc_stats(info.spider, 'unchanged')
+        return {'url': request.url, 'path': path, 'checksum': entry['digest'], 'status': 'uptodate'}
+
+    def file_path(self, request, response=None, info=None, *, item=None):
+        meta_data = ItemAdapter(item) if item is not None else dict()
+        return '/'.join([
+            self.path_component(meta_data.get('vendor')),
+            self.path_component(meta_data.get('device_name')),
+            self.path_component(meta_data.get('firmware_version')),
+            request.url.split('/')[-1]
+        ])
+
+    @staticmethod
+    def path_component(value):
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if not value:
+            return 'unknown'
+        return re.sub(r'[^\w.\-]+', '_', str(value)).strip('._') or 'unknown'
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        started = monotonic()
+        path = self.file_path(request, response=response, info=info, item=item)
+        checksum = sha256(response.body).hexdigest()
+        if self.blobs is None:
+            self.store.persist_file(path, BytesIO(response.body), info)
+        else:
+            if not self.blobs.persist_blob(checksum, response.body):
+                info.spider.crawler.stats.inc_value('file_status_count/deduplicated', spider=info.spider)
+            self.blobs.link(path, checksum, request.url)
+        record_timing(info.spider.crawler.stats, 'pipeline/write_time', monotonic() - started, spider=info.spider)
+        return checksum
 
 
 class HpPipeline(FirmwarePipeline):
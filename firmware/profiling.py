@@ -0,0 +1,154 @@
+import cProfile
+import io
+import os
+import pstats
+from functools import wraps
+from random import random
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from firmware.metrics import callback_name
+
+
+class CProfileRecorder(object):
+    # deterministic profile of every call, accumulated over all profiled invocations
+
+    extension = 'prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats('{}.{}'.format(path, self.extension))
+        summary = io.StringIO()
+        pstats.Stats(self.profile, stream=summary).sort_stats('cumulative').print_stats(40)
+        with open(path + '.txt', 'w') as summary_file:
+            summary_file.write(summary.getvalue())
+
+
+class PyinstrumentRecorder(object):
+    # statistical profile, cheap enough to keep on for whole crawls. Needs pip install pyinstrument
+
+    extension = 'html'
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler()
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def dump(self, path):
+        with open('{}.{}'.format(path, self.extension), 'w') as report:
+            report.write(self.profiler.output_html())
+        with open(path + '.txt', 'w') as summary_file:
+            summary_file.write(self.profiler.output_text())
+
+
+RECORDERS = {
+    'cprofile': CProfileRecorder,
+    'pyinstrument': PyinstrumentRecorder,
+}
+
+
+class ProfilingMiddleware(object):
+    # profiles the spider callbacks and the PROFILE_PIPELINE_METHODS of the item pipelines, one profile per callback
+    # and method, which are written to PROFILE_DIR/<spider name>/ when the spider closes. PROFILE_SAMPLE_RATE is the
+    # share of callback invocations that are profiled. Without PROFILE_ENABLED nothing is wrapped at all
+
+    def __init__(self, crawler, recorder, directory, sample_rate=1.0, callbacks=None, pipeline_methods=()):
+        self.crawler = crawler
+        self.recorder = recorder
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.callbacks = set(callbacks) if callbacks else None
+        self.pipeline_methods = pipeline_methods
+        self.recorders = dict()
+        # profilers can not be nested, a pipeline method called while a callback is profiled counts to the callback
+        self.active = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PROFILE_ENABLED'):
+            raise NotConfigured
+        profiler = crawler.settings.get('PROFILER', 'cprofile')
+        if profiler not in RECORDERS:
+            raise NotConfigured('PROFILER has to be one of {}'.format(', '.join(sorted(RECORDERS))))
+        middleware = cls(
+            crawler,
+            recorder=RECORDERS[profiler],
+            directory=crawler.settings.get('PROFILE_DIR', 'profiles'),
+            sample_rate=crawler.settings.getfloat('PROFILE_SAMPLE_RATE', 1.0),
+            callbacks=crawler.settings.getlist('PROFILE_CALLBACKS'),
+            pipeline_methods=crawler.settings.getlist('PROFILE_PIPELINE_METHODS', ['file_path', 'item_completed'])
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_spider_output(self, response, result, spider):
+        name = callback_name(response.request)
+        if (self.callbacks is not None and name not in self.callbacks) or random() >= self.sample_rate:
+            return result
+        return self.profile_output(name, result)
+
+    def profile_output(self, name, result):
+        result = iter(result)
+        while True:
+            started = self.start(name)
+            try:
+                output = next(result)
+            except StopIteration:
+                break
+            finally:
+                if started:
+                    self.stop()
+            yield output
+
+    def start(self, name):
+        if self.active is not None:
+            return False
+        if name not in self.recorders:
+            self.recorders[name] = self.recorder()
+        self.active = self.recorders[name]
+        self.active.start()
+        return True
+
+    def stop(self):
+        self.active.stop()
+        self.active = None
+
+    def profiled(self, name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = self.start(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if started:
+                    self.stop()
+        return wrapper
+
+    def spider_opened(self, spider):
+        for pipeline in self.crawler.engine.scraper.itemproc.middlewares:
+            for method_name in self.pipeline_methods:
+                if hasattr(pipeline, method_name):
+                    name = '{}.{}'.format(type(pipeline).__name__, method_name)
+                    setattr(pipeline, method_name, self.profiled(name, getattr(pipeline, method_name)))
+
+    def spider_closed(self, spider):
+        directory = os.path.join(self.directory, spider.name)
+        os.makedirs(directory, exist_ok=True)
+        for name, recorder in self.recorders.items():
+            recorder.dump(os.path.join(directory, name))
+        spider.logger.info('Wrote %d profiles to %s', len(self.recorders), directory)
@@ -7,6 +7,10 @@ NEWSPIDER_MODULE = 'firmware.spiders'
 
 FILES_STORE = 'firmware_files/'
 
+# SQLite ledger of ETag/Last-Modified/size/digest per file url, used for conditional re-downloads.
+# Defaults to FILES_STORE/ledger.sqlite for filesystem stores
+# FILES_LEDGER = 'firmware_files/ledger.sqlite'
+
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
@@ -17,20 +21,121 @@ LOG_LEVEL = 'DEBUG'
 FTP_USER = 'anonymous'
 FTP_PASSWORD = 'guest'
 
+# Logged in FTP control connections are reused across requests. Connections idle for FTP_IDLE_TIMEOUT seconds are closed
+FTP_MAX_CONNECTIONS_PER_HOST = 4
+FTP_IDLE_TIMEOUT = 30
+
+# http(s) and ftp requests with meta download_stream are written to disk while they arrive instead of being buffered
 DOWNLOAD_HANDLERS = {
-    'ftp': 'firmware.handlers.FTPHandler'
+    'ftp': 'firmware.handlers.FTPHandler',
+    'http': 'firmware.handlers.StreamingHTTPDownloadHandler',
+    'https': 'firmware.handlers.StreamingHTTPDownloadHandler',
 }
 
+SPIDER_MIDDLEWARES = {
+    'firmware.middlewares.IncrementalCrawlMiddleware': 950,
+    'firmware.metrics.CallbackMetricsMiddleware': 990,
+    'firmware.profiling.ProfilingMiddleware': 995,
+}
+
+# Crawl metrics: stats, pages/items/bytes per second and queue depths are written every METRICS_INTERVAL seconds to
+# METRICS_FILE (%(name)s is the spider name) and, with METRICS_PORT, served in the Prometheus text format. Timings of
+# callbacks, downloads, FTP listings, selenium renders and pipeline writes are exported as histograms
+METRICS_ENABLED = False
+METRICS_INTERVAL = 10
+METRICS_FILE = 'metrics/%(name)s.json'
+METRICS_PORT = 0
+
+EXTENSIONS = {
+    'firmware.extensions.CrawlMetrics': 500,
+    'firmware.offload.OffloadPool': 0,
+}
+
+# Parse the large GPL listings (netgear_gpl, dlink_gpl) and the linksys version pages in OFFLOAD_WORKERS processes
+# instead of the reactor thread, 0 parses them inline
+OFFLOAD_WORKERS = 0
+
+# Profile the spider callbacks (all, or the ones in PROFILE_CALLBACKS) and the PROFILE_PIPELINE_METHODS of the item
+# pipelines with PROFILER cprofile or pyinstrument. PROFILE_SAMPLE_RATE of the callback invocations are profiled, the
+# profiles are written to PROFILE_DIR/<spider name>/ when the spider closes
+PROFILE_ENABLED = False
+PROFILER = 'cprofile'
+PROFILE_DIR = 'profiles/'
+PROFILE_SAMPLE_RATE = 1.0
+PROFILE_CALLBACKS = []
+PROFILE_PIPELINE_METHODS = ['file_path', 'item_completed']
+
+# Only emit items that are new since the last finished run. File listings whose date in the parent index did not change
+# (AVM, AVM GPL) are not fetched again, all other pages are still followed. The state of every spider is kept in
+# CRAWL_STATE_DIR/<spider name>.sqlite
+INCREMENTAL_CRAWL = False
+CRAWL_STATE_DIR = 'crawl_state/'
+
+# Drop items emitted earlier in the same run. With DEDUP_PERSIST, items of earlier runs are dropped as well, their
+# fingerprints are kept in CRAWL_STATE_DIR/<spider name>.seen.sqlite
+DEDUP_PERSIST = False
+
 DOWNLOADER_MIDDLEWARES = {
+    'firmware.throttle.AdaptiveThrottleMiddleware': 500,
     'firmware.middlewares.FirmwareDownloaderMiddleware': 543,
+    'firmware.budget.DownloadBudgetMiddleware': 900,
+}
+
+# Firmware files are downloaded while less than DOWNLOAD_BUDGET_BYTES are in flight, smallest first. Files of at least
+# DOWNLOAD_LARGE_FILE_SIZE bytes share DOWNLOAD_LARGE_FILE_CONCURRENCY separate slots. Sizes are taken from the
+# file_size of the items, unknown sizes are requested with HEAD (DOWNLOAD_BUDGET_PROBE) or assumed to be
+# DOWNLOAD_BUDGET_UNKNOWN_SIZE. 0 disables the budget
+DOWNLOAD_BUDGET_BYTES = 1073741824  # 1GiB
+DOWNLOAD_LARGE_FILE_SIZE = 134217728  # 128MiB
+DOWNLOAD_LARGE_FILE_CONCURRENCY = 1
+DOWNLOAD_BUDGET_PROBE = True
+DOWNLOAD_BUDGET_UNKNOWN_SIZE = 33554432  # 32MiB
+
+# Concurrency and delay per domain grow while responses come back within THROTTLE_TARGET_LATENCY seconds and are halved
+# respectively doubled on THROTTLE_BACKOFF_HTTP_CODES (honouring Retry-After) and download errors. The limits are taken
+# from the profile of the longest matching domain suffix, missing values from 'default'. Selenium renders are held to
+# the same limits
+THROTTLE_ENABLED = True
+THROTTLE_TARGET_LATENCY = 2.0
+THROTTLE_BACKOFF_HTTP_CODES = [429, 503]
+THROTTLE_PROFILES = {
+    'default': {'start_concurrency': 2, 'min_concurrency': 1, 'max_concurrency': 8, 'delay': 0.0, 'max_delay': 60.0},
+    # ASUS throttles aggressively and is crawled with selenium
+    'asus.com': {'start_concurrency': 1, 'max_concurrency': 2, 'delay': 1.0},
+    'hp.com': {'start_concurrency': 1, 'max_concurrency': 2, 'delay': 1.0},
+    # GPL archives of up to 2GiB, a few connections saturate the bandwidth
+    'osp.avm.de': {'max_concurrency': 4},
+    'dlink-gpl.s3.amazonaws.com': {'max_concurrency': 4},
+    'ftp.dlink.de': {'max_concurrency': 4},
 }
 
 ITEM_PIPELINES = {
+    'firmware.dedup.DuplicatesPipeline': 0,
     'firmware.pipelines.HpPipeline': 300,
     'firmware.pipelines.AsusPipeline': 300,
     'firmware.pipelines.AvmPipeline': 1,
     'firmware.pipelines.LinksysPipeline': 1,
+    'firmware.analysis.FirmwareAnalysisPipeline': 800,
 }
 
+# Attach magic type, entropy, digests and archive members (without extracting) of every downloaded file to the items
+# as file_analysis. Files are analyzed in ANALYSIS_WORKERS processes, entropy is estimated from ANALYSIS_ENTROPY_SAMPLE
+# bytes per file and at most ANALYSIS_MAX_MEMBERS archive members are listed
+ANALYSIS_ENABLED = False
+ANALYSIS_WORKERS = 2
+ANALYSIS_ENTROPY_SAMPLE = 16777216  # 16MiB
+ANALYSIS_MAX_MEMBERS = 1000
+
 # Enable to run with Selenium. Set to the driver executable path
 SELENIUM_DRIVER_EXECUTABLE_PATH = '/usr/local/bin/geckodriver'
+
+# Number of headless browsers rendering selenium requests in parallel, started on the first selenium request.
+# Renders run in the reactor thread pool, so REACTOR_THREADPOOL_MAXSIZE has to be larger than the pool
+SELENIUM_DRIVER_POOL_SIZE = 4
+REACTOR_THREADPOOL_MAXSIZE = 10
+
+# Seconds a selenium render waits for its readiness condition (request.meta selenium_wait_css, selenium_wait_xpath,
+# selenium_wait_js or selenium_wait_network_idle). Without a condition, a page is ready once no further resources
+# were requested for SELENIUM_NETWORK_IDLE seconds
+SELENIUM_RENDER_TIMEOUT = 15
+SELENIUM_NETWORK_IDLE = 0.5
@@ -1,11 +1,10 @@
 import re
 from datetime import datetime
-from random import uniform
-from time import sleep
 
 from scrapy import Request, Spider
 from scrapy.loader import ItemLoader
 
+from firmware.classifiers import PrefixClassifier
 from firmware.items import FirmwareItem
 
 
@@ -28,6 +27,7 @@ class AsusSpider(Spider):
         rs='Server',
         ro='Router (Gaming)'  # ROG Rapture
     )
+    device_classifier = PrefixClassifier(device_dictionary, lower=True)
     base_url = 'https://www.asus.com/de/Networking-IoT-Servers/{}/All-series/filter/'
     start_urls = [
         base_url.format('WiFi-Routers'),
@@ -35,10 +35,8 @@ class AsusSpider(Spider):
         base_url.format('WiFi-6')
     ]
 
-    custom_settings = {
-        'DOWNLOAD_DELAY': 1.0,
-        'CONCURRENT_REQUESTS_PER_IP': 1,
-        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
+    XPATH = {
+        'file_urls': '//div[contains(@class,"ProductSupportDriverBIOS__contentRight")]//a',
     }
 
     def parse(self, response, **kwargs):
@@ -51,9 +49,8 @@ class AsusSpider(Spider):
         for url_redirect in url_redirects:
             if url_redirect[-1] != '/':
                 continue
-            # selenium does not adhere to throttling settings, which is why we uniformly sleep to evade potential server-site throttling
-            sleep(uniform(0.5, 2.0))
-            yield Request(url=f'{url_redirect}HelpDesk_BIOS/', callback=self.parse_firmware, meta={'selenium': True})
+            yield Request(url=f'{url_redirect}HelpDesk_BIOS/', callback=self.parse_firmware,
+                          meta={'selenium': True, 'selenium_wait_xpath': self.XPATH['file_urls']})
 
     def parse_firmware(self, response):
         meta_data = self.prepare_meta_data(response)
@@ -82,8 +79,7 @@ class AsusSpider(Spider):
             'device_name': product_name,
             'firmware_version': self.extract_firmware_version(response),
             'device_class': self.extract_device_class(response.url, product_name),
-            'file_urls':
-                response.xpath('//div[contains(@class,"ProductSupportDriverBIOS__contentRight")]//a/@href').get()
+            'file_urls': response.xpath(self.XPATH['file_urls'] + '/@href').get()
         }
 
     @staticmethod
@@ -97,8 +93,9 @@ class AsusSpider(Spider):
         return datetime.strptime(release_date.strip(), '%Y/%m/%d').date().isoformat() if release_date else None
 
     def extract_device_class(self, response_url, product_name):
-        if product_name[:2].lower() in self.device_dictionary:
-            return self.device_dictionary[product_name[:2].lower()]
+        device_class = self.device_classifier(product_name)
+        if device_class is not None:
+            return device_class
         if 'Motherboards' in response_url:
             return 'Motherboard'
         if 'Commercial' in response_url:
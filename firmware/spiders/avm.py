@@ -1,11 +1,15 @@
+import re
 from calendar import month_abbr
-from re import search
-from typing import Generator, Union
+from functools import lru_cache
+from hashlib import sha1
+from typing import Generator, List, Union
 
 from scrapy import Request, Spider
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.classifiers import PrefixClassifier
+from firmware.extraction import IndexEntry, parse_index
 from firmware.items import FirmwareItem
 
 
@@ -21,6 +25,15 @@ class AvmSpider(Spider):
         'http://download.avm.de/fritzpowerline/'
     ]
 
+    VERSION_RE = re.compile(r'FRITZ\.(Box|Powerline|Repeater)_(\w+)(\.(\w{2}-)+\w{2}\.)?([-\.])?(.*)\.image')
+
+    device_classifier = PrefixClassifier({
+        'fritzrepeater': 'Repeater',
+        'fritzwlan-repeater': 'Repeater',
+        'fritzwlan-usb': 'Wifi-Stick',
+        'fritzpowerline': 'PLC Adapter',
+    }, default='Router')
+
     def parse(self, response: Response) -> Generator[Request, None, None]:
         for product_url in self.extract_links(response=response, ignore=('beta', 'tools', 'license', '..')):
             yield Request(url=product_url, callback=self.parse_product)
@@ -30,14 +43,19 @@ class AvmSpider(Spider):
         if path[-1] == 'fritz.os':
             yield from self.parse_firmware(response=response, device_name=path[-3])
         else:
-            for sub_directory in self.extract_links(response=response, ignore=('recover', '..')):
-                yield Request(url=response.urljoin(sub_directory), callback=self.parse_product)
+            for entry in parse_index(response):
+                if entry.href.startswith(('recover', '..')):
+                    continue
+                # the date of the directory lets incremental crawls skip firmware listings that did not change
+                meta = {'listing_date': self.convert_date(entry.date)} if entry.date else {}
+                yield Request(url=response.urljoin(entry.href), callback=self.parse_product, meta=meta)
 
     def parse_firmware(self, response: Response, device_name: str) -> Generator[FirmwareItem, None, None]:
-        release_dates = self.extract_dates(response)
-        for index, file_url in enumerate(self.extract_links(response=response, ignore='..')):
-            if file_url.endswith('.image'):
-                yield from self.prepare_item_pipeline(meta_data=self.prepare_meta_data(device_name=device_name, release_date=release_dates[index], file_url=file_url))
+        for entry in parse_index(response):
+            if entry.href.endswith('.image'):
+                release_date = self.convert_date(entry.date) if entry.date else '01-01-1970'
+                meta_data = self.prepare_meta_data(device_name=device_name, release_date=release_date, file_url=response.urljoin(entry.href), file_size=entry.size)
+                yield from self.prepare_item_pipeline(meta_data=meta_data)
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
@@ -48,40 +66,36 @@ class AvmSpider(Spider):
         loader.add_value('device_class', meta_data['device_class'])
         loader.add_value('firmware_version', meta_data['firmware_version'])
         loader.add_value('release_date', meta_data['release_date'])
+        loader.add_value('file_size', meta_data.get('file_size'))
         yield loader.load_item()
 
-    def prepare_meta_data(self, device_name: str, release_date: str, file_url: str) -> dict:
+    def prepare_meta_data(self, device_name: str, release_date: str, file_url: str, file_size: Union[int, None] = None) -> dict:
         return {
             'file_urls': [file_url],
             'vendor': 'AVM',
             'device_name': device_name,
             'firmware_version': self.extract_version(firmware=file_url.split('/')[-1], product_specifier=device_name),
             'device_class': self.map_device_class(product=device_name),
-            'release_date': release_date
+            'release_date': release_date,
+            'file_size': file_size,
         }
 
     @staticmethod
     def map_device_class(product: str) -> str:
-        if product.startswith(('fritzrepeater', 'fritzwlan-repeater')):
-            return 'Repeater'
-        if product.startswith('fritzwlan-usb'):
-            return 'Wifi-Stick'
-        if product.startswith('fritzpowerline'):
-            return 'PLC Adapter'
-        return 'Router'
+        return AvmSpider.device_classifier(product)
 
     @staticmethod
     def extract_links(response: Response, ignore: Union[str, tuple]) -> list:
-        return [response.urljoin(p) for p in response.xpath('//a/@href').extract() if not p.startswith(ignore)]
+        return [response.urljoin(entry.href) for entry in parse_index(response) if not entry.href.startswith(ignore)]
 
-    def extract_dates(self, response: Response) -> list:
-        release_dates = list()
-        for text in response.xpath('//pre/text()').extract():
-            match = search(r'(\d{2}-\w{3}-\d{4})', text)
-            if match:
-                release_dates.append(self.convert_date(match.group(1)))
+    @staticmethod
+    def page_fingerprint(response: Response) -> str:
+        return AvmSpider.index_fingerprint(list(parse_index(response)))
 
-        return release_dates
+    @staticmethod
+    def index_fingerprint(entries: List[IndexEntry]) -> str:
+        # a listing changes with any of its links, dates or sizes
+        return sha1(repr(entries).encode('utf-8')).hexdigest()
 
     @staticmethod
     def convert_date(date: str) -> str:
@@ -95,22 +109,22 @@ class AvmSpider(Spider):
         try:
             if 'fritz.powerline' in firmware:
                 return self.extract_powerline_version(firmware, product_specifier)
-            return search(r'FRITZ\.(Box|Powerline|Repeater)_(\w+)(\.(\w{2}-)+\w{2}\.)?([-\.])?(.*)\.image', firmware).group(6)
+            return AvmSpider.VERSION_RE.search(firmware).group(6)
         except (AttributeError, IndexError, ValueError):
             return '0.0'
 
     def extract_powerline_version(self, firmware, product_specifier):
-        for hardware_number in self.generate_permutations(array=product_specifier.split('-')[1:], prefix='', index=0):
-            matches = search(r'(?:' + r''.join(hardware_number.upper()) + r')_(.*).image', firmware)
-            if matches:
-                return matches.group(1).replace('_', '.')
+        matches = AvmSpider.powerline_pattern(product_specifier).search(firmware)
+        if matches:
+            return matches.group(1).replace('_', '.')
         raise ValueError('No version found in firmware string')
 
-    def generate_permutations(self, array: list, prefix: str, index: int) -> Generator[str, None, None]:
-        if index < len(array) - 1:
-            for result in self.generate_permutations(array=array, prefix=prefix + array[index] + '_', index=index + 1):
-                yield result
-            for result in self.generate_permutations(array=array, prefix=prefix + array[index], index=index + 1):
-                yield result
-        else:
-            yield prefix + array[index]
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def powerline_pattern(product_specifier: str) -> re.Pattern:
+        # the hardware number in the file name joins the segments of the product specifier with or without
+        # underscores, e.g. fritzpowerline-1000a-e matches 1000A_E and 1000AE. Compiled once per product directory
+        hardware_number = product_specifier.split('-')[1:]
+        if not hardware_number:
+            raise ValueError('No hardware number in product specifier')
+        return re.compile('_?'.join(re.escape(segment.upper()) for segment in hardware_number) + r'_(.*)\.image')
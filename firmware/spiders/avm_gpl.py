@@ -1,11 +1,12 @@
+import re
 from datetime import datetime
-from re import search, sub
-from typing import Generator, List, Tuple
+from typing import Generator, List, Tuple, Union
 
 from scrapy import Request, Spider
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.extraction import IndexEntry, parse_index
 from firmware.items import FirmwareItem
 from firmware.spiders.avm import AvmSpider
 
@@ -26,25 +27,25 @@ class AVMGPL(Spider):
 
     download_maxsize = 2147483648  # 2GiB
 
-    XPATH = {
-        'links': '//a[not(contains(@href, ".."))]/@href',
-        'meta': '//a[not(contains(@href, ".."))]/following-sibling::text()',
-    }
+    VERSION_RE = re.compile(r'(\d{1,2}\.\d{2})')
+    ARCHIVE_RE = re.compile(r'\.(tar|gz|bz2)')
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
-        links = AVMGPL.extract_links(response)
-        infos = AVMGPL.extract_link_info(response)
-
-        folders, gpl_archives = AVMGPL.separate_folders_from_gpl_archives(links, infos)
+        folders, gpl_archives = AVMGPL.separate_folders_from_gpl_archives(AVMGPL.extract_entries(response))
 
         for archive in gpl_archives:
             yield from AVMGPL.parse_archive(archive)
 
         for folder in folders:
-            yield Request(url=folder[0], callback=self.parse)
+            # the date of the folder lets incremental crawls skip archive listings that did not change
+            yield Request(url=folder.href, callback=self.parse, meta={'listing_date': folder.date} if folder.date else {})
+
+    @staticmethod
+    def page_fingerprint(response: Response) -> str:
+        return AvmSpider.index_fingerprint(AVMGPL.extract_entries(response))
 
     @staticmethod
-    def parse_archive(archive: Tuple[str, Tuple[str, int, bool]]) -> Generator[FirmwareItem, None, None]:
+    def parse_archive(archive: IndexEntry) -> Generator[FirmwareItem, None, None]:
         meta_data = AVMGPL.prepare_meta_data(archive)
         yield from AVMGPL.prepare_item_pipeline(meta_data)
 
@@ -57,13 +58,14 @@ class AVMGPL(Spider):
         loader.add_value('device_class', meta_data['device_class'])
         loader.add_value('firmware_version', meta_data['firmware_version'])
         loader.add_value('release_date', meta_data['release_date'])
+        loader.add_value('file_size', meta_data['file_size'])
         yield loader.load_item()
 
     @staticmethod
-    def prepare_meta_data(archive: Tuple[str, Tuple[str, int, bool]]) -> dict:
-        file_url = archive[0]
+    def prepare_meta_data(archive: IndexEntry) -> dict:
+        file_url = archive.href
         device_name = file_url.split('/')[-1]
-        firmware_version = search(r'(\d{1,2}\.\d{2})', device_name)
+        firmware_version = AVMGPL.VERSION_RE.search(device_name)
 
         return {
             'file_urls': [file_url],
@@ -71,39 +73,26 @@ class AVMGPL(Spider):
             'device_name': device_name,
             'firmware_version': '0.0' if firmware_version is None else firmware_version.group(1),
             'device_class': AvmSpider.map_device_class(device_name),
-            'release_date': archive[1][0],
+            'release_date': archive.date,
+            'file_size': archive.size,
         }
 
     @staticmethod
-    def separate_folders_from_gpl_archives(links: List[str], infos: List[Tuple[str, int, bool]]):
-        all_entries = list(zip(links, infos))
-
-        folders = [e for e in all_entries if not e[1][2]]
-        archives = [e for e in all_entries if e[1][2] and search(r'\.(tar|gz|bz2)', e[0])]
+    def separate_folders_from_gpl_archives(entries: List[IndexEntry]) -> Tuple[List[IndexEntry], List[IndexEntry]]:
+        folders = [entry for entry in entries if entry.is_dir]
+        archives = [entry for entry in entries if not entry.is_dir and AVMGPL.ARCHIVE_RE.search(entry.href)]
 
         return folders, archives
 
     @staticmethod
-    def extract_links(response: Response) -> List[str]:
-        return [response.urljoin(p) for p in response.xpath(AVMGPL.XPATH['links']).extract()]
+    def extract_entries(response: Response) -> List[IndexEntry]:
+        # absolute links and dd-mm-yyyy dates, without the parent directory
+        return [entry._replace(href=response.urljoin(entry.href), date=AVMGPL.convert_date(entry.date))
+                for entry in parse_index(response) if '..' not in entry.href]
 
     @staticmethod
-    def extract_link_info(response: Response) -> List[Tuple[str, int, bool]]:
-        infos = list()
-        for meta in response.xpath(AVMGPL.XPATH['meta']).extract():
-            clean = sub(r' +', ' ', meta.strip())
-
-            the_date, _, the_size = clean.split(' ')
-            try:
-                the_date = datetime.strptime(the_date, '%d-%b-%Y').strftime('%d-%m-%Y')
-            except ValueError:
-                pass
-
-            is_file_link = True
-            try:
-                the_size = int(the_size)
-            except ValueError:
-                the_size = -1
-                is_file_link = False
-            infos.append((the_date, the_size, is_file_link))
-        return infos
+    def convert_date(date: Union[str, None]) -> Union[str, None]:
+        try:
+            return datetime.strptime(date, '%d-%b-%Y').strftime('%d-%m-%Y')
+        except (TypeError, ValueError):
+            return date
@@ -0,0 +1,78 @@
+import re
+from typing import Generator, List, Union
+
+from scrapy.loader import ItemLoader
+
+from firmware.custom_requests import FTPListRequest
+from firmware.custom_responses import FTPListingEntry, FTPListResponse
+from firmware.custom_spiders import FTPSpider
+from firmware.ftp.dlink import FTPClass
+from firmware.items import FirmwareItem
+
+
+class DLinkSpider(FTPSpider):
+    name = 'dlink'
+
+    allowed_domains = ['ftp.dlink.de']
+
+    start_urls = ['ftp://ftp.dlink.de/']
+
+    FIRMWARE_RE = re.compile(r'_fw_.*zip$')
+
+    def parse(self, response: FTPListResponse, **kwargs: {}) -> Generator[FTPListRequest, None, None]:
+        for category in DLinkSpider.extract_directories(response):
+            if category in FTPClass.files_skipped:
+                continue
+            yield FTPListRequest(url=response.urljoin(f'{category}/'), callback=self.parse_category)
+
+    def parse_category(self, response: FTPListResponse) -> Generator[FTPListRequest, None, None]:
+        for device_name in DLinkSpider.extract_directories(response):
+            yield FTPListRequest(url=response.urljoin(f'{device_name}/'), callback=self.parse_device, cb_kwargs=dict(device_name=device_name))
+
+    def parse_device(self, response: FTPListResponse, device_name: str) -> Generator[FTPListRequest, None, None]:
+        if 'driver_software' in DLinkSpider.extract_directories(response):
+            yield FTPListRequest(url=response.urljoin('driver_software/'), callback=self.parse_driver_software, cb_kwargs=dict(device_name=device_name))
+
+    def parse_driver_software(self, response: FTPListResponse, device_name: str) -> Generator[FirmwareItem, None, None]:
+        for entry in response.entries:
+            if entry.type != 'file' or DLinkSpider.FIRMWARE_RE.search(entry.name) is None:
+                continue
+            meta_data = DLinkSpider.prepare_meta_data(device_name, response.urljoin(entry.name), entry)
+            yield from DLinkSpider.prepare_item_pipeline(meta_data)
+
+    @staticmethod
+    def extract_directories(response: FTPListResponse) -> List[str]:
+        return [entry.name for entry in response.entries if entry.type == 'dir']
+
+    @staticmethod
+    def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
+        loader = ItemLoader(item=FirmwareItem(), selector=meta_data['file_urls'])
+        loader.add_value('file_urls', meta_data['file_urls'])
+        loader.add_value('vendor', meta_data['vendor'])
+        loader.add_value('device_name', meta_data['device_name'])
+        loader.add_value('device_class', meta_data['device_class'])
+        loader.add_value('firmware_version', meta_data['firmware_version'])
+        loader.add_value('release_date', meta_data['release_date'])
+        loader.add_value('file_size', meta_data['file_size'])
+        yield loader.load_item()
+
+    @staticmethod
+    def prepare_meta_data(device_name: str, file_url: str, entry: FTPListingEntry) -> dict:
+        return {
+            'file_urls': [file_url],
+            'vendor': 'D-Link',
+            'device_name': device_name,
+            'firmware_version': DLinkSpider.extract_firmware_version(entry.name),
+            'device_class': DLinkSpider.map_device_class(device_name),
+            'release_date': entry.mtime.strftime('%d-%m-%Y') if entry.mtime else '01-01-1970',
+            'file_size': entry.size,
+        }
+
+    @staticmethod
+    def map_device_class(device_name: str) -> Union[str, None]:
+        return FTPClass.classify_device(device_name)
+
+    @staticmethod
+    def extract_firmware_version(file_name: str) -> str:
+        parts = file_name.split('_')
+        return parts[3] if len(parts) > 3 else '0.0'
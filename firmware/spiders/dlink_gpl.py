@@ -2,14 +2,19 @@ import re
 from datetime import datetime
 from typing import Generator, List, Tuple, Union
 
-from scrapy import FormRequest, Request, Selector, Spider
+from lxml.etree import _Element
+from scrapy import FormRequest, Request
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.custom_spiders import FilteredSpider, filter_devices
+from firmware.extraction import XPathSet
+from firmware.filters import DeviceFilter
 from firmware.items import FirmwareItem
+from firmware.offload import offload
 
 
-class DLinkGPL(Spider):
+class DLinkGPL(FilteredSpider):
     handle_httpstatus_list = [404]
     name = 'dlink_gpl'
 
@@ -28,7 +33,7 @@ class DLinkGPL(Spider):
 
     download_maxsize = 2147483648  # 2GiB
 
-    XPATH = {
+    XPATH = XPathSet({
         'device_names': '//td[@class="pord_3"]//a/@title',
         'device_overview_rows': '//tr[contains(@onclick, "dwn(")]',
         'onclick': './@onclick',
@@ -37,19 +42,27 @@ class DLinkGPL(Spider):
         'download_link': './/a[contains(@href, "dlink-gpl.s3.amazonaws.com")]/@href',
         'current_page': '//input[@name="sel_PageNo"]/@value',
         'pagination': '//input[@name="sel_PageNo"]/parent::td/text()[position() = last()]',
-    }
+    })
 
     IDENTIFIER_RE = re.compile(r'^dwn\(\'([A-Z]+)\',[\'\da-zA-Z]+\)$')
     VERSION_RE = re.compile(r'FW\sv(\d+\..+)')
     PAGINATION_RE = re.compile(r'^\((\d+)\s\/\s(\d+)\)$')
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
-        extractor = DLinkGPL.extract_devices(response)
-        for product, model in self.firmware_filter(extractor):
+        # the listing pages are parsed in the offload pool, the requests are built here as they call back the spider
+        return offload(DLinkGPL.extract_listing, response, self.device_filter, then=self.construct_listing_requests)
+
+    @staticmethod
+    def extract_listing(response: Response, device_filter: DeviceFilter) -> Tuple[List[Tuple[str, str]], Union[str, None]]:
+        devices = list(filter_devices(DLinkGPL.extract_devices(response), device_filter, device=DLinkGPL.device_name))
+        return devices, DLinkGPL.extract_pagination_next(response)
+
+    def construct_listing_requests(self, listing: Tuple[List[Tuple[str, str]], Union[str, None]]) -> Generator[Request, None, None]:
+        devices, next_page = listing
+        for product, model in devices:
             product_detail_request = DLinkGPL.construct_detail_post_request(product, model)
             yield product_detail_request
 
-        next_page = DLinkGPL.extract_pagination_next(response)
         if next_page is not None:
             move_to_next_page = self.construct_next_page_post_request(next_page)
             yield move_to_next_page
@@ -84,15 +97,9 @@ class DLinkGPL(Spider):
         meta_data = DLinkGPL.prepare_meta_data(product, model, version, download_link, date)
         yield from DLinkGPL.prepare_item_pipeline(meta_data)
 
-    def firmware_filter(self, extractor: Generator[Tuple[str, str], None, None]) -> Generator[Tuple[str, str], None, None]:
-        if not self.whitelist_enabled:
-            yield from extractor
-            return
-
-        for product, model in extractor:
-            device = f'{product}-{model}'
-            if any(allowed in device for allowed in self.whitelist):
-                yield product, model
+    @staticmethod
+    def device_name(device: Tuple[str, str]) -> str:
+        return '-'.join(device)
 
     @staticmethod
     def construct_detail_post_request(product: str, model: str) -> FormRequest:
@@ -107,8 +114,8 @@ class DLinkGPL(Spider):
         yield FormRequest('https://tsd.dlink.com.tw/ddgo', callback=DLinkGPL.parse_gpl_download, cb_kwargs=cb_kwargs, formdata=form_data)
 
     @staticmethod
-    def extract_download_link(table_data: List[Selector]) -> str:
-        all_links = table_data[2].xpath(DLinkGPL.XPATH['download_link']).extract()
+    def extract_download_link(table_data: List[_Element]) -> str:
+        all_links = DLinkGPL.XPATH(table_data[2], 'download_link')
         for link in all_links:
             if not link.endswith('.txt'):
                 return link
@@ -117,8 +124,8 @@ class DLinkGPL(Spider):
 
     @staticmethod
     def extract_pagination_next(response: Response) -> Union[str, None]:
-        current_page = int(response.xpath(DLinkGPL.XPATH['current_page']).extract()[0].strip())
-        pagination = response.xpath(DLinkGPL.XPATH['pagination']).extract()[0].strip()
+        current_page = int(DLinkGPL.XPATH(response, 'current_page')[0].strip())
+        pagination = DLinkGPL.XPATH(response, 'pagination')[0].strip()
 
         page_match = DLinkGPL.PAGINATION_RE.search(pagination)
 
@@ -136,23 +143,22 @@ class DLinkGPL(Spider):
         return str(current_page + 1)
 
     @staticmethod
-    def extract_date_from_table(table_data: List[Selector]) -> str:
-        return table_data[3].xpath('.//text()').extract()[0].strip()
+    def extract_date_from_table(table_data: List[_Element]) -> str:
+        return next(table_data[3].itertext()).strip()
 
     @staticmethod
-    def extract_table_data_from_download_page(response) -> List[Selector]:
-        return response.xpath(DLinkGPL.XPATH['download_td'])
+    def extract_table_data_from_download_page(response) -> List[_Element]:
+        return DLinkGPL.XPATH(response, 'download_td')
 
     @staticmethod
     def extract_devices(response: Response) -> Generator[Tuple[str, str], None, None]:
-        for device in response.xpath(DLinkGPL.XPATH['device_names']).extract():
+        for device in DLinkGPL.XPATH(response, 'device_names'):
             product, model = device.split('-', 1)
             yield product, model
 
     @staticmethod
-    def extract_device_overview_rows(response: Response) -> Generator[Selector, None, None]:
-        for row in response.xpath(DLinkGPL.XPATH['device_overview_rows']):
-            yield row
+    def extract_device_overview_rows(response: Response) -> Generator[_Element, None, None]:
+        yield from DLinkGPL.XPATH(response, 'device_overview_rows')
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
@@ -166,16 +172,16 @@ class DLinkGPL(Spider):
         yield loader.load_item()
 
     @staticmethod
-    def extract_version(row: Selector) -> str:
-        description = row.xpath(DLinkGPL.XPATH['version']).extract()[0].strip()
+    def extract_version(row: _Element) -> str:
+        description = DLinkGPL.XPATH(row, 'version')[0].strip()
 
         version_match = DLinkGPL.VERSION_RE.search(description)
         version = version_match.group(1) if version_match is not None else '0.0'
         return version
 
     @staticmethod
-    def extract_firmware_identifier(row: Selector) -> str:
-        onclick = row.xpath(DLinkGPL.XPATH['onclick']).extract()[0]
+    def extract_firmware_identifier(row: _Element) -> str:
+        onclick = DLinkGPL.XPATH(row, 'onclick')[0]
 
         identifier_match = DLinkGPL.IDENTIFIER_RE.search(onclick)
         if identifier_match is None:
@@ -1,12 +1,16 @@
 import re
 from datetime import datetime
-from typing import Generator
+from typing import Generator, Iterable
 
 from scrapy import Request, Spider
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.classifiers import PrefixClassifier
+from firmware.dedup import SeenSet, item_fingerprint
+from firmware.extraction import XPathSet
 from firmware.items import FirmwareItem
+from firmware.offload import offload
 
 
 class ClassIdentifier:
@@ -19,7 +23,6 @@ class UnknownDeviceClassException(Exception):
 
 
 class LinksysSpider(Spider):
-    PRODUCT_DICTIONARIES = list()
     handle_httpstatus_list = [404]
     name = 'linksys'
 
@@ -55,43 +58,65 @@ class LinksysSpider(Spider):
         ClassIdentifier(['X', 'AG', 'WAG']): 'Modem Router'
     }
 
-    x_path = {
+    device_classifier = PrefixClassifier({shortcut: device_class for identifiers, device_class in device_classes.items() for shortcut in identifiers.shortcuts})
+
+    x_path = XPathSet({
         'product_urls': '//div[@class="item"]//@href',
         'device_names': '//div[@class="item"]//a/text()',
         'software_exists': '//div[@class="support-downloads col-sm-6"]//a[@title="Download Software"]/@href',
         # german text: Software herunterladen
         'firmware': '//div[@id="support-article-downloads"]/div[@class="article-accordian-content collapse-me"]',
-    }
+    })
+
+    FIRMWARE_RE = re.compile(r'Ver.+href=\".+(?:bin|img)\"')
+    IMAGE_RE = re.compile(r'(\.img|\.bin)')
+    FILE_URL_RE = re.compile(r'href="(.*\.bin|.*\.img)"')
+    VERSION_RE = re.compile(r'(?:Ver|Version)\.([^<([a-zA-Z]+]*)')
+    DATE_RE = re.compile(r'((?:[1-9]|0[1-9]|10|11|12)(?:\s|\.|/|-)(?:[a-zA-Z]+|[1-9]|[1-2][0-9]|30|31)(?:\s|\.|/|-)(?:20|19)\d{2})')
 
     start_urls = ['https://www.linksys.com/us/support/sitemap/']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # firmware listed on several support pages is emitted once per crawl
+        self.seen_firmware = SeenSet()
+
     def parse(self, response: Response) -> Generator[Request, None, None]:
-        for product_url, device_name in list(zip(response.xpath(self.x_path['product_urls']).extract(),
-                                                 response.xpath(self.x_path['device_names']).extract())):
+        for product_url, device_name in zip(self.x_path(response, 'product_urls'), self.x_path(response, 'device_names')):
             yield Request(url=response.urljoin(product_url), callback=self.parse_product,
                           cb_kwargs=dict(device_name=device_name))
 
     def parse_product(self, response: Response, device_name: str) -> Generator[Request, None, None]:
-        software_page = response.xpath(self.x_path['software_exists']).get()
+        software_page = self.x_path.first(response, 'software_exists')
         if software_page:
             yield Request(url=response.urljoin(software_page), callback=self.parse_versions,
                           cb_kwargs=dict(device_name=device_name))
 
     def parse_versions(self, response: Response, device_name: str) -> Generator[FirmwareItem, None, None]:
-        for version in response.xpath(self.x_path['firmware']).extract():
-            yield from self.parse_urls(device_name=device_name, version=version)
+        # the regular expressions run over the version blocks in the offload pool, the deduplication stays here
+        return offload(LinksysSpider.extract_firmware, response, device_name, then=self.parse_meta_data)
 
     def parse_urls(self, device_name: str, version: str) -> Generator[FirmwareItem, None, None]:
-        self.PRODUCT_DICTIONARIES = list()
-        for firmware in re.findall(r'Ver.+href=\".+(?:bin|img)\"', version):
-            if re.search(r'(\.img|\.bin)', firmware):
-                yield from self.parse_firmware(
-                    meta_data=self.prepare_meta_data(firmware=firmware, device_name=device_name,
-                                                     device_class=self.map_device_class(device_name)))
+        yield from self.parse_meta_data(LinksysSpider.extract_meta_data(device_name=device_name, version=version))
+
+    def parse_meta_data(self, meta_data_list: Iterable[dict]) -> Generator[FirmwareItem, None, None]:
+        for meta_data in meta_data_list:
+            yield from self.parse_firmware(meta_data=meta_data)
+
+    @staticmethod
+    def extract_firmware(response: Response, device_name: str) -> Generator[dict, None, None]:
+        for version in LinksysSpider.x_path.extract(response, 'firmware'):
+            yield from LinksysSpider.extract_meta_data(device_name=device_name, version=version)
+
+    @staticmethod
+    def extract_meta_data(device_name: str, version: str) -> Generator[dict, None, None]:
+        for firmware in LinksysSpider.FIRMWARE_RE.findall(version):
+            if LinksysSpider.IMAGE_RE.search(firmware):
+                yield LinksysSpider.prepare_meta_data(firmware=firmware, device_name=device_name,
+                                                      device_class=LinksysSpider.map_device_class(device_name))
 
     def parse_firmware(self, meta_data: dict) -> Generator[FirmwareItem, None, None]:
-        if meta_data not in self.PRODUCT_DICTIONARIES:
-            self.PRODUCT_DICTIONARIES.append(meta_data)
+        if self.seen_firmware.add(item_fingerprint(meta_data)):
             yield from self.prepare_item_pipeline(meta_data=meta_data)
 
     @staticmethod
@@ -108,26 +133,24 @@ class LinksysSpider(Spider):
 
     @staticmethod
     def prepare_meta_data(firmware: str, device_name: str, device_class: str) -> dict:
-        match = re.search(r'href="(.*\.bin|.*\.img)"', firmware)
+        match = LinksysSpider.FILE_URL_RE.search(firmware)
         file_urls = match.group(1) if match else 'N/A'
 
-        match = re.search(r'(?:Ver|Version)\.([^<([a-zA-Z]+]*)', firmware)
+        match = LinksysSpider.VERSION_RE.search(firmware)
         version = match.group(1).strip(' ').replace('\xa0', '') if match else 'N/A'
 
-        match = re.search(
-            r'((?:[1-9]|0[1-9]|10|11|12)(?:\s|\.|/|-)(?:[a-zA-Z]+|[1-9]|[1-2][0-9]|30|31)(?:\s|\.|/|-)(?:20|19)\d{2})',
-            firmware)
+        match = LinksysSpider.DATE_RE.search(firmware)
         date = datetime.strptime(match.group(1).replace(' ', '/').replace('\xa0', '/'), r"%m/%d/%Y").strftime(
             "%Y-%m-%d") if match else 'N/A'
 
         return dict(file_urls=file_urls, vendor='Linksys', device_name=device_name,
                     firmware_version=version, device_class=device_class, release_date=date)
 
-    def map_device_class(self, product: str) -> str:
-        for identifiers in self.device_classes.keys():
-            for shortcut in identifiers.shortcuts:
-                if product.startswith(shortcut):
-                    return self.device_classes[identifiers]
+    @staticmethod
+    def map_device_class(product: str) -> str:
+        device_class = LinksysSpider.device_classifier(product)
+        if device_class is not None:
+            return device_class
 
         raise UnknownDeviceClassException(
             'The product: {} cannot be found in the Device Class dictionary.'.format(product))
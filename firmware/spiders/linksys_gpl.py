@@ -1,13 +1,15 @@
 from typing import Generator, Tuple
 
-from scrapy import Request, Spider
+from scrapy import Request
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.custom_spiders import FilteredSpider
+from firmware.extraction import XPathSet, text_content
 from firmware.items import FirmwareItem
 
 
-class LinksysGPL(Spider):
+class LinksysGPL(FilteredSpider):
     handle_httpstatus_list = [404]
     name = 'linksys_gpl'
 
@@ -26,25 +28,17 @@ class LinksysGPL(Spider):
 
     download_maxsize = 2147483648  # 2GiB
 
-    XPATH = {
+    XPATH = XPathSet({
         'table_rows': '//table/thead/tr',
         'row_columns': './/td',
-    }
+        'column_links': './/a/@href',
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
         firmware_extractor = LinksysGPL.extract_firmwares(response)
         for device, version, link in self.firmware_filter(firmware_extractor):
             yield from LinksysGPL.collect_firmware(device, version, link)
 
-    def firmware_filter(self, extractor: Generator[Tuple[str, str, str], None, None]) -> Generator[Tuple[str, str, str], None, None]:
-        if not self.whitelist_enabled:
-            yield from extractor
-            return
-
-        for device, version, link in extractor:
-            if any(allowed in device for allowed in self.whitelist):
-                yield device, version, link
-
     @staticmethod
     def collect_firmware(device_name: str, version: str, link: str) -> Generator[FirmwareItem, None, None]:
         meta_data = LinksysGPL.prepare_meta_data(device_name, version, link)
@@ -53,19 +47,19 @@ class LinksysGPL(Spider):
     @staticmethod
     def extract_firmwares(response: Response) -> Generator[Tuple[str, str, str], None, None]:
         device_names = []
-        table = response.xpath(LinksysGPL.XPATH['table_rows'])[1:]
+        table = LinksysGPL.XPATH(response, 'table_rows')[1:]
         for row in table:
-            columns = row.xpath(LinksysGPL.XPATH['row_columns'])
+            columns = LinksysGPL.XPATH(row, 'row_columns')
             if len(columns) not in [2, 3]:
                 continue
 
             offset = 0
             if len(columns) == 3:
-                device_names = columns[0].xpath('.//text()').extract()
+                device_names = list(columns[0].itertext())
                 offset = 1
 
-            version = ''.join(columns[offset].xpath('.//text()').extract()).strip()
-            link = ''.join(columns[offset + 1].xpath('.//a/@href').extract()).strip()
+            version = text_content(columns[offset]).strip()
+            link = ''.join(LinksysGPL.XPATH(columns[offset + 1], 'column_links')).strip()
             for device in device_names:
                 yield device.strip(), version, link
 
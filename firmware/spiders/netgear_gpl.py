@@ -1,13 +1,16 @@
-from typing import Generator, Tuple
+from typing import Generator, List, Tuple
 
-from scrapy import Request, Spider
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.custom_spiders import FilteredSpider, filter_devices
+from firmware.extraction import XPathSet
+from firmware.filters import DeviceFilter
 from firmware.items import FirmwareItem
+from firmware.offload import offload
 
 
-class NetgearGPL(Spider):
+class NetgearGPL(FilteredSpider):
     handle_httpstatus_list = [404]
     name = 'netgear_gpl'
 
@@ -25,26 +28,21 @@ class NetgearGPL(Spider):
 
     download_maxsize = 2147483648  # 2GiB
 
-    XPATH = {
+    XPATH = XPathSet({
         'device_paragraph': '//div/p/strong/parent::*|//div/p/span[@style="FONT-WEIGHT: bold"]/parent::*',
         'device_name': './/strong/text()|.//span[@style="FONT-WEIGHT: bold"]/text()',
         'device_versions': './/a/text()',
         'device_links': './/a/@href'
-    }
+    })
 
-    def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
-        firmware_extractor = NetgearGPL.extract_firmwares(response)
-        for device, version, link in self.firmware_filter(firmware_extractor):
-            yield from NetgearGPL.collect_firmware(device, version, link)
-
-    def firmware_filter(self, extractor: Generator[Tuple[str, str, str], None, None]) -> Generator[Tuple[str, str, str], None, None]:
-        if not self.whitelist_enabled:
-            yield from extractor
-            return
+    def parse(self, response: Response, **kwargs: {}) -> List[FirmwareItem]:
+        # the single GPL page lists every device, it is parsed in the offload pool
+        return offload(NetgearGPL.extract_items, response, self.device_filter)
 
-        for device, version, link in extractor:
-            if any(allowed in device for allowed in self.whitelist):
-                yield device, version, link
+    @staticmethod
+    def extract_items(response: Response, device_filter: DeviceFilter) -> Generator[FirmwareItem, None, None]:
+        for device, version, link in filter_devices(NetgearGPL.extract_firmwares(response), device_filter):
+            yield from NetgearGPL.collect_firmware(device, version, link)
 
     @staticmethod
     def collect_firmware(device_name: str, version: str, link: str) -> Generator[FirmwareItem, None, None]:
@@ -53,10 +51,10 @@ class NetgearGPL(Spider):
 
     @staticmethod
     def extract_firmwares(response: Response) -> Generator[Tuple[str, str, str], None, None]:
-        for paragraph in response.xpath(NetgearGPL.XPATH['device_paragraph']):
-            device_name = paragraph.xpath(NetgearGPL.XPATH['device_name']).extract()
-            versions = paragraph.xpath(NetgearGPL.XPATH['device_versions']).extract()
-            links = paragraph.xpath(NetgearGPL.XPATH['device_links']).extract()
+        for paragraph in NetgearGPL.XPATH(response, 'device_paragraph'):
+            device_name = NetgearGPL.XPATH(paragraph, 'device_name')
+            versions = NetgearGPL.XPATH(paragraph, 'device_versions')
+            links = NetgearGPL.XPATH(paragraph, 'device_links')
 
             for version, link in zip(versions, links):
                 yield device_name, version, link
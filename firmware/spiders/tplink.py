@@ -5,6 +5,7 @@ from scrapy import Request, Spider
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.extraction import XPathSet
 from firmware.items import FirmwareItem
 
 
@@ -27,7 +28,7 @@ class TPLink(Spider):
         'https://www.tp-link.com/de/home-networking/access-point/',  # PoE-powered wifi access points
     ]
 
-    XPATH = {
+    XPATH = XPathSet({
         'products_on_page': '//a[contains(@class,"tp-product-link")]/@href',
         'product_pages': '//li[@class="tp-product-pagination-item"]/a[@class="tp-product-pagination-btn"]/@href',
         'product_name': '//h2[@class="product-name"]/text()',
@@ -35,7 +36,7 @@ class TPLink(Spider):
         'firmware_download_link': '//tr[@class="basic-info"][1]//a[contains(@class, download)]/@href',
         'firmware_version': '//span[@id="verison-hidden"]/text()',
         'firmware_release_date': '//tr[@class="detail-info"][1]/td[1]/span[2]/text()[1]',
-    }
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
         for product_url in TPLink.extract_products_on_page(response=response):
@@ -45,7 +46,7 @@ class TPLink(Spider):
 
     @staticmethod
     def parse_product_details(product_page: Response):
-        device_name = product_page.xpath(TPLink.XPATH['product_name']).extract()[0]
+        device_name = TPLink.XPATH(product_page, 'product_name')[0]
         device_class = TPLink.map_device_class(product_page.url)
 
         support_link = TPLink.extract_product_support_link(product_page)
@@ -94,28 +95,28 @@ class TPLink(Spider):
 
     @staticmethod
     def extract_products_on_page(response: Response) -> Generator[str, None, None]:
-        for result in response.xpath(TPLink.XPATH['products_on_page']).extract():
+        for result in TPLink.XPATH(response, 'products_on_page'):
             yield response.urljoin(result)
 
     @staticmethod
     def extract_product_support_link(product_page: Response) -> str:
-        return product_page.urljoin(product_page.xpath(TPLink.XPATH['product_support_link']).extract()[0])
+        return product_page.urljoin(TPLink.XPATH(product_page, 'product_support_link')[0])
 
     @staticmethod
     def extract_firmware_download_link(support_page: Response) -> str:
-        return support_page.urljoin(support_page.xpath(TPLink.XPATH['firmware_download_link']).extract()[0])
+        return support_page.urljoin(TPLink.XPATH(support_page, 'firmware_download_link')[0])
 
     @staticmethod
     def extract_firmware_version(support_page: Response) -> str:
-        return support_page.xpath(TPLink.XPATH['firmware_version']).extract()[0]
+        return TPLink.XPATH(support_page, 'firmware_version')[0]
 
     @staticmethod
     def extract_firmware_release_date(support_page: Response) -> str:
-        return support_page.xpath(TPLink.XPATH['firmware_release_date']).extract()[0]
+        return TPLink.XPATH(support_page, 'firmware_release_date')[0]
 
     @staticmethod
     def extract_pages(response: Response) -> Generator[str, None, None]:
-        for page in response.xpath(TPLink.XPATH['product_pages']).extract():
+        for page in TPLink.XPATH(response, 'product_pages'):
             yield response.urljoin(page)
 
     @staticmethod
@@ -1,13 +1,15 @@
-from typing import Generator, Tuple, Union
+from typing import Generator, List, Tuple, Union
 
-from scrapy import Request, Spider
+from scrapy import Request
 from scrapy.http import Response
 from scrapy.loader import ItemLoader
 
+from firmware.custom_spiders import FilteredSpider
+from firmware.extraction import XPathSet
 from firmware.items import FirmwareItem
 
 
-class TPLinkGPL(Spider):
+class TPLinkGPL(FilteredSpider):
     handle_httpstatus_list = [404]
     name = 'tplink_gpl'
 
@@ -26,23 +28,19 @@ class TPLinkGPL(Spider):
 
     download_maxsize = 2147483648  # 2GiB
 
-    XPATH = {
-        'device_names_ddl': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][contains(@href, "static")]/text()',
-        'device_links_ddl': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][contains(@href, "static")]/@href',
-        'device_names_multi': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][not(contains(@href, "static"))]/text()',
-        'device_links_multi': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"][not(contains(@href, "static"))]/@href',
+    XPATH = XPathSet({
+        'device_anchors': '//div[@data-class="wi-fi-routers"]/div[@class="item-box"]//a[@class="ga-click"]',
         'table_device_version': '//td[@class="model"]/following-sibling::td[1]/div/text()',
         'table_device_link': '//a[@class="bold ga-click"][text()="Download"]/@href',
-    }
+    })
 
     def parse(self, response: Response, **kwargs: {}) -> Generator[Request, None, None]:
-        ddl_extractor = TPLinkGPL.extract_ddl_firmware(response)
-        for device, link in self.firmware_filter(ddl_extractor):
+        ddl_firmware, multi_firmware = TPLinkGPL.extract_firmware(response)
+        for device, link in self.firmware_filter(ddl_firmware):
             meta_data = TPLinkGPL.prepare_meta_data(device, None, link)
             yield from TPLinkGPL.prepare_item_pipeline(meta_data)
 
-        multi_fw_extractor = TPLinkGPL.extract_multi_firmware(response)
-        for device, link in self.firmware_filter(multi_fw_extractor):
+        for device, link in self.firmware_filter(multi_firmware):
             cb_kwargs = dict(device=device)
             yield Request(url=link, callback=TPLinkGPL.parse_multi, cb_kwargs=cb_kwargs)
 
@@ -52,35 +50,24 @@ class TPLinkGPL(Spider):
             meta_data = TPLinkGPL.prepare_meta_data(device, version, link)
             yield from TPLinkGPL.prepare_item_pipeline(meta_data)
 
-    def firmware_filter(self, extractor: Generator[Tuple[str, str], None, None]) -> Generator[Tuple[str, str], None, None]:
-        if not self.whitelist_enabled:
-            yield from extractor
-            return
-
-        for device, link in extractor:
-            if any(allowed in device for allowed in self.whitelist):
-                yield device, link
-
     @staticmethod
     def extract_table(response: Response) -> Generator[Tuple[str, str], None, None]:
-        versions = response.xpath(TPLinkGPL.XPATH['table_device_version']).extract()
-        links = response.xpath(TPLinkGPL.XPATH['table_device_link']).extract()
+        versions = TPLinkGPL.XPATH(response, 'table_device_version')
+        links = TPLinkGPL.XPATH(response, 'table_device_link')
         for version, link in zip(versions, links):
             yield version.strip(), link.strip()
 
     @staticmethod
-    def extract_ddl_firmware(response: Response) -> Generator[Tuple[str, str], None, None]:
-        names = response.xpath(TPLinkGPL.XPATH['device_names_ddl']).extract()
-        links = response.xpath(TPLinkGPL.XPATH['device_links_ddl']).extract()
-        for device, link in zip(names, links):
-            yield device.strip(), link.strip()
-
-    @staticmethod
-    def extract_multi_firmware(response: Response) -> Generator[Tuple[str, str], None, None]:
-        names = response.xpath(TPLinkGPL.XPATH['device_names_multi']).extract()
-        links = response.xpath(TPLinkGPL.XPATH['device_links_multi']).extract()
-        for device, link in zip(names, links):
-            yield device.strip(), f'https://www.tp-link.com/phppage/gpl-res-list.html{link.strip()}&appPath=de'
+    def extract_firmware(response: Response) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        # one pass over the device links, direct downloads point to static.tp-link.com, the others to a table of versions
+        ddl_firmware, multi_firmware = list(), list()
+        for anchor in TPLinkGPL.XPATH(response, 'device_anchors'):
+            device, link = (anchor.text or '').strip(), anchor.get('href', '').strip()
+            if 'static' in link:
+                ddl_firmware.append((device, link))
+            else:
+                multi_firmware.append((device, f'https://www.tp-link.com/phppage/gpl-res-list.html{link}&appPath=de'))
+        return ddl_firmware, multi_firmware
 
     @staticmethod
     def prepare_item_pipeline(meta_data: dict) -> Generator[FirmwareItem, None, None]:
@@ -0,0 +1,93 @@
+import json
+import os
+import sqlite3
+from os.path import exists, join
+from time import time
+
+
+class BlobStore:
+    # content addressed file store: every distinct file is written once to blobs/<digest> and hardlinked
+    # to its human readable path, the manifest records which path refers to which digest
+
+    def __init__(self, basedir, manifest='manifest.jsonl'):
+        self.basedir = basedir
+        self.manifest_path = join(basedir, manifest)
+
+    def blob_path(self, digest):
+        return join(self.basedir, 'blobs', digest[:2], digest)
+
+    def has_blob(self, digest):
+        return exists(self.blob_path(digest))
+
+    def persist_blob(self, digest, data):
+        if self.has_blob(digest):
+            return False
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        partial_path = '{}.partial'.format(blob_path)
+        with open(partial_path, 'wb') as blob:
+            blob.write(data)
+        os.replace(partial_path, blob_path)
+        return True
+
+    @property
+    def partial_directory(self):
+        # downloads in progress, on the same file system as the blobs so they can be renamed into place
+        return join(self.basedir, 'blobs', 'partial')
+
+    def persist_file(self, digest, partial_path):
+        if self.has_blob(digest):
+            os.unlink(partial_path)
+            return False
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(partial_path, blob_path)
+        return True
+
+    def link(self, path, digest, url):
+        absolute_path = join(self.basedir, *path.split('/'))
+        os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+        if exists(absolute_path) and os.path.samefile(absolute_path, self.blob_path(digest)):
+            return
+        linked_path = '{}.link'.format(absolute_path)
+        os.link(self.blob_path(digest), linked_path)
+        os.replace(linked_path, absolute_path)
+        with open(self.manifest_path, 'a') as manifest:
+            manifest.write(json.dumps(dict(path=path, digest=digest, url=url)) + '\n')
+
+
+class FetchLedger:
+    # remembers validators of every fetched file url across runs to turn re-downloads into conditional requests
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fetches ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, size INTEGER, digest TEXT, path TEXT, fetched_at REAL)'
+        )
+        self.connection.commit()
+
+    def get(self, url):
+        row = self.connection.execute('SELECT * FROM fetches WHERE url = ?', (url,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def record(self, url, etag, last_modified, size, digest, path):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO fetches VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (url, etag, last_modified, size, digest, path, time())
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = dict()
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def close(self):
+        self.connection.close()
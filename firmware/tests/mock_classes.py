@@ -12,13 +12,38 @@ class MockResponse:
     def urljoin(self, url):
         return urljoin(self.url, url)
 
+    @property
+    def text(self):
+        return self.body
+
+    @property
+    def selector(self):
+        return Selector(text=self.body)
+
     def xpath(self, xpath):
-        selector = Selector(text=self.body)
-        return selector.xpath(xpath)
+        return self.selector.xpath(xpath)
 
 
 class MockRequest:
-    def __init__(self, url, callback, cb_kwargs=None):
+    def __init__(self, url, callback, cb_kwargs=None, meta=None):
         self.url = url
         self.callback = callback
         self.cb_kwargs = cb_kwargs
+        self.meta = meta or dict()
+
+
+class MockStats:
+    def __init__(self):
+        self.values = dict()
+
+    def inc_value(self, key, count=1, start=0, spider=None):
+        self.values[key] = self.values.get(key, start) + count
+
+    def max_value(self, key, value, spider=None):
+        self.values[key] = max(self.values.get(key, value), value)
+
+    def get_value(self, key, default=None, spider=None):
+        return self.values.get(key, default)
+
+    def get_stats(self, spider=None):
+        return self.values
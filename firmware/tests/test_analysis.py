@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+from concurrent.futures import Future
+
+import pytest
+from scrapy import Spider
+from scrapy.http import Response
+from scrapy.pipelines.files import FilesPipeline
+from scrapy.utils.conf import build_component_list
+from scrapy.utils.misc import load_object
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+from firmware import analysis
+from firmware import settings as project_settings
+from firmware.analysis import CHUNK_SIZE, FirmwareAnalysisPipeline, analyze_file, magic_type
+from firmware.items import FirmwareItem
+
+
+def write_tar_gz(path, members):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+
+
+@pytest.mark.parametrize('head, expected', [
+    (b'PK\x03\x04rest', 'zip'),
+    (b'\x27\x05\x19\x56' + bytes(60), 'uimage'),
+    (bytes(257) + b'ustar\x0000', 'tar'),
+    (b'hsqs' + bytes(92), 'squashfs'),
+    (b'firmware', 'data'),
+])
+def test_magic_type(head, expected):
+    assert magic_type(head) == expected
+
+
+def test_analyze_gpl_archive(tmp_path):
+    path = str(tmp_path / 'fritzbox-7590-07.12.tar.gz')
+    write_tar_gz(path, {'linux/Makefile': b'all:\n', 'busybox/README': b'BusyBox'})
+    analysis = analyze_file(path)
+
+    assert analysis['magic'] == 'gzip'
+    assert analysis['member_count'] == 2
+    assert analysis['members'] == [dict(name='linux/Makefile', size=5), dict(name='busybox/README', size=7)]
+    assert analysis['sha256'] == hashlib.sha256(open(path, 'rb').read()).hexdigest()
+
+
+def test_analyze_zip_lists_at_most_max_members(tmp_path):
+    path = str(tmp_path / 'dir-615_fw.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        for index in range(5):
+            archive.writestr('fw_{}.bin'.format(index), b'x')
+    analysis = analyze_file(path, digests=(), max_members=2)
+
+    assert analysis['member_count'] == 5
+    assert [member['name'] for member in analysis['members']] == ['fw_0.bin', 'fw_1.bin']
+    assert 'sha256' not in analysis
+
+
+@pytest.mark.parametrize('content, low, high', [
+    (bytes(4096), 0.0, 0.0),
+    (bytes(range(256)) * 16, 8.0, 8.0),
+    (os.urandom(65536), 7.9, 8.0),
+])
+def test_entropy(tmp_path, content, low, high):
+    path = tmp_path / 'fw.bin'
+    path.write_bytes(content)
+    assert low <= analyze_file(str(path))['entropy'] <= high
+
+
+def test_entropy_sample_without_digests(tmp_path):
+    # with one chunk sampled out of four, only the zeroed first chunk counts, whether the file is hashed or not
+    path = tmp_path / 'fw.bin'
+    path.write_bytes(bytes(CHUNK_SIZE) + os.urandom(3 * CHUNK_SIZE))
+    sampled = analyze_file(str(path), digests=(), entropy_sample=CHUNK_SIZE)
+
+    assert sampled['entropy'] == analyze_file(str(path), entropy_sample=CHUNK_SIZE)['entropy'] == 0.0
+    assert sampled['size'] == 4 * CHUNK_SIZE
+
+
+def test_compressed_file_without_archive(tmp_path):
+    path = tmp_path / 'vmlinux.gz'
+    path.write_bytes(gzip.compress(b'kernel' * 100))
+    analysis = analyze_file(str(path))
+    assert analysis['magic'] == 'gzip'
+    assert analysis['members'] is None
+
+
+def test_items_without_stored_files_pass_through(tmp_path):
+    pipeline = FirmwareAnalysisPipeline(str(tmp_path))
+    item = FirmwareItem(file_urls=['http://a/fw.image'], files=[])
+    assert pipeline.process_item(item, spider=None) is item
+    assert 'file_analysis' not in item
+
+
+class InlineExecutor:
+    @staticmethod
+    def submit(function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+def run_files_pipeline(pipeline, item, spider):
+    # the hooks of the media pipeline in the order scrapy calls them, with the download answered right away
+    info = pipeline.spiderinfo
+    results = list()
+    for request in pipeline.get_media_requests(item, info):
+        pipeline.media_to_download(request, info, item=item).addCallback(results.append)
+        if results[-1] is None:
+            results[-1] = pipeline.media_downloaded(Response(request.url, body=b'firmware', request=request), request, info, item=item)
+    return pipeline.item_completed([(True, result) for result in results], item, info)
+
+
+def test_files_are_analyzed_with_the_project_pipelines(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis, 'deferred_from_future', lambda future: defer.succeed(future.result()))
+    settings = {name: getattr(project_settings, name) for name in dir(project_settings) if name.isupper()}
+    settings.update(FILES_STORE=str(tmp_path), ANALYSIS_ENABLED=True)
+    crawler = get_crawler(Spider, settings_dict=settings)
+    spider = Spider.from_crawler(crawler, name='avm')
+
+    item = FirmwareItem(vendor='AVM', device_name='fritzbox-7590', firmware_version='07.12', file_urls=['http://a/fw.image'])
+    for path in build_component_list(crawler.settings.getwithbase('ITEM_PIPELINES')):
+        pipeline = load_object(path).from_crawler(crawler)
+        if isinstance(pipeline, FirmwareAnalysisPipeline):
+            # the worker processes are replaced by analyzing in the test process
+            pipeline.executor = InlineExecutor()
+            analyzed = list()
+            pipeline.process_item(item, spider).addCallback(analyzed.append)
+            item = analyzed[0]
+            continue
+        pipeline.open_spider(spider)
+        if isinstance(pipeline, FilesPipeline):
+            item = run_files_pipeline(pipeline, item, spider)
+        else:
+            item = pipeline.process_item(item, spider)
+        pipeline.close_spider(spider)
+
+    assert [result['status'] for result in item['files']] == ['uptodate']
+    assert item['file_analysis'][0]['sha256'] == hashlib.sha256(b'firmware').hexdigest()
+    assert crawler.stats.get_value('analysis/file_count') == 1
@@ -100,6 +100,11 @@ def test_parse_product(monkeypatch, spider_instance, response, expected):
             assert request.url == expected[index]
 
 
+def test_parse_product_passes_listing_dates(spider_instance):
+    requests = list(spider_instance.parse_product(response=MockResponse(url='/fritzbox/fritzbox-1234/deutschland/', body=OS_PAGE)))
+    assert [request.meta for request in requests] == [{'listing_date': '12-08-2019'}]
+
+
 @pytest.mark.parametrize('response, device_name, expected', [(MockResponse(url='/fritzbox/fritzbox-1234/other/fritz.os/', body=FIRWMARE_PAGE), 'fritzbox-1234', ['test'])])
 def test_parse_firmware(monkeypatch, spider_instance, response, device_name, expected):
     with monkeypatch.context() as monkey:
@@ -128,7 +133,8 @@ def test_prepare_meta_data(monkeypatch):
         'device_name': 'router-3000',
         'firmware_version': 'current',
         'device_class': 'Router',
-        'release_date': '1970-01-01'
+        'release_date': '1970-01-01',
+        'file_size': None,
     }
     assert mocked_spider.prepare_meta_data('router-3000', '1970-01-01', 'firmware.example.com/router-3000/download') == expected_result
 
@@ -144,11 +150,6 @@ def test_extract_links(spider_instance, response, prefix, expected):
     assert spider_instance.extract_links(response=response, ignore=prefix) == expected
 
 
-@pytest.mark.parametrize('response, expected', [(MockResponse(url='/fritzbox/fritzbox-1234/other/fritz.os/', body=FIRWMARE_PAGE), ['12-08-2019', '13-09-2017'])])
-def test_extract_dates(spider_instance, response, expected):
-    assert spider_instance.extract_dates(response=response) == expected
-
-
 @pytest.mark.parametrize('date, expected', [('12-Aug-2019', '12-08-2019'), ('24-Dec-2019', '24-12-2019')])
 def test_convert_date(spider_instance, date, expected):
     assert spider_instance.convert_date(date=date) == expected
@@ -165,9 +166,21 @@ def test_extract_version(spider_instance, firmware, specifier, expected):
     assert spider_instance.extract_version(firmware=firmware, product_specifier=specifier) == expected
 
 
-@pytest.mark.parametrize('array, prefix, index, expected', [
-    (['a', 'b', 'c'], '', 0, ['abc', 'a_b_c', 'a_bc', 'ab_c']),
-    (['a', 'b', 'c', 'd'], '', 0, ['abcd', 'a_b_c_d', 'a_bcd', 'ab_cd', 'abc_d', 'a_b_cd', 'a_bc_d', 'ab_c_d'])
+@pytest.mark.parametrize('firmware, specifier, expected', [
+    ('fritz.powerline_1000A_E_02_06.image', 'fritzpowerline-1000a-e', '02.06'),
+    ('fritz.powerline_1000AE_02_06.image', 'fritzpowerline-1000a-e', '02.06'),
+    ('fritz.powerline_540E_WLAN_SET_07_12.image', 'fritzpowerline-540e-wlan-set', '07.12'),
+    ('fritz.powerline_540EWLANSET_07_12.image', 'fritzpowerline-540e-wlan-set', '07.12'),
+    ('fritz.powerline_' + '_'.join(['A'] * 40) + '_07_12.image', 'fritzpowerline-' + '-'.join(['a'] * 40), '07.12'),
+    ('fritz.powerline_1000ET_01_05.image', 'fritzpowerline-1000a-e', '0.0'),
+    ('fritz.powerline_1000ET_01_05.image', 'fritzpowerline', '0.0'),
 ])
-def test_permutations(spider_instance, array, prefix, index, expected):
-    assert sorted(list(spider_instance.generate_permutations(array=array, prefix=prefix, index=index))) == sorted(expected)
+def test_extract_powerline_version(spider_instance, firmware, specifier, expected):
+    assert spider_instance.extract_version(firmware=firmware, product_specifier=specifier) == expected
+
+
+def test_powerline_pattern_is_compiled_once(spider_instance):
+    avm.AvmSpider.powerline_pattern.cache_clear()
+    for firmware in ('fritz.powerline_1000ET_01_05.image', 'fritz.powerline_1000E_T_01_06.image'):
+        spider_instance.extract_version(firmware=firmware, product_specifier='fritzpowerline-1000e-t')
+    assert avm.AvmSpider.powerline_pattern.cache_info().misses == 1
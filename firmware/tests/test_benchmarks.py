@@ -0,0 +1,59 @@
+from urllib.parse import urlparse
+
+import pytest
+from scrapy import Request
+from scrapy.core.downloader.handlers.http11 import ScrapyProxyAgent
+
+from firmware.benchmarks.__main__ import CASES, find_regressions, run_case
+from firmware.benchmarks.e2e import LocalMirrorAgent, LocalMirrorMiddleware, parse_size
+from firmware.benchmarks.fixtures import GENERATORS, load_fixture
+from firmware.benchmarks.mock_server import VendorSite, build_dlink_tree
+
+
+@pytest.mark.parametrize('case', sorted(GENERATORS))
+def test_fixtures_match_spider_markup(case):
+    assert set(CASES) == set(GENERATORS)
+    assert run_case(case, load_fixture(case, scale=10), repeat=1)['outputs_per_page'] >= 10
+
+
+def test_find_regressions():
+    baseline = {'case': dict(outputs_per_second=1000, peak_kib=100)}
+    assert find_regressions({'case': dict(outputs_per_second=900, peak_kib=110)}, baseline, tolerance=0.2) == []
+    assert len(find_regressions({'case': dict(outputs_per_second=700, peak_kib=130)}, baseline, tolerance=0.2)) == 2
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.linksys.com/de/support-article', 'http://127.0.0.1:8080'),
+    ('http://download.avm.de/fritzbox/', 'http://127.0.0.1:8080'),
+    ('ftp://127.0.0.1:2121/dir/', None),
+])
+def test_local_mirror_middleware(url, expected):
+    request = Request(url)
+    assert LocalMirrorMiddleware('http://127.0.0.1:8080').process_request(request, spider=None) is None
+    assert request.meta.get('proxy') == expected
+
+
+def test_local_mirror_agent_sends_https_to_plain_http_proxy():
+    agent = LocalMirrorAgent(contextFactory=None, pool=None)
+    request = Request('https://www.linksys.com/de/support-article', meta={'proxy': 'http://127.0.0.1:8080'})
+    assert isinstance(agent._get_agent(request, timeout=10), ScrapyProxyAgent)
+
+
+@pytest.mark.parametrize('size, expected', [('512', 512), ('64K', 65536), ('1.5M', 1572864), ('4G', 4294967296)])
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_vendor_site_avm_tree():
+    site = VendorSite(scale=3, blob_size=1024, latency=0)
+    products = site.avm(urlparse('http://download.avm.de/fritzbox/'))
+    images = site.avm(urlparse('http://download.avm.de/fritzbox/fritzbox-2/deutschland/fritz.os/'))
+    assert products.count('href="fritzbox-') == 3
+    assert 'FRITZ.Box_2-07.01.image' in images
+    assert site.avm(urlparse('http://download.avm.de/fritzbox/fritzbox-2/deutschland/recover/')) is None
+
+
+def test_build_dlink_tree(tmp_path):
+    build_dlink_tree(str(tmp_path), scale=2, blob_size=3 * 1024 ** 3)
+    firmware = tmp_path / 'dir' / 'dir-1' / 'driver_software' / 'dir-1_fw_reva_1-01_eu_multi_20190517.zip'
+    assert firmware.stat().st_size == 3 * 1024 ** 3
@@ -0,0 +1,80 @@
+import pytest
+from scrapy import Request
+
+from firmware.budget import DownloadBudget, DownloadBudgetMiddleware
+from firmware.tests.mock_classes import MockStats
+
+MiB = 1048576
+
+
+class MockCrawler:
+    def __init__(self):
+        self.stats = MockStats()
+
+
+@pytest.fixture(scope='function')
+def budget():
+    return DownloadBudget(100 * MiB, large_file_size=64 * MiB, large_file_concurrency=1)
+
+
+@pytest.fixture(scope='function')
+def middleware(budget):
+    return DownloadBudgetMiddleware(budget, unknown_size=10 * MiB, crawler=MockCrawler())
+
+
+def test_small_files_are_admitted_first(budget):
+    admitted = list()
+    for size in (50, 48, 30, 5, 20):
+        budget.acquire(size * MiB).addCallback(admitted.append)
+    assert admitted == [50 * MiB, 48 * MiB]
+
+    budget.release(50 * MiB)
+    assert admitted[2:] == [5 * MiB, 20 * MiB]
+    budget.release(48 * MiB)
+    assert admitted[4:] == [30 * MiB]
+    assert budget.in_flight == 55 * MiB
+
+
+def test_large_files_take_a_separate_lane(budget):
+    admitted = list()
+    for size in (70, 80, 1, 2):
+        budget.acquire(size * MiB).addCallback(admitted.append)
+    assert admitted == [70 * MiB, 1 * MiB, 2 * MiB]
+    assert len(budget) == 1
+
+    budget.release(70 * MiB)
+    assert admitted[-1] == 80 * MiB
+
+
+def test_file_larger_than_budget_is_not_starved(budget):
+    admitted = list()
+    budget.acquire(2048 * MiB).addCallback(admitted.append)
+    assert admitted == [2048 * MiB]
+
+
+def test_files_without_size_are_not_held_back(middleware):
+    assert middleware.process_request(Request('https://osp.avm.de/fritzbox/'), spider=None) is None
+    assert middleware.budget.in_flight == 0
+
+
+def test_share_is_released_once(middleware):
+    request = Request('https://osp.avm.de/fritzbox/source.tar.gz', meta={'download_size': None})
+    assert middleware.process_request(request, spider=None) is None
+    assert middleware.budget.in_flight == 10 * MiB
+
+    middleware.request_left_downloader(request, spider=None)
+    middleware.process_response(request, response=None, spider=None)
+    assert middleware.budget.in_flight == 0
+    assert middleware.budget.active == {False: 0, True: 0}
+
+
+def test_waiting_request_continues_when_admitted(middleware):
+    first = Request('ftp://ftp.dlink.de/a.zip', meta={'download_size': 60 * MiB})
+    second = Request('ftp://ftp.dlink.de/b.zip', meta={'download_size': 50 * MiB})
+    assert middleware.process_request(first, spider=None) is None
+
+    waiting = middleware.process_request(second, spider=None)
+    assert not waiting.called
+    middleware.process_exception(first, exception=None, spider=None)
+    assert waiting.called
+    assert middleware.crawler.stats.values['download_budget/wait_time/count'] == 1
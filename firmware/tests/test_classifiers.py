@@ -0,0 +1,43 @@
+import pytest
+
+from firmware.classifiers import PrefixClassifier
+from firmware.spiders.asus import AsusSpider
+from firmware.spiders.linksys import LinksysSpider
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('EA6300', 'Router'),
+    ('E1200', 'Router'),
+    ('EZXS88W', 'Home Switch'),
+    ('EF3124', 'Print Server'),
+    ('WRE54G', 'Repeater'),
+    ('WRT54GL', 'Router'),
+    ('Broadband Router', None),
+])
+def test_longest_prefix(name, expected):
+    assert LinksysSpider.device_classifier(name) == expected
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('dir-615', 'Router (Home)'),
+    ('dir', 'Router (Home)'),
+    ('dirx-1', 'other'),
+    ('dsl-g225', 'Router (Modem)'),
+    ('xyz-1', 'other'),
+])
+def test_boundary_and_default(name, expected):
+    classifier = PrefixClassifier({'dir': 'Router (Home)', 'dsl': 'Router (Modem)'}, default='other', boundary='-')
+    assert classifier(name) == expected
+
+
+def test_lower_case_names():
+    assert AsusSpider.device_classifier('RT-AX88U') == 'Router (Home)'
+    assert AsusSpider.device_classifier('ROG Rapture GT-AX11000') == 'Router (Gaming)'
+
+
+def test_results_are_memoized():
+    classifier = PrefixClassifier({'EA': 'Router'}, cache_size=2)
+    for name in ('EA6300', 'EA6300', 'EA7500', 'EA8300'):
+        classifier(name)
+    info = classifier.classify.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 3, 2)
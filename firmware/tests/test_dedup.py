@@ -0,0 +1,64 @@
+import pytest
+from scrapy.exceptions import DropItem
+
+from firmware.dedup import DuplicatesPipeline, SeenSet, item_fingerprint
+from firmware.items import FirmwareItem
+from firmware.tests.mock_classes import MockStats
+
+
+class MockSpider:
+    name = 'linksys'
+
+
+def firmware_item(version='1.0', file_url='https://downloads.linksys.com/EA6300.img'):
+    return FirmwareItem(vendor=['Linksys'], device_name=['EA6300'], firmware_version=[version], file_urls=[file_url], release_date=['2019-08-23'])
+
+
+@pytest.mark.parametrize('other, expected', [
+    (dict(vendor='Linksys', device_name='EA6300', firmware_version='1.0', file_urls='https://downloads.linksys.com/EA6300.img'), True),
+    (firmware_item(version='1.1'), False),
+    (firmware_item(file_url='https://downloads.linksys.com/EA6300_eu.img'), False),
+])
+def test_item_fingerprint(other, expected):
+    assert (item_fingerprint(firmware_item()) == item_fingerprint(other)) == expected
+
+
+def test_seen_set():
+    seen = SeenSet()
+    assert seen.add('a') is True
+    assert seen.add('a') is False
+    assert 'a' in seen and 'b' not in seen
+    assert len(seen) == 1
+
+
+def test_seen_set_persists_across_runs(tmp_path):
+    path = str(tmp_path / 'state' / 'linksys.seen.sqlite')
+    first_run = SeenSet(path)
+    first_run.add('a')
+    first_run.close()
+
+    second_run = SeenSet(path)
+    assert second_run.add('a') is False
+    assert second_run.add('b') is True
+    second_run.close()
+    assert len(SeenSet(path)) == 2
+
+
+@pytest.mark.parametrize('state_directory', [None, 'crawl_state'])
+def test_duplicates_pipeline(tmp_path, state_directory):
+    stats = MockStats()
+    pipeline = DuplicatesPipeline(str(tmp_path / state_directory) if state_directory else None, stats)
+    pipeline.open_spider(MockSpider())
+    assert pipeline.process_item(firmware_item(), MockSpider()) == firmware_item()
+    with pytest.raises(DropItem):
+        pipeline.process_item(firmware_item(), MockSpider())
+    assert stats.values['dedup/duplicate_item_count'] == 1
+    pipeline.close_spider(MockSpider())
+
+    pipeline.open_spider(MockSpider())
+    if state_directory is None:
+        assert pipeline.process_item(firmware_item(), MockSpider()) == firmware_item()
+    else:
+        with pytest.raises(DropItem):
+            pipeline.process_item(firmware_item(), MockSpider())
+    pipeline.close_spider(MockSpider())
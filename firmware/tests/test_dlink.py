@@ -0,0 +1,81 @@
+import pytest
+from scrapy.settings import Settings
+from scrapy.spidermiddlewares.httperror import HttpError, HttpErrorMiddleware
+from twisted.protocols.ftp import CommandFailed
+from twisted.python.failure import Failure
+
+from firmware.custom_requests import FTPListRequest
+from firmware.custom_responses import FTPListResponse
+from firmware.handlers import FTPHandler
+from firmware.spiders import dlink
+
+
+def listing(url, entries):
+    files = [dict(filetype=filetype, filename=filename, size=size, date=date) for filetype, filename, size, date in entries]
+    return FTPListResponse(url=url, entries=[FTPHandler.parse_listing_entry(line) for line in files])
+
+
+ROOT = listing('ftp://ftp.dlink.de/', [('d', 'dir', 0, 'Jan 12 2019'), ('d', 'tmp', 0, 'Jan 12 2019'), ('-', 'index_info.txt', 12, 'Jan 12 2019')])
+
+CATEGORY = listing('ftp://ftp.dlink.de/dir/', [('d', 'dir-615', 0, 'Jan 12 2019'), ('d', 'dir-825', 0, 'Jan 12 2019')])
+
+DEVICE = listing('ftp://ftp.dlink.de/dir/dir-615/', [('d', 'archive', 0, 'Jan 12 2019'), ('d', 'driver_software', 0, 'Jan 12 2019')])
+
+DRIVER_SOFTWARE = listing('ftp://ftp.dlink.de/dir/dir-615/driver_software/', [
+    ('-', 'dir-615_fw_revt_2-25_eu_multi_20190517.zip', 4096, 'May 17 2019'),
+    ('-', 'dir-615_sw_revt_1-0_eu_multi.zip', 4096, 'May 17 2019'),
+    ('-', 'dir-615_fw_revt_2-25_eu_multi_20190517.pdf', 4096, 'May 17 2019'),
+])
+
+
+@pytest.fixture(scope='session', autouse=True)
+def spider_instance():
+    return dlink.DLinkSpider()
+
+
+def test_parse(spider_instance):
+    requests = list(spider_instance.parse(ROOT))
+    assert [request.url for request in requests] == ['ftp://ftp.dlink.de/dir/']
+    assert all(isinstance(request, FTPListRequest) for request in requests)
+
+
+def test_parse_category(spider_instance):
+    requests = list(spider_instance.parse_category(CATEGORY))
+    assert [(request.url, request.cb_kwargs) for request in requests] == [
+        ('ftp://ftp.dlink.de/dir/dir-615/', dict(device_name='dir-615')),
+        ('ftp://ftp.dlink.de/dir/dir-825/', dict(device_name='dir-825')),
+    ]
+
+
+def test_parse_device(spider_instance):
+    requests = list(spider_instance.parse_device(DEVICE, device_name='dir-615'))
+    assert [request.url for request in requests] == ['ftp://ftp.dlink.de/dir/dir-615/driver_software/']
+
+
+def test_parse_driver_software(spider_instance):
+    items = list(spider_instance.parse_driver_software(DRIVER_SOFTWARE, device_name='dir-615'))
+    assert items == [dict(
+        file_urls=['ftp://ftp.dlink.de/dir/dir-615/driver_software/dir-615_fw_revt_2-25_eu_multi_20190517.zip'],
+        vendor=['D-Link'],
+        device_name=['dir-615'],
+        device_class=['Router (Home)'],
+        firmware_version=['2-25'],
+        release_date=['17-05-2019'],
+        file_size=[4096],
+    )]
+
+
+def test_failed_listing_is_not_parsed(spider_instance):
+    # the ftp handler turns 550 (no such directory or permission denied) into a 404 response without entries
+    request = FTPListRequest('ftp://ftp.dlink.de/dir/dir-615/')
+    response = FTPHandler(Settings())._failed(Failure(CommandFailed(['550 /dir/dir-615: Permission denied'])), request)
+    response.request = request
+
+    assert response.status == 404
+    with pytest.raises(HttpError):
+        HttpErrorMiddleware(Settings()).process_spider_input(response, spider_instance)
+
+
+@pytest.mark.parametrize('device_name, expected', [('dir-615', 'Router (Home)'), ('dwl-2600ap', 'Access Point'), ('dwl-g520', 'other'), ('xyz-1', None)])
+def test_map_device_class(spider_instance, device_name, expected):
+    assert spider_instance.map_device_class(device_name) == expected
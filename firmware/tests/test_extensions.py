@@ -0,0 +1,59 @@
+import json
+
+from scrapy import Request, Spider
+
+from firmware.extensions import CrawlMetrics
+from firmware.metrics import CallbackMetricsMiddleware, record_timing
+from firmware.tests.mock_classes import MockResponse, MockStats
+
+
+class MockCrawler:
+    def __init__(self):
+        self.stats = MockStats()
+        self.engine = None
+
+
+def metrics(path=None):
+    extension = CrawlMetrics(MockCrawler(), interval=10, path=path, port=8000)
+    extension.spider = Spider('avm')
+    extension.last_sample = (0.0, extension.totals())
+    return extension
+
+
+def test_prometheus_histograms_are_cumulative():
+    extension = metrics()
+    for seconds in (0.05, 0.3, 0.4, 50):
+        record_timing(extension.stats, 'selenium/render_time', seconds)
+    extension.stats.inc_value('item_scraped_count', 3)
+
+    lines = extension.prometheus().splitlines()
+    assert 'firmware_item_scraped_count{spider="avm"} 3' in lines
+    assert 'firmware_selenium_render_time_bucket{spider="avm",le="0.1"} 1' in lines
+    assert 'firmware_selenium_render_time_bucket{spider="avm",le="0.5"} 3' in lines
+    assert 'firmware_selenium_render_time_bucket{spider="avm",le="+Inf"} 4' in lines
+    assert 'firmware_selenium_render_time_count{spider="avm"} 4' in lines
+    assert not any(line.startswith('firmware_selenium_render_time_le_') for line in lines)
+
+
+def test_sample_writes_rates(tmp_path):
+    extension = metrics(str(tmp_path / '%(name)s.json'))
+    extension.stats.inc_value('response_received_count', 20)
+    extension.sample()
+
+    snapshot = json.loads((tmp_path / 'avm.json').read_text())
+    assert snapshot['spider'] == 'avm'
+    assert snapshot['stats']['response_received_count'] == 20
+    assert snapshot['rates']['pages_per_second'] > 0
+
+
+def test_callback_metrics():
+    stats = MockStats()
+    middleware = CallbackMetricsMiddleware(stats)
+    response = MockResponse('https://osp.avm.de/fritzbox/', '')
+    response.request.callback = Spider('avm').parse
+    outputs = list(middleware.process_spider_output(response, [Request('https://osp.avm.de/a/'), dict(vendor='AVM')], spider=None))
+
+    assert len(outputs) == 2
+    assert stats.values['callback/parse/request_count'] == 1
+    assert stats.values['callback/parse/item_count'] == 1
+    assert stats.values['callback/parse/time/count'] == 1
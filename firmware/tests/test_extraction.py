@@ -0,0 +1,78 @@
+import pytest
+from scrapy.http import HtmlResponse
+
+from firmware.benchmarks.fixtures import apache_index
+from firmware.extraction import IndexEntry, XPathSet, parse_index, text_content
+from firmware.spiders.avm_gpl import AVMGPL
+from firmware.spiders.tplink_gpl import TPLinkGPL
+
+PAGE = '''<html><body>
+              <div data-class="wi-fi-routers">
+                  <div class="item-box"><ul><li><a class="ga-click" href="https://static.tp-link.com/gpl/Archer_C7.tar.gz"> Archer C7 </a></li></ul></div>
+                  <div class="item-box"><ul><li><a class="ga-click" href="?model=Archer%20AX20">Archer AX20</a></li></ul></div>
+                  <div class="item-box"><ul><li><a class="other" href="?model=Deco">Deco</a></li></ul></div>
+              </div>
+              <p id="note">GPL <b>code</b> center</p>
+          </body></html>'''
+
+XPATH = XPathSet({
+    'links': '//a/@href',
+    'note': '//p[@id="note"]',
+    'bold': './/b/text()',
+    'anchors': './/a/@href',
+})
+
+
+@pytest.fixture
+def response():
+    return HtmlResponse(url='https://www.tp-link.com/de/support/gpl-code/', body=PAGE.encode('utf-8'), encoding='utf-8')
+
+
+def test_xpath_set_is_a_dictionary_of_expressions():
+    assert XPATH['links'] == '//a/@href'
+    assert set(XPATH) == {'links', 'note', 'bold', 'anchors'}
+
+
+def test_xpath_set_results(response):
+    assert XPATH(response, 'links') == ['https://static.tp-link.com/gpl/Archer_C7.tar.gz', '?model=Archer%20AX20', '?model=Deco']
+    assert XPATH(response.selector, 'links') == XPATH(response, 'links')
+    assert XPATH.extract(response, 'note') == ['<p id="note">GPL <b>code</b> center</p>']
+    assert XPATH.first(response, 'bold') == 'code'
+    assert text_content(XPATH(response, 'note')[0]) == 'GPL code center'
+
+
+def test_xpath_set_relative_to_element(response):
+    note = XPATH(response, 'note')[0]
+    assert XPATH(note, 'bold') == ['code']
+    assert XPATH.first(note, 'anchors', default='-') == '-'
+
+
+def test_tplink_gpl_single_pass(response):
+    ddl_firmware, multi_firmware = TPLinkGPL.extract_firmware(response)
+    assert ddl_firmware == [('Archer C7', 'https://static.tp-link.com/gpl/Archer_C7.tar.gz')]
+    assert multi_firmware == [('Archer AX20', 'https://www.tp-link.com/phppage/gpl-res-list.html?model=Archer%20AX20&appPath=de')]
+
+
+def index_response(rows):
+    return HtmlResponse(url='https://osp.avm.de/fritzbox/', body=apache_index('/fritzbox/', rows).encode('utf-8'), encoding='utf-8')
+
+
+def test_parse_index():
+    response = index_response([('fritzbox-7590/', '01-Jan-2019', '-'), ('FRITZBox_7590-07.12.tar.gz', '12-Aug-2019', 1073741824), ('a&amp;b.txt', '13-Sep-2017', '4.2K')])
+    assert list(parse_index(response)) == [
+        IndexEntry('../', None, None, True),
+        IndexEntry('fritzbox-7590/', '01-Jan-2019', None, True),
+        IndexEntry('FRITZBox_7590-07.12.tar.gz', '12-Aug-2019', 1073741824, False),
+        IndexEntry('a&b.txt', '13-Sep-2017', None, False),
+    ]
+
+
+def test_avm_gpl_entries_stay_aligned():
+    # a row without date used to shift all following dates and sizes to the wrong links
+    body = apache_index('/fritzbox/', [('FRITZBox_7590-07.12.tar.gz', '12-Aug-2019', 1073741824)]).replace(
+        '<a href="../">../</a>', '<a href="../">../</a>\n<a href="README">README</a>')
+    response = HtmlResponse(url='https://osp.avm.de/fritzbox/', body=body.encode('utf-8'), encoding='utf-8')
+    folders, archives = AVMGPL.separate_folders_from_gpl_archives(AVMGPL.extract_entries(response))
+
+    assert folders == []
+    assert archives == [IndexEntry('https://osp.avm.de/fritzbox/FRITZBox_7590-07.12.tar.gz', '12-08-2019', 1073741824, False)]
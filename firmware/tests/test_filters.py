@@ -0,0 +1,61 @@
+import pytest
+
+from firmware.filters import AhoCorasick, DeviceFilter, read_models
+from firmware.spiders.dlink_gpl import DLinkGPL
+from firmware.spiders.netgear_gpl import NetgearGPL
+
+
+@pytest.mark.parametrize('patterns, text, expected', [
+    (['COVR-1100', 'DIR-867'], 'COVR-1100', True),
+    (['COVR-1100', 'DIR-867'], 'DIR-8', False),
+    (['he', 'she', 'his', 'hers'], 'ushers', True),
+    (['abcd', 'bc'], 'abce', True),
+    (['abcd', 'cde'], 'abcde', True),
+    (['AX20'], 'Archer AX20 V2', True),
+    ([], 'Archer AX20', False),
+])
+def test_aho_corasick(patterns, text, expected):
+    assert AhoCorasick(patterns).search(text) == expected
+    assert any(pattern in text for pattern in patterns) == expected
+
+
+@pytest.mark.parametrize('device, expected', [
+    ('Archer AX20', True),
+    ('Archer AX20 Beta', False),
+    ('Archer C7', False),
+    (['R7000', 'AX20'], True),
+])
+def test_device_filter(device, expected):
+    assert DeviceFilter(allow=['AX20'], deny=['Beta'])(device) == expected
+
+
+def test_device_filter_without_allow_list():
+    assert DeviceFilter(deny=['Beta'])('Archer C7')
+    assert not DeviceFilter(deny=['Beta'])('Archer C7 Beta')
+
+
+def test_read_models(tmp_path):
+    inventory = tmp_path / 'models.txt'
+    inventory.write_text('# asset inventory\nDIR-867\n\n  DAP-1620 \n')
+    assert read_models('COVR-1100, DIR-882', str(inventory)) == ['COVR-1100', 'DIR-882', 'DIR-867', 'DAP-1620']
+
+
+@pytest.mark.parametrize('arguments, expected', [
+    (dict(), [('COVR', '1100'), ('DIR', '867'), ('DAP', '1620')]),
+    (dict(whitelist_enabled='True'), [('COVR', '1100')]),
+    (dict(whitelist='DIR-867,DAP'), [('DIR', '867'), ('DAP', '1620')]),
+    (dict(blacklist='COVR'), [('DIR', '867'), ('DAP', '1620')]),
+    (dict(whitelist='DIR-867,DAP', blacklist='DAP-1620'), [('DIR', '867')]),
+])
+def test_spider_arguments(arguments, expected):
+    spider = DLinkGPL(**arguments)
+    devices = [('COVR', '1100'), ('DIR', '867'), ('DAP', '1620')]
+    assert list(spider.firmware_filter(devices, device=DLinkGPL.device_name)) == expected
+
+
+def test_whitelist_file_argument(tmp_path):
+    inventory = tmp_path / 'models.txt'
+    inventory.write_text('R7000\n')
+    spider = NetgearGPL(whitelist_file=str(inventory))
+    firmware = [(['AC1450'], 'V1.0', 'a.zip'), (['R7000', 'R7000P'], 'V1.1', 'b.zip')]
+    assert list(spider.firmware_filter(firmware)) == [firmware[1]]
@@ -0,0 +1,141 @@
+import sqlite3
+
+import pytest
+
+from firmware.ftp import dlink
+
+# path -> MLSD entries of the mocked ftp.dlink.de
+TREE = {
+    '/': [('dir', dict(type='dir')), ('tmp', dict(type='dir'))],
+    '/dir': [('dir-615', dict(type='dir'))],
+    '/dir/dir-615': [('driver_software', dict(type='dir')), ('manual', dict(type='dir'))],
+    '/dir/dir-615/driver_software': [
+        ('dir-615_fw_revt_2-25_eu_multi_20190517.zip', dict(type='file', size='8', modify='20190517120000')),
+        ('dir-615_sw_revt_1-00.zip', dict(type='file', size='8', modify='20190517120000')),
+    ],
+}
+
+
+class MockFTP:
+    listed = list()
+    broken = False
+
+    def __init__(self, *_, **__):
+        pass
+
+    def login(self):
+        pass
+
+    def mlsd(self, path):
+        MockFTP.listed.append(path)
+        return iter(TREE[path])
+
+    @staticmethod
+    def retrbinary(command, callback, rest=None):
+        if MockFTP.broken:
+            raise EOFError
+        callback(b'firmware')
+
+    def close(self):
+        pass
+
+
+class MockSink:
+    def __init__(self):
+        self.records = list()
+
+    def start(self, resumed):
+        pass
+
+    def write(self, record, committed=None):
+        self.records.append(record)
+        if committed is not None:
+            committed()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='function', autouse=True)
+def mocked_ftp(monkeypatch, tmp_path):
+    monkeypatch.setattr(dlink, 'FTP', MockFTP)
+    monkeypatch.chdir(tmp_path)
+    MockFTP.listed = list()
+    MockFTP.broken = False
+
+
+def mirror(queue_path):
+    sink = MockSink()
+    dlink.FTPClass('ftp.dlink.de', sink=sink, workers=1, queue_path=queue_path).main()
+    return sink.records
+
+
+def test_complete_mirror_starts_over_on_the_next_run(tmp_path):
+    queue_path = str(tmp_path / 'queue.sqlite')
+    first = mirror(queue_path)
+    assert [record['file_urls'] for record in first] == ['ftp://ftp.dlink.de/dir/dir-615/driver_software/dir-615_fw_revt_2-25_eu_multi_20190517.zip']
+    assert sorted(MockFTP.listed) == ['/', '/dir', '/dir/dir-615', '/dir/dir-615/driver_software']
+
+    MockFTP.listed = list()
+    assert mirror(queue_path) == first
+    assert sorted(MockFTP.listed) == ['/', '/dir', '/dir/dir-615', '/dir/dir-615/driver_software']
+
+
+def test_json_lines_of_a_new_mirror_replace_the_last_one(tmp_path):
+    queue_path, output = str(tmp_path / 'queue.sqlite'), tmp_path / 'dlink.jsonl'
+    for _ in range(2):
+        dlink.FTPClass('ftp.dlink.de', sink=dlink.JsonLinesSink(str(output)), workers=1, queue_path=queue_path).main()
+    assert len(output.read_text().splitlines()) == 1
+
+    # a resumed run appends to the records of the interrupted one
+    sink = dlink.JsonLinesSink(str(output))
+    sink.start(resumed=True)
+    sink.write({'file_urls': 'ftp://ftp.dlink.de/dir/dir-825/driver_software/dir-825_fw.zip'})
+    sink.close()
+    assert len(output.read_text().splitlines()) == 2
+
+
+def test_failing_task_does_not_block_the_next_mirror(tmp_path):
+    queue_path = str(tmp_path / 'queue.sqlite')
+    # the connection to the server breaks on every download until the retries are used up
+    MockFTP.broken = True
+    assert mirror(queue_path) == []
+
+    MockFTP.listed, MockFTP.broken = list(), False
+    assert len(mirror(queue_path)) == 1
+    assert sorted(MockFTP.listed) == ['/', '/dir', '/dir/dir-615', '/dir/dir-615/driver_software']
+
+
+def test_interrupted_run_resumes_pending_tasks(tmp_path):
+    queue = dlink.WorkQueue(str(tmp_path / 'queue.sqlite'))
+    assert not queue.start('/')
+    queue.add('/dir', 'list', dlink.FTPClass.CATEGORY)
+    queue.done('/')
+    assert queue.start('/')
+
+    assert [task[0] for task in queue.pending()] == ['/dir']
+    queue.close()
+
+
+def test_download_stays_pending_until_its_record_is_committed(tmp_path):
+    sink = dlink.SQLiteSink(str(tmp_path / 'firmware.sqlite'), batch_size=2)
+    ftp = dlink.FTPClass('ftp.dlink.de', sink=sink, workers=1, queue_path=str(tmp_path / 'queue.sqlite'))
+    queue = ftp.work_queue
+    details = dict(type='file', size='8', modify='20190517120000')
+    for path in ('/dir/dir-615/driver_software/dir-615_fw_a.zip', '/dir/dir-615/driver_software/dir-615_fw_b.zip'):
+        queue.add(path, 'download', dlink.FTPClass.FILES, 'dir-615', details)
+
+    ftp.process('/dir/dir-615/driver_software/dir-615_fw_a.zip', 'download', dlink.FTPClass.FILES, 'dir-615', details)
+    assert len(queue.pending()) == 2
+
+    ftp.process('/dir/dir-615/driver_software/dir-615_fw_b.zip', 'download', dlink.FTPClass.FILES, 'dir-615', details)
+    assert queue.pending() == []
+
+    # a download repeated after a crash replaces its record instead of adding a duplicate
+    sink.write({'device_name': 'dir-615', 'vendor': 'D-Link', 'firmware_version': None, 'device_class': None,
+                'release_date': None, 'file_urls': 'ftp://ftp.dlink.de/dir/dir-615/driver_software/dir-615_fw_a.zip'})
+    sink.close()
+    connection = sqlite3.connect(str(tmp_path / 'firmware.sqlite'))
+    assert connection.execute('SELECT COUNT(*) FROM firmware').fetchone()[0] == 2
+    connection.close()
+    queue.close()
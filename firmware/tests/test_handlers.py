@@ -0,0 +1,124 @@
+import hashlib
+from datetime import datetime
+
+import pytest
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from firmware.custom_responses import FTPListingEntry, FTPListResponse
+from firmware.handlers import FTPConnectionPool, FTPHandler, StreamedFile
+
+
+class MockTransport:
+    def __init__(self):
+        self.connected = True
+
+    def loseConnection(self):
+        self.connected = False
+
+
+class MockClient:
+    def __init__(self):
+        self.transport = MockTransport()
+
+    def quit(self):
+        self.transport.connected = False
+        return defer.succeed(None)
+
+
+@pytest.fixture(scope='function')
+def clock():
+    return Clock()
+
+
+@pytest.fixture(scope='function')
+def pool(clock):
+    return FTPConnectionPool(lambda: defer.succeed(MockClient()), max_connections=2, idle_timeout=30, clock=clock)
+
+
+def acquired(deferred):
+    results = list()
+
+    def collect(client):
+        results.append(client)
+        return client
+    deferred.addCallback(collect)
+    return results[0] if results else None
+
+
+def test_released_connection_is_reused(pool):
+    client = acquired(pool.acquire())
+    pool.release(client)
+    assert acquired(pool.acquire()) is client
+    assert pool.connections == 1
+
+
+def test_connections_per_host_are_bounded(pool):
+    first, second = acquired(pool.acquire()), acquired(pool.acquire())
+    waiter = pool.acquire()
+    assert not waiter.called
+    pool.release(first)
+    assert acquired(waiter) is first
+    assert pool.connections == 2 and second is not first
+
+
+def test_cancelled_waiter_does_not_take_a_connection(pool):
+    first, second = acquired(pool.acquire()), acquired(pool.acquire())
+    waiter = pool.acquire()
+    waiter.addErrback(lambda failure: failure.trap(defer.CancelledError))
+    waiter.cancel()
+
+    pool.release(first)
+    assert acquired(pool.acquire()) is first
+    assert pool.connections == 2
+    pool.release(second)
+
+
+def test_broken_connection_is_replaced(pool):
+    client = acquired(pool.acquire())
+    pool.release(client, reusable=False)
+    assert pool.connections == 0
+    assert acquired(pool.acquire()) is not client
+
+
+def test_idle_connection_is_evicted(pool, clock):
+    client = acquired(pool.acquire())
+    pool.release(client)
+    clock.advance(31)
+    assert pool.connections == 0
+    assert not client.transport.connected
+
+
+@pytest.mark.parametrize('line, expected', [
+    (dict(filetype='d', filename='dir-615', size=4096, date='Jan 12 2019'), FTPListingEntry('dir-615', 4096, 'dir', datetime(2019, 1, 12))),
+    (dict(filetype='-', filename='fw.zip', size=12, date='Feb 30 2019'), FTPListingEntry('fw.zip', 12, 'file', None)),
+])
+def test_parse_listing_entry(line, expected):
+    assert FTPHandler.parse_listing_entry(line) == expected
+
+
+def test_listing_response_keeps_entries_across_replace():
+    entries = [FTPListingEntry('dir-615', 4096, 'dir', datetime(2019, 1, 12))]
+    response = FTPListResponse(url='ftp://ftp.dlink.de/dir/', entries=entries)
+    assert response.replace(url='ftp://ftp.dlink.de/other/').entries == entries
+    assert FTPListResponse(url=response.url, body=response.body, encoding='utf-8').entries == entries
+
+
+def test_streamed_file_hashes_chunks(tmp_path):
+    streamed = StreamedFile(str(tmp_path / 'partial'))
+    for chunk in (b'fritz', b'box', b''):
+        streamed.write(chunk)
+    result = streamed.close()
+
+    assert result['size'] == 8
+    assert result['sha256'] == hashlib.sha256(b'fritzbox').hexdigest()
+    assert result['sha1'] == hashlib.sha1(b'fritzbox').hexdigest()
+    assert result['md5'] == hashlib.md5(b'fritzbox').hexdigest()
+    assert open(result['path'], 'rb').read() == b'fritzbox'
+
+
+def test_truncated_stream_is_discarded(tmp_path):
+    streamed = StreamedFile(str(tmp_path))
+    streamed.write(b'firmware')
+    streamed.truncate(0)
+    assert list(tmp_path.iterdir()) == []
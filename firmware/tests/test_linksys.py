@@ -1,5 +1,6 @@
 import pytest
 
+from firmware.dedup import SeenSet
 from firmware.spiders import linksys
 from firmware.tests.mock_classes import MockRequest, MockResponse
 
@@ -144,7 +145,8 @@ def test_parse_product(spider_instance, response, device_name, expected):
 )
 def test_parse_versions(monkeypatch, spider_instance, response, device_name, expected):
     with monkeypatch.context() as monkey:
-        monkey.setattr(linksys.LinksysSpider, 'parse_urls', lambda *_, **__: [1])
+        monkey.setattr(linksys.LinksysSpider, 'extract_meta_data', lambda *_, **__: [dict()])
+        monkey.setattr(linksys.LinksysSpider, 'parse_firmware', lambda *_, **__: [1])
         assert list(spider_instance.parse_versions(response=response, device_name=device_name)) == expected
 
 
@@ -155,14 +157,31 @@ def test_parse_urls(monkeypatch, spider_instance, device_name, version, expected
         assert list(spider_instance.parse_urls(device_name=device_name, version=version)) == expected
 
 
-@pytest.mark.parametrize('meta_data, expected', [(dict(key=2), []), (dict(key3=3), [1])])
+EMITTED_FIRMWARE = dict(vendor='Linksys', device_name='EA6300', firmware_version='1.203.23', file_urls='FW_EA6300_1.203.23.img', release_date='N/A')
+
+
+@pytest.mark.parametrize('meta_data, expected', [
+    (dict(EMITTED_FIRMWARE), []),
+    (dict(EMITTED_FIRMWARE, release_date='2019-08-23'), []),
+    (dict(EMITTED_FIRMWARE, firmware_version='2.03.21', file_urls='FW_EA6300_2.03.21.img'), [1]),
+])
 def test_parse_firmware(spider_instance, monkeypatch, meta_data, expected):
     with monkeypatch.context() as monkey:
         monkey.setattr(linksys.LinksysSpider, 'prepare_item_pipeline', lambda *_, **__: [1])
-        spider_instance.PRODUCT_DICTIONARIES = [dict(key=1), dict(key=2)]
+        monkey.setattr(spider_instance, 'seen_firmware', SeenSet())
+        assert list(spider_instance.parse_firmware(meta_data=dict(EMITTED_FIRMWARE))) == [1]
         assert list(spider_instance.parse_firmware(meta_data=meta_data)) == expected
 
 
+def test_parse_firmware_across_pages(spider_instance, monkeypatch):
+    with monkeypatch.context() as monkey:
+        monkey.setattr(linksys.LinksysSpider, 'prepare_item_pipeline', lambda *_, **__: [1])
+        monkey.setattr(spider_instance, 'seen_firmware', SeenSet())
+        version = 'Ver.1.203.23 <br> 08/23/2019 <a href="FW_EA6300_1.203.23.img">'
+        assert list(spider_instance.parse_urls(device_name='EA6300', version=version)) == [1]
+        assert list(spider_instance.parse_urls(device_name='EA6300', version=version)) == []
+
+
 @pytest.mark.parametrize('meta_data, expected', [
     (dict(
         file_urls='http://downloads.linksys.com/downloads/firmware/FW_EA6300_1.203.23.20394_prod.gpg.img',
@@ -0,0 +1,203 @@
+from datetime import date
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import HtmlResponse
+from twisted.internet import defer
+
+from firmware import middlewares
+from firmware.items import FirmwareItem
+from firmware.tests.mock_classes import MockStats
+
+
+class MockDriver:
+    def __init__(self):
+        self.current_url = None
+        self.page_source = ''
+        self.closed = False
+
+    @staticmethod
+    def execute_script(script):
+        return 1 if 'performance' in script else True
+
+    def get(self, url):
+        self.current_url = url
+        self.page_source = '<html><body>{}</body></html>'.format(url)
+
+    def quit(self):
+        self.closed = True
+
+
+class ThreadCalls:
+    # stands in for the reactor thread pool, the calls run when run_all is called
+    def __init__(self):
+        self.pending = list()
+
+    def __call__(self, function, *args):
+        deferred = defer.Deferred()
+        self.pending.append((deferred, function, args))
+        return deferred
+
+    def run_all(self):
+        while self.pending:
+            deferred, function, args = self.pending.pop(0)
+            try:
+                deferred.callback(function(*args))
+            except Exception as error:
+                deferred.errback(error)
+
+
+@pytest.fixture(scope='function')
+def thread_calls(monkeypatch):
+    calls = ThreadCalls()
+    monkeypatch.setattr(middlewares.threads, 'deferToThread', calls)
+    return calls
+
+
+@pytest.fixture(scope='function')
+def middleware(monkeypatch, thread_calls):
+    monkeypatch.setattr(middlewares, 'isfile', lambda *_: True)
+    monkeypatch.setattr(middlewares.FirmwareDownloaderMiddleware, 'create_driver', staticmethod(lambda *_: MockDriver()))
+    return middlewares.FirmwareDownloaderMiddleware(driver_executable_path='geckodriver', pool_size=3, network_idle=0.0, stats=MockStats())
+
+
+def test_drivers_start_on_first_selenium_request(middleware, thread_calls):
+    assert middleware.process_request(Request('https://example.com/'), spider=None) is None
+    assert middleware.drivers == [] and thread_calls.pending == []
+
+    responses = list()
+    middleware.process_request(Request('https://example.com/firmware', meta={'selenium': True}), spider=None).addCallback(responses.append)
+    thread_calls.run_all()
+
+    assert len(middleware.drivers) == 1
+    assert middleware.idle_drivers == middleware.drivers
+    assert isinstance(responses[0], HtmlResponse)
+    assert responses[0].url == 'https://example.com/firmware'
+    assert b'https://example.com/firmware' in responses[0].body
+
+
+def test_renders_are_limited_to_pool_size(middleware, thread_calls):
+    responses = list()
+    for index in range(5):
+        request = Request('https://example.com/{}'.format(index), meta={'selenium': True})
+        middleware.process_request(request, spider=None).addCallback(responses.append)
+    # two requests wait on the semaphore in the reactor, not in a pool thread
+    assert len(thread_calls.pending) == 3
+    assert middleware.semaphore.waiting
+
+    thread_calls.run_all()
+    assert len(responses) == 5
+    assert len(middleware.drivers) == 3
+    assert len(middleware.idle_drivers) == 3
+
+
+def test_driver_returns_to_pool_after_failed_render(middleware, thread_calls, monkeypatch):
+    failures = list()
+    monkeypatch.setattr(middleware, 'render', lambda *_: 1 / 0)
+    middleware.process_request(Request('https://example.com/', meta={'selenium': True}), spider=None).addErrback(failures.append)
+    thread_calls.run_all()
+
+    assert failures[0].check(ZeroDivisionError)
+    assert middleware.idle_drivers == middleware.drivers
+    assert middleware.semaphore.tokens == 3
+
+
+def test_missing_driver_ignores_selenium_requests(middleware, monkeypatch):
+    failures = list()
+    monkeypatch.setattr(middlewares, 'isfile', lambda *_: False)
+    middleware.process_request(Request('https://example.com/', meta={'selenium': True}), spider=None).addErrback(failures.append)
+    assert failures[0].check(IgnoreRequest)
+    assert middleware.drivers == []
+
+
+@pytest.mark.parametrize('meta, condition_type', [
+    ({'selenium_wait_css': 'a.download'}, type(middlewares.expected_conditions.presence_of_element_located(('css selector', 'a')))),
+    ({'selenium_wait_js': 'window.loaded'}, type(lambda: None)),
+    ({}, middlewares.NetworkIdle),
+])
+def test_readiness_condition(middleware, meta, condition_type):
+    assert isinstance(middleware.readiness_condition(Request('https://example.com/', meta=meta)), condition_type)
+
+
+def test_network_idle_holds_once_resources_settle():
+    condition = middlewares.NetworkIdle(quiet_period=0.0)
+    assert not condition(MockDriver())
+    assert condition(MockDriver())
+
+
+def test_record_render_timing(middleware):
+    response = middleware.render(MockDriver(), Request('https://example.com/firmware', meta={'selenium': True}))
+    middleware.record_render_timing(response, spider=None)
+    assert middleware.stats.values['selenium/render_time/count'] == 1
+    assert middleware.stats.values['selenium/wait_time/count'] == 1
+    assert sum(value for key, value in middleware.stats.values.items() if key.startswith('selenium/render_time/le_')) == 1
+
+
+def test_spider_closed_quits_all_drivers(middleware, thread_calls):
+    middleware.process_request(Request('https://example.com/', meta={'selenium': True}), spider=None)
+    thread_calls.run_all()
+    middleware.spider_closed()
+    assert middleware.drivers
+    assert all(driver.closed for driver in middleware.drivers)
+
+
+def run_incremental(state_directory, pages):
+    # pages maps the url of every crawled page to its outputs, one finished run
+    middleware = middlewares.IncrementalCrawlMiddleware(state_directory, MockStats())
+    spider = Spider(name='incremental')
+    middleware.spider_opened(spider)
+    results = dict()
+    # the meta of the requests that led to the pages, e.g. their listing dates
+    metas = {output.url: output.meta for outputs in pages.values() for output in outputs if isinstance(output, Request)}
+    for url, outputs in pages.items():
+        response = HtmlResponse(url, body=b'', request=Request(url, meta=metas.get(url)))
+        results[url] = list(middleware.process_spider_output(response, iter(outputs), spider))
+    middleware.spider_closed(spider, 'finished')
+    return results
+
+
+def firmware(version):
+    return FirmwareItem(vendor=['AVM'], device_name=['fritzbox-7590'], firmware_version=[version], file_urls=['https://example.com/fw.image'])
+
+
+def test_incremental_crawl_drops_known_items(tmp_path):
+    outputs = [Request('https://example.com/fritzbox/'), firmware('07.12')]
+    assert run_incremental(str(tmp_path), {'https://example.com/': outputs}) == {'https://example.com/': outputs}
+    assert run_incremental(str(tmp_path), {'https://example.com/': outputs}) == {'https://example.com/': outputs[:1]}
+
+    changed_outputs = outputs + [firmware('07.21')]
+    assert run_incremental(str(tmp_path), {'https://example.com/': changed_outputs}) == {'https://example.com/': [outputs[0], changed_outputs[2]]}
+
+
+def test_incremental_crawl_finds_firmware_below_unchanged_pages(tmp_path):
+    index = {'https://example.com/': [Request('https://example.com/fritzbox/')]}
+    assert run_incremental(str(tmp_path), dict(index, **{'https://example.com/fritzbox/': [firmware('07.12')]}))
+
+    results = run_incremental(str(tmp_path), dict(index, **{'https://example.com/fritzbox/': [firmware('07.12'), firmware('07.21')]}))
+    assert results == {'https://example.com/': index['https://example.com/'], 'https://example.com/fritzbox/': [firmware('07.21')]}
+
+
+def test_incremental_crawl_prunes_unchanged_file_listings(tmp_path):
+    def followed(listing_date, pages=None):
+        index = {'https://example.com/': [Request('https://example.com/fritz.os/', meta={'listing_date': listing_date})]}
+        results = run_incremental(str(tmp_path), dict(index, **(pages or {})))
+        return [request.url for request in results['https://example.com/']]
+
+    assert followed('12-08-2019', {'https://example.com/fritz.os/': [firmware('07.12')]}) == ['https://example.com/fritz.os/']
+    assert followed('12-08-2019') == []
+    assert followed('13-08-2019') == ['https://example.com/fritz.os/']
+
+
+def test_incremental_crawl_follows_listings_dated_on_the_day_of_the_last_run(tmp_path):
+    # the listing may have changed after it was fetched on the same day
+    index = {'https://example.com/': [Request('https://example.com/fritz.os/', meta={'listing_date': date.today().strftime('%d-%m-%Y')})]}
+    run_incremental(str(tmp_path), dict(index, **{'https://example.com/fritz.os/': [firmware('07.12')]}))
+    assert run_incremental(str(tmp_path), index) == index
+
+
+def test_incremental_crawl_follows_directories_with_subdirectories(tmp_path):
+    # the date of a directory does not change with the listings of its subdirectories
+    index = {'https://example.com/': [Request('https://example.com/fritzbox-7590/', meta={'listing_date': '12-08-2019'})]}
+    run_incremental(str(tmp_path), dict(index, **{'https://example.com/fritzbox-7590/': [Request('https://example.com/fritzbox-7590/fritz.os/')]}))
+    assert run_incremental(str(tmp_path), index) == index
@@ -0,0 +1,64 @@
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from firmware import offload
+from firmware.filters import DeviceFilter
+from firmware.spiders.dlink_gpl import DLinkGPL
+from firmware.spiders.netgear_gpl import NetgearGPL
+
+NETGEAR_PAGE = '''<html><body><div>
+                      <p><strong>AC1450</strong><a href="https://www.downloads.netgear.com/files/GPL/AC1450-V1.0.0.36.zip">V1.0.0.36</a></p>
+                      <p><strong>R7000</strong><a href="https://www.downloads.netgear.com/files/GPL/R7000-V1.0.9.88.zip">V1.0.9.88</a></p>
+                  </div></body></html>'''
+
+DLINK_PAGE = '''<html><body><table>
+                    <tr><td class="pord_3"><a title="COVR-1100">COVR-1100</a></td></tr>
+                    <tr><td class="pord_3"><a title="DIR-867">DIR-867</a></td></tr>
+                    <tr><td><input name="sel_PageNo" value="1"/>(1 / 3)</td></tr>
+                </table></body></html>'''
+
+
+def netgear_response():
+    return HtmlResponse(url=NetgearGPL.start_urls[0], body=NETGEAR_PAGE.encode('utf-8'), encoding='utf-8')
+
+
+def test_offload_inline():
+    response = netgear_response()
+    assert offload.offload(lambda page: (url for url in [page.url]), response) == [response.url]
+    assert offload.offload(lambda page, suffix: page.url + suffix, response, '#', then=len) == len(response.url) + 1
+
+
+def test_netgear_parse_filters_devices():
+    items = NetgearGPL(whitelist='R7000').parse(netgear_response())
+    assert [(item['device_name'], item['firmware_version']) for item in items] == [(['R7000'], ['V1.0.9.88'])]
+
+
+def test_dlink_parse_builds_requests_from_listing():
+    response = HtmlResponse(url=DLinkGPL.start_urls[0], body=DLINK_PAGE.encode('utf-8'), encoding='utf-8')
+    requests = list(DLinkGPL(blacklist='COVR').parse(response))
+
+    assert [request.cb_kwargs for request in requests[:-1]] == [dict(product='DIR', model='867')]
+    assert b'sel_PageNo=2' in requests[-1].body
+
+
+def test_run_offloaded_in_worker_process():
+    # spider functions, responses, filters and items survive the round trip to the worker
+    executor = offload.create_executor(1)
+    try:
+        future = executor.submit(offload.run_offloaded, NetgearGPL.extract_items, HtmlResponse, NetgearGPL.start_urls[0], NETGEAR_PAGE.encode('utf-8'), 'utf-8', (DeviceFilter(),))
+        assert future.result(timeout=60) == list(NetgearGPL.extract_items(netgear_response(), DeviceFilter()))
+    finally:
+        executor.shutdown(wait=True)
+
+
+def test_pool_lifecycle():
+    with pytest.raises(NotConfigured):
+        offload.OffloadPool.from_crawler(get_crawler(settings_dict={'OFFLOAD_WORKERS': 0}))
+
+    pool = offload.OffloadPool.from_crawler(get_crawler(settings_dict={'OFFLOAD_WORKERS': 1}))
+    pool.spider_opened(None)
+    assert offload.executor is not None
+    pool.spider_closed(None)
+    assert offload.executor is None
@@ -0,0 +1,147 @@
+import os
+from hashlib import sha256
+
+import pytest
+from scrapy import Request
+from scrapy.http import Response
+from scrapy.pipelines.files import FileException
+
+from firmware.handlers import StreamedFile, discard_superseded_stream
+from firmware.items import FirmwareItem
+from firmware.pipelines import FirmwarePipeline
+from firmware.tests.mock_classes import MockStats
+
+
+class MockSpider:
+    def __init__(self):
+        self.crawler = type('Crawler', (), dict(stats=MockStats()))()
+
+
+class MockInfo:
+    def __init__(self):
+        self.spider = MockSpider()
+
+
+def firmware_item(device_name, firmware_version, file_url):
+    return FirmwareItem(vendor=['AVM'], device_name=[device_name], firmware_version=[firmware_version], file_urls=[file_url])
+
+
+@pytest.fixture(scope='function')
+def pipeline(tmp_path):
+    return FirmwarePipeline(str(tmp_path))
+
+
+@pytest.mark.parametrize('item, url, expected', [
+    (firmware_item('fritzbox-7590', '07.12', 'http://a/FRITZ.Box_7590.image'), 'http://a/FRITZ.Box_7590.image', 'AVM/fritzbox-7590/07.12/FRITZ.Box_7590.image'),
+    (firmware_item('EA 6300/v2', '1.0', 'http://b/fw.img'), 'http://b/fw.img', 'AVM/EA_6300_v2/1.0/fw.img'),
+    (None, 'http://c/fw.bin', 'unknown/unknown/unknown/fw.bin'),
+])
+def test_file_path(pipeline, item, url, expected):
+    assert pipeline.file_path(Request(url), item=item) == expected
+
+
+def test_identical_files_are_stored_once(pipeline, tmp_path):
+    info = MockInfo()
+    first = firmware_item('fritzbox-7590', '07.12', 'http://mirror-a/fw.image')
+    second = firmware_item('fritzbox-7590-ax', '07.12', 'http://mirror-b/fw.image')
+    for item in (first, second):
+        request = Request(item['file_urls'][0])
+        pipeline.file_downloaded(Response(request.url, body=b'firmware'), request, info, item=item)
+
+    first_path = tmp_path / 'AVM' / 'fritzbox-7590' / '07.12' / 'fw.image'
+    second_path = tmp_path / 'AVM' / 'fritzbox-7590-ax' / '07.12' / 'fw.image'
+    assert first_path.read_bytes() == second_path.read_bytes() == b'firmware'
+    assert os.path.samefile(first_path, second_path)
+    assert info.spider.crawler.stats.values['file_status_count/deduplicated'] == 1
+    assert len((tmp_path / 'manifest.jsonl').read_text().splitlines()) == 2
+
+
+def test_unchanged_file_is_not_downloaded_again(pipeline, tmp_path):
+    info = MockInfo()
+    item = firmware_item('fritzbox-7590', '07.12', 'http://a/fw.image')
+    request = Request(item['file_urls'][0])
+    pipeline.media_downloaded(Response(request.url, body=b'firmware', headers={'ETag': '"abc"'}), request, info, item=item)
+
+    conditional_request = pipeline.get_media_requests(item, info)[0]
+    assert conditional_request.headers['If-None-Match'] == b'"abc"'
+
+    result = pipeline.media_downloaded(Response(request.url, status=304), conditional_request, info, item=item)
+    assert result['status'] == 'uptodate'
+    assert result['path'] == 'AVM/fritzbox-7590/07.12/fw.image'
+    assert info.spider.crawler.stats.values['file_status_count/unchanged'] == 1
+
+
+def test_up_to_date_file_reports_sha256(pipeline):
+    info = MockInfo()
+    item = firmware_item('fritzbox-7590', '07.12', 'http://a/fw.image')
+    request = Request(item['file_urls'][0])
+    downloaded = pipeline.media_downloaded(Response(request.url, body=b'firmware'), request, info, item=item)
+
+    results = list()
+    pipeline.media_to_download(request, info, item=item).addCallback(results.append)
+    assert results[0]['status'] == 'uptodate'
+    assert results[0]['checksum'] == downloaded['checksum'] == sha256(b'firmware').hexdigest()
+
+
+def streamed_download(pipeline, request, body):
+    streamed = StreamedFile(request.meta['download_stream'])
+    streamed.write(body)
+    request.meta['download_stream_file'] = streamed.close()
+    return request.meta['download_stream_file']['path']
+
+
+def test_streamed_file_is_moved_into_blob_store(pipeline, tmp_path):
+    info = MockInfo()
+    item = firmware_item('fritzbox-7590', '07.12', 'http://a/fw.image')
+    request = pipeline.get_media_requests(item, info)[0]
+    partial_path = streamed_download(pipeline, request, b'firmware')
+
+    result = pipeline.media_downloaded(Response(request.url, headers={'Content-Length': '8'}), request, info, item=item)
+    assert result['size'] == 8
+    assert result['checksum'] == sha256(b'firmware').hexdigest()
+    assert (tmp_path / 'AVM' / 'fritzbox-7590' / '07.12' / 'fw.image').read_bytes() == b'firmware'
+    assert not os.path.exists(partial_path)
+    assert info.spider.crawler.stats.values['file_bytes/streamed'] == 8
+
+
+def test_retried_stream_is_read_from_the_retried_request(pipeline, tmp_path):
+    info = MockInfo()
+    item = firmware_item('fritzbox-7590', '07.12', 'http://a/fw.image')
+    request = pipeline.get_media_requests(item, info)[0]
+    error_page = streamed_download(pipeline, request, b'unavailable')
+    # the retry middleware downloads a copy of the media request, the handler drops the file of the discarded response
+    retried = request.copy()
+    discard_superseded_stream(retried)
+    partial_path = streamed_download(pipeline, retried, b'firmware')
+
+    response = Response(request.url, headers={'Content-Length': '8'}, request=retried)
+    result = pipeline.media_downloaded(response, request, info, item=item)
+    assert result['checksum'] == sha256(b'firmware').hexdigest()
+    assert (tmp_path / 'AVM' / 'fritzbox-7590' / '07.12' / 'fw.image').read_bytes() == b'firmware'
+    assert not os.path.exists(error_page)
+    assert not os.path.exists(partial_path)
+    assert 'download_stream_file' not in request.meta
+
+
+@pytest.mark.parametrize('headers, flags', [
+    ({'Content-Length': '1024'}, []),
+    ({}, ['dataloss']),
+])
+def test_incomplete_stream_is_rejected(pipeline, tmp_path, headers, flags):
+    info = MockInfo()
+    item = firmware_item('fritzbox-7590', '07.12', 'http://a/fw.image')
+    request = pipeline.get_media_requests(item, info)[0]
+    partial_path = streamed_download(pipeline, request, b'firmware')
+
+    with pytest.raises(FileException):
+        pipeline.media_downloaded(Response(request.url, headers=headers, flags=flags), request, info, item=item)
+    assert not os.path.exists(partial_path)
+    assert not (tmp_path / 'AVM').exists()
+
+
+def test_media_requests_carry_expected_size(pipeline):
+    item = firmware_item('fritzbox-7590', '07.12', 'http://a/fw.image')
+    assert pipeline.get_media_requests(item, MockInfo())[0].meta['download_size'] is None
+
+    item['file_size'] = [2147483648]
+    assert pipeline.get_media_requests(item, MockInfo())[0].meta['download_size'] == 2147483648
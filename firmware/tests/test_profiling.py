@@ -0,0 +1,66 @@
+import pytest
+from scrapy import Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+
+from firmware.profiling import CProfileRecorder, ProfilingMiddleware
+from firmware.tests.mock_classes import MockResponse
+
+
+class MockPipeline:
+    @staticmethod
+    def file_path(request, response=None, info=None, *, item=None):
+        return 'AVM/fritzbox-7590/07.12/fw.image'
+
+
+class MockCrawler:
+    def __init__(self, pipeline=None, **settings):
+        self.settings = Settings(settings)
+        itemproc = type('ItemProcessor', (), dict(middlewares=[pipeline] if pipeline else []))()
+        self.engine = type('Engine', (), dict(scraper=type('Scraper', (), dict(itemproc=itemproc))()))()
+
+
+def middleware(crawler, sample_rate=1.0, callbacks=None):
+    return ProfilingMiddleware(crawler, CProfileRecorder, directory='profiles', sample_rate=sample_rate, callbacks=callbacks, pipeline_methods=['file_path'])
+
+
+def response_of(callback):
+    response = MockResponse('https://osp.avm.de/fritzbox/', '')
+    response.request.callback = callback
+    return response
+
+
+def test_disabled_by_default():
+    with pytest.raises(NotConfigured):
+        ProfilingMiddleware.from_crawler(MockCrawler())
+
+
+@pytest.mark.parametrize('sample_rate, callbacks, profiled', [
+    (1.0, None, True),
+    (0.0, None, False),
+    (1.0, ['parse_firmware'], False),
+])
+def test_callbacks_are_sampled(sample_rate, callbacks, profiled):
+    profiler = middleware(MockCrawler(), sample_rate=sample_rate, callbacks=callbacks)
+    result = [1, 2, 3]
+    output = profiler.process_spider_output(response_of(Spider('avm').parse), result, spider=None)
+    assert (output is not result) == profiled
+    assert list(output) == result
+    assert ('parse' in profiler.recorders) == profiled
+    assert profiler.active is None
+
+
+def test_profiles_are_written_per_callback_and_pipeline_method(tmp_path):
+    pipeline = MockPipeline()
+    profiler = middleware(MockCrawler(pipeline))
+    profiler.directory = str(tmp_path)
+    spider = Spider('avm')
+    profiler.spider_opened(spider)
+
+    assert pipeline.file_path(None) == 'AVM/fritzbox-7590/07.12/fw.image'
+    list(profiler.process_spider_output(response_of(spider.parse), [1], spider=spider))
+    profiler.spider_closed(spider)
+
+    assert sorted(path.name for path in (tmp_path / 'avm').iterdir()) == [
+        'MockPipeline.file_path.prof', 'MockPipeline.file_path.txt', 'parse.prof', 'parse.txt'
+    ]
@@ -0,0 +1,95 @@
+import pytest
+from scrapy import Request
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Response
+from twisted.internet.task import Clock
+
+from firmware.tests.mock_classes import MockStats
+from firmware.throttle import AdaptiveThrottleMiddleware
+
+PROFILES = {
+    'default': {'start_concurrency': 2, 'min_concurrency': 1, 'max_concurrency': 4, 'delay': 0.0, 'max_delay': 10.0},
+    'asus.com': {'start_concurrency': 1, 'max_concurrency': 2, 'delay': 1.0},
+}
+
+
+class MockDownloader:
+    def __init__(self):
+        self.slots = dict()
+
+    def _get_slot(self, request, spider):
+        key = request.meta.get('download_slot', request.url.split('/')[2])
+        return key, self.slots.setdefault(key, Slot(8, 0.0, False))
+
+
+class MockCrawler:
+    def __init__(self):
+        self.stats = MockStats()
+        self.engine = type('Engine', (), dict(downloader=MockDownloader()))()
+
+
+@pytest.fixture(scope='function')
+def clock():
+    return Clock()
+
+
+@pytest.fixture(scope='function')
+def middleware(clock):
+    return AdaptiveThrottleMiddleware(MockCrawler(), PROFILES, target_latency=1.0, backoff_codes={429, 503}, clock=clock)
+
+
+def respond(middleware, url, status=200, latency=0.1, headers=None):
+    request = Request(url, meta={'download_latency': latency})
+    middleware.process_request(request, spider=None)
+    middleware.process_response(request, Response(url, status=status, headers=headers), spider=None)
+    return middleware.crawler.engine.downloader.slots[url.split('/')[2]]
+
+
+@pytest.mark.parametrize('host, concurrency, delay', [
+    ('www.asus.com', 1, 1.0),
+    ('osp.avm.de', 2, 0.0),
+])
+def test_slot_starts_with_profile(middleware, host, concurrency, delay):
+    middleware.process_request(Request('https://{}/'.format(host)), spider=None)
+    slot = middleware.crawler.engine.downloader.slots[host]
+    assert (slot.concurrency, slot.delay) == (concurrency, delay)
+
+
+def test_concurrency_grows_up_to_profile_limit(middleware):
+    for _ in range(20):
+        slot = respond(middleware, 'https://osp.avm.de/fritzbox/')
+    assert slot.concurrency == 4
+
+
+def test_slow_responses_do_not_grow_concurrency(middleware):
+    for _ in range(20):
+        slot = respond(middleware, 'https://osp.avm.de/fritzbox/', latency=5.0)
+    assert slot.concurrency == 2
+
+
+def test_back_off_on_too_many_requests(middleware):
+    for _ in range(20):
+        respond(middleware, 'https://osp.avm.de/fritzbox/')
+    slot = respond(middleware, 'https://osp.avm.de/fritzbox/', status=429, headers={'Retry-After': '7'})
+    assert (slot.concurrency, slot.delay) == (2, 7.0)
+    assert middleware.stats.values['throttle/backoff_count'] == 1
+
+
+def test_ignored_requests_do_not_back_off(middleware):
+    request = Request('https://osp.avm.de/robots.txt')
+    middleware.process_request(request, spider=None)
+    middleware.process_exception(request, IgnoreRequest(), spider=None)
+    assert 'throttle/backoff_count' not in middleware.stats.values
+
+
+def test_selenium_renders_keep_slot_delay(middleware, clock):
+    first = Request('https://www.asus.com/de/RT-AX88U/HelpDesk_BIOS/', meta={'selenium': True})
+    second = Request('https://www.asus.com/de/RT-AX58U/HelpDesk_BIOS/', meta={'selenium': True})
+    assert middleware.process_request(first, spider=None).called
+    waiting = middleware.process_request(second, spider=None)
+
+    middleware.process_response(first, Response(first.url), spider=None)
+    assert not waiting.called
+    clock.advance(1.0)
+    assert waiting.called
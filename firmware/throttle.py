@@ -0,0 +1,137 @@
+from collections import deque
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.defer import Deferred
+
+DEFAULT_PROFILE = dict(start_concurrency=2, min_concurrency=1, max_concurrency=8, delay=0.0, max_delay=60.0)
+
+
+class DomainThrottle(object):
+    # additive increase while responses are fast and healthy, multiplicative decrease on throttling responses and errors
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.concurrency = float(profile['start_concurrency'])
+        self.delay = float(profile['delay'])
+        self.rendering = set()
+        self.waiting = deque()
+        self.last_render = None
+        self.wakeup = None
+
+    @property
+    def limit(self):
+        return int(self.concurrency)
+
+    def grow(self):
+        # one more parallel request for every window of `limit` healthy responses
+        self.concurrency = min(self.concurrency + 1.0 / self.limit, self.profile['max_concurrency'])
+        self.delay = max(self.delay * 0.9, self.profile['delay'])
+
+    def back_off(self, retry_after=None):
+        self.concurrency = max(self.concurrency / 2, self.profile['min_concurrency'])
+        self.delay = min(max(self.delay * 2, retry_after or 0.0, 0.5), self.profile['max_delay'])
+
+
+class AdaptiveThrottleMiddleware(object):
+    # tunes concurrency and delay of the downloader slot of every domain within the limits of the domain's profile in
+    # THROTTLE_PROFILES. Selenium renders never reach the downloader slots, they are held back here by the same limits
+
+    def __init__(self, crawler, profiles, target_latency, backoff_codes, clock=None):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.profiles = profiles
+        self.target_latency = target_latency
+        self.backoff_codes = backoff_codes
+        self.clock = clock
+        self.domains = dict()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('THROTTLE_ENABLED'):
+            raise NotConfigured
+        return cls(
+            crawler,
+            profiles=crawler.settings.getdict('THROTTLE_PROFILES'),
+            target_latency=crawler.settings.getfloat('THROTTLE_TARGET_LATENCY', 2.0),
+            backoff_codes=set(crawler.settings.getlist('THROTTLE_BACKOFF_HTTP_CODES', [429, 503]))
+        )
+
+    def profile(self, hostname):
+        # the longest domain suffix of the host name with a profile, e.g. asus.com for www.asus.com
+        profile = dict(DEFAULT_PROFILE, **self.profiles.get('default', {}))
+        labels = hostname.split('.')
+        for index in range(len(labels)):
+            if '.'.join(labels[index:]) in self.profiles:
+                return dict(profile, **self.profiles['.'.join(labels[index:])])
+        return profile
+
+    def slot(self, request, spider):
+        key, slot = self.crawler.engine.downloader._get_slot(request, spider)
+        if key not in self.domains:
+            self.domains[key] = DomainThrottle(self.profile(urlparse_cached(request).hostname or ''))
+        return self.domains[key], slot
+
+    def apply(self, throttle, slot):
+        slot.concurrency = throttle.limit
+        slot.delay = throttle.delay
+
+    def process_request(self, request, spider):
+        throttle, slot = self.slot(request, spider)
+        self.apply(throttle, slot)
+        if 'selenium' not in request.meta:
+            return None
+        waiting = Deferred()
+        throttle.waiting.append((request, waiting))
+        self.start_renders(throttle)
+        return waiting
+
+    def start_renders(self, throttle):
+        throttle.wakeup = None
+        while throttle.waiting and len(throttle.rendering) < throttle.limit:
+            now = self.clock.seconds()
+            if throttle.last_render is not None and now < throttle.last_render + throttle.delay:
+                if throttle.wakeup is None:
+                    throttle.wakeup = self.clock.callLater(throttle.last_render + throttle.delay - now, self.start_renders, throttle)
+                return
+            request, waiting = throttle.waiting.popleft()
+            throttle.rendering.add(request)
+            throttle.last_render = now
+            waiting.callback(None)
+
+    def finish_render(self, request, throttle):
+        if request in throttle.rendering:
+            throttle.rendering.discard(request)
+            self.start_renders(throttle)
+
+    def process_response(self, request, response, spider):
+        throttle, slot = self.slot(request, spider)
+        self.finish_render(request, throttle)
+        if response.status in self.backoff_codes:
+            throttle.back_off(self.retry_after(response))
+            self.stats.inc_value('throttle/backoff_count', spider=spider)
+        elif response.status < 500 and self.latency(request) <= self.target_latency:
+            throttle.grow()
+        self.apply(throttle, slot)
+        self.stats.max_value('throttle/max_concurrency', throttle.limit, spider=spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        throttle, slot = self.slot(request, spider)
+        self.finish_render(request, throttle)
+        if isinstance(exception, IgnoreRequest):
+            return None
+        throttle.back_off()
+        self.apply(throttle, slot)
+        self.stats.inc_value('throttle/backoff_count', spider=spider)
+
+    @staticmethod
+    def latency(request):
+        return request.meta.get('download_latency', request.meta.get('selenium_render_time', 0.0))
+
+    @staticmethod
+    def retry_after(response):
+        value = response.headers.get('Retry-After')
+        return float(value) if value is not None and value.isdigit() else None